@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Transcoding benchmark for Gemini video pipe counting
+Runs one model over the fragments raw and with each transcoding setting (video/transcode.py), and
+compares the counts against the DIP counts in output_2.json alongside upload bytes, transcode and
+upload time, input tokens and request latency, to pick TRANSCODE in gemini.py
+"""
+
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import Request, run_requests, upload_videos
+from external.latency import percentile
+from gemini import FOLDER_PATH, SYSTEM_INSTRUCTION, TEST_PROMPT, clean_count_response, get_video_files
+from video.transcode import TranscodeParams, camera_cropping, probe_duration, transcode_all
+
+def load_ground_truth(path):
+    """Map fragment file name -> DIP pipe count"""
+    with open(path, 'r') as f:
+        return {entry["video"]: entry["total_pipes"] for entry in json.load(f)}
+
+def run_setting(model_id, params, video_files, ground_truth, use_cache=False):
+    """
+    Transcode, upload and count one setting (params None = raw fragments) and summarize it.
+    The response cache is bypassed unless use_cache; cached responses are counted and left out
+    of the latencies, since their timings are those of the run that cached them
+    """
+    name = params.name() if params else "raw"
+
+    start = time.perf_counter()
+    upload_paths = transcode_all(video_files, params)
+    transcode_time = time.perf_counter() - start
+
+    upload_bytes = sum(os.path.getsize(path) for path in upload_paths.values())
+
+    start = time.perf_counter()
+    upload_videos(list(upload_paths.values()))
+    upload_time = time.perf_counter() - start
+
+    responses = run_requests(
+        [Request(model_id, SYSTEM_INSTRUCTION, TEST_PROMPT, video_path=upload_paths[video_path], use_cache=use_cache) for video_path in video_files],
+        desc=name
+    )
+
+    errors, cached, input_tokens, latencies, predictions = 0, 0, [], [], []
+    for video_path in video_files:
+        filename = os.path.basename(video_path)
+        try:
+            response = responses.result(model_id, upload_paths[video_path])
+        except Exception as e:
+            print(f"ERROR with {name} on {filename}: {e}")
+            errors += 1
+            continue
+
+        if response.cached:
+            cached += 1
+        else:
+            latencies.append(response.timings["total"])
+        if response.input_tokens is not None:
+            input_tokens.append(response.input_tokens)
+        predictions.append({"video": filename, "count": clean_count_response(response.text), "expected": ground_truth[filename]})
+
+    abs_errors = [abs(p["count"] - p["expected"]) for p in predictions]
+    evaluated = len(predictions)
+    return {
+        "setting": name,
+        "params": params.key() if params else None,
+        "evaluated": evaluated,
+        "errors": errors,
+        "cached": cached,
+        "exact": sum(e == 0 for e in abs_errors) / evaluated if evaluated else 0.0,
+        "mae": statistics.mean(abs_errors) if abs_errors else None,
+        "upload_mb": upload_bytes / 1e6,
+        "transcode_time": transcode_time,
+        "upload_time": upload_time,
+        "average_input_tokens": statistics.mean(input_tokens) if input_tokens else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "predictions": predictions,
+    }
+
+def print_report(results):
+    print("=" * 118)
+    print(f"{'SETTING':<32}{'EXACT':>8}{'MAE':>8}{'UPLOAD MB':>11}{'TRANSCODE':>11}{'UPLOAD (s)':>12}{'IN TOKENS':>11}{'P50 (s)':>10}{'P95 (s)':>10}")
+    print("-" * 118)
+    for r in results:
+        mae = f"{r['mae']:.2f}" if r["mae"] is not None else "-"
+        tokens = f"{r['average_input_tokens']:.0f}" if r["average_input_tokens"] is not None else "-"
+        marker = " *" if r["cached"] else ""
+        print(f"{r['setting']:<32}{r['exact']:>8.2%}{mae:>8}{r['upload_mb']:>11.1f}{r['transcode_time']:>11.1f}{r['upload_time']:>12.1f}{tokens:>11}{r['latency_p50']:>10.2f}{r['latency_p95']:>10.2f}{marker}")
+    print("=" * 118)
+    if any(r["cached"] for r in results):
+        print("* some responses came from the response cache: latencies cover the others only")
+
+def parse_optional_number(cast):
+    return lambda value: None if value.lower() in ("none", "src", "0") else cast(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video transcoding before Gemini upload for pipe counting.")
+    parser.add_argument("--model", type=str, default="gemini_2_0_flash", help="model ID (see external/client.py MODELS)")
+    parser.add_argument("--folder", type=str, default=FOLDER_PATH)
+    parser.add_argument("--ground-truth", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "output_2.json"))
+    parser.add_argument("--camera", type=str, default="ccm1", help="camera config for the crop region")
+    parser.add_argument("--fps", type=parse_optional_number(float), nargs="+", default=[2.0, 1.0], help="frame rates to try ('src' = source rate)")
+    parser.add_argument("--max-height", type=parse_optional_number(int), nargs="+", default=[480, 360], help="heights to try ('src' = source size)")
+    parser.add_argument("--crop", type=str, choices=["off", "on", "both"], default="both")
+    parser.add_argument("--motion", type=str, choices=["off", "on", "both"], default="off")
+    parser.add_argument("--crf", type=int, default=28)
+    parser.add_argument("--cache", action="store_true", help="reuse cached responses (counts only; cached requests aren't timed)")
+    parser.add_argument("--no-raw", action="store_true", help="skip the raw-fragment baseline")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N fragments with a DIP count")
+    parser.add_argument("--output", type=str, default=None, help="report path (default: transcode_benchmark_<model>.json)")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(args.ground_truth)
+    video_files = [v for v in get_video_files(args.folder) if os.path.basename(v) in ground_truth][:args.limit]
+    if not video_files:
+        print(f"No fragments in {args.folder} have a count in {args.ground_truth}")
+        return
+
+    options = {"off": [False], "on": [True], "both": [False, True]}
+    cropping = camera_cropping(args.camera)
+    settings = [] if args.no_raw else [None]
+    settings += [
+        TranscodeParams(fps=fps, max_height=max_height, cropping=cropping if crop else None, motion_only=motion, crf=args.crf)
+        for crop, motion, fps, max_height in itertools.product(options[args.crop], options[args.motion], args.fps, args.max_height)
+    ]
+
+    durations = [d for d in (probe_duration(v) for v in video_files) if d]
+    print(f"Benchmarking {len(settings)} settings over {len(video_files)} fragments ({sum(durations) / 60:.1f} min of video) with {args.model}")
+    results = [run_setting(args.model, params, video_files, ground_truth, use_cache=args.cache) for params in settings]
+
+    print_report(results)
+
+    output_path = args.output or f"transcode_benchmark_{args.model}.json"
+    with open(output_path, 'w') as f:
+        json.dump({"model": args.model, "fragments": len(video_files), "results": results}, f, indent=2)
+    print(f"Saved benchmark report to {output_path}")
+
+if __name__ == "__main__":
+    main()
+
+# cd counting/inference/pipe && python benchmark_transcode.py --model gemini_2_0_flash --fps 2 1 --max-height 480 360 --crop both --limit 20
@@ -8,22 +8,24 @@ import os
 import glob
 import json
 import sys
-import time
 import re
 from pathlib import Path
 from tqdm import tqdm
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/gemini"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gemini_1_5_flash, gemini_1_5_pro, gemini_2_0_flash, gemini_2_5_pro_preview
+from external import Request, generate, run_requests, upload_videos
+from video.transcode import transcode_all
 
 # Configuration
-MODEL_TO_USE = gemini_2_0_flash  # Using a model that supports video well
+MODEL_TO_USE = "gemini_2_0_flash"  # Using a model that supports video well
 FOLDER_PATH = "/Users/hanoon/Documents/eval/misc/fragments/00000000017000000"  # Video folder path
 SUPPORTED_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+CAMERA_CONFIG = "ccm1"  # camera the fragments come from, for its ds-info.cropping region
+TRANSCODE = None  # e.g. video.transcode.TranscodeParams(fps=2, max_height=480, cropping=video.transcode.camera_cropping(CAMERA_CONFIG)), see benchmark_transcode.py
 
 # System instruction for pipe counting
 SYSTEM_INSTRUCTION = """You are a pipe counting assistant. Your ONLY task is to count the number of pipes visible in video content. You must ONLY return the count as a plain integer number and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Count all visible pipes in the video, including partial pipes that are clearly identifiable as pipes."""
@@ -60,23 +62,21 @@ def clean_count_response(response):
     except (ValueError, IndexError):
         return 0  # Return 0 if conversion fails
 
-def test_single_video(video_path, model_func=None):
+def test_single_video(video_path, model_name=None):
     """Test pipe counting on a single video"""
-    if model_func is None:
-        model_func = MODEL_TO_USE
+    if model_name is None:
+        model_name = MODEL_TO_USE
         
     try:
-        # Add delay to avoid rate limiting
-        time.sleep(2)
-        
-        response = model_func(
+        response = generate(
+            model_name,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            video_path=video_path
+            video_path=transcode_all([video_path], TRANSCODE)[video_path]
         )
         
         # Clean the response and extract count value
-        pipe_count = clean_count_response(response)
+        pipe_count = clean_count_response(response.text)
         
         # Create result
         filename = os.path.basename(video_path)
@@ -104,6 +104,9 @@ def test_folder_pipe_counting():
     if not video_files:
         return
     
+    # Transcode and upload every video up front, concurrently (reused on later runs until it expires)
+    upload_videos(list(transcode_all(video_files, TRANSCODE).values()))
+    
     # Initialize empty JSON array
     all_results = []
     
@@ -120,10 +123,10 @@ def test_folder_pipe_counting():
 def test_all_models_on_folder():
     """Test all available models with pipe counting on the folder"""
     models = [
-        ("gemini_2_0_flash", gemini_2_0_flash),
-        ("gemini_1_5_flash", gemini_1_5_flash),
-        ("gemini_1_5_pro", gemini_1_5_pro),
-        ("gemini_2_5_pro_preview", gemini_2_5_pro_preview),
+        "gemini_2_0_flash",
+        "gemini_1_5_flash",
+        "gemini_1_5_pro",
+        "gemini_2_5_pro_preview",
     ]
     
     video_files = get_video_files(FOLDER_PATH)
@@ -131,23 +134,26 @@ def test_all_models_on_folder():
     if not video_files:
         return
     
-    for model_name, model_func in models:
+    # Transcode and upload each video once, concurrently, and share the uploaded file across all models
+    upload_paths = transcode_all(video_files, TRANSCODE)
+    upload_videos(list(upload_paths.values()))
+    
+    # Run every (model, video) request concurrently within the provider rate limits
+    responses = run_requests([
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, video_path=upload_paths[video_path])
+        for model_name in models for video_path in video_files
+    ])
+    
+    for model_name in models:
         # Initialize empty JSON array for each model
         model_results = []
         
-        for video_path in tqdm(video_files, desc=f"Pipe counting with {model_name}"):
+        for video_path in video_files:
             try:
-                # Add delay to avoid rate limiting
-                time.sleep(2)
-                
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    video_path=video_path
-                )
+                response = responses.result(model_name, upload_paths[video_path])
                 
                 # Clean the response and extract count value
-                pipe_count = clean_count_response(response)
+                pipe_count = clean_count_response(response.text)
                 
                 # Create result
                 filename = os.path.basename(video_path)
@@ -182,6 +188,8 @@ def test_sample_videos():
     # Take only first 5 videos for quick testing
     sample_videos = video_files[:5]
     
+    upload_videos(list(transcode_all(sample_videos, TRANSCODE).values()))
+    
     # Initialize empty JSON array
     sample_results = []
     
@@ -190,9 +198,6 @@ def test_sample_videos():
         result = test_single_video(video_path)
         if result:
             sample_results.append(result)
-        
-        # Add delay between videos
-        time.sleep(1)
     
     # Save sample results
     with open('sample_pipe_counts.json', 'w') as f:
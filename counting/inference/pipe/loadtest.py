@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Camera farm load test for DIP
+Serves a recorded fragment as N simulated cameras (rtsp/simulator.py) and runs one DIP process
+per camera through RTSPReader, for increasing N, to find how many cameras this box sustains in real time
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from data.config import read_cam_config
+from rtsp.simulator import CameraFarm, load_frames, start_mjpeg_farm, stream_urls
+from utils.model_loader import build_model_cache, cached_artifact_path, config_imgsz
+
+RESULT_MARGIN = 300  # seconds allowed on top of --duration for a camera's startup (model load, warmup, capture) and report
+
+def run_camera(config_path, url, index, duration, workdir, threads, results):
+    """Run one DIP instance against a simulated stream and report its throughput"""
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    # DIP prints a block per detection, keep the report readable
+    sys.stdout = open(os.devnull, 'w')
+
+    # Every failure, startup included, has to reach results or run_round waits for it until the deadline
+    timer = None
+    try:
+        from main import DIP
+
+        config = read_cam_config(config_path)
+        dip = DIP(config, 'loadtest', 'debug', url, checkpoint_dir=os.path.join(workdir, str(index)), resume=False)
+        dip.output_json_path = os.path.join(workdir, f'output_{index}.json')
+
+        frames_read_start = dip.cap.frames_read
+        timer = threading.Timer(duration, dip.stop)
+        start_time = time.time()
+        timer.start()
+
+        dip.process()
+    except Exception as e:
+        results.put({'camera': index, 'error': str(e)})
+        return
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    elapsed = time.time() - start_time
+    frames_read = dip.cap.frames_read - frames_read_start
+
+    results.put({
+        'camera': index,
+        'fps': dip.frames_processed / elapsed,
+        'frames_processed': dip.frames_processed,
+        'frames_read': frames_read,
+        'frames_skipped': max(0, frames_read - dip.frames_processed)
+    })
+
+def run_round(n, urls, args, workdir):
+    """Run n cameras at once, returns one result dict per camera"""
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+
+    workers = [
+        ctx.Process(target=run_camera, args=(args.config, urls[i], i, args.duration, workdir, args.threads_per_camera, results))
+        for i in range(n)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # A worker that dies without reporting (killed, crashed interpreter) or hangs must not block the round
+    deadline = time.time() + args.duration + RESULT_MARGIN
+    camera_results = {}
+    while len(camera_results) < n and time.time() < deadline:
+        try:
+            r = results.get(timeout=min(1.0, max(deadline - time.time(), 0.01)))
+            camera_results[r['camera']] = r
+            continue
+        except queue.Empty:
+            pass
+
+        exited = [i for i, worker in enumerate(workers) if worker.exitcode is not None]
+        while True:  # results put just before exiting
+            try:
+                r = results.get_nowait()
+            except queue.Empty:
+                break
+            camera_results[r['camera']] = r
+        for i in exited:
+            camera_results.setdefault(i, {'camera': i, 'error': f'worker exited with code {workers[i].exitcode} without a result'})
+
+    for i, worker in enumerate(workers):
+        if i not in camera_results:
+            camera_results[i] = {'camera': i, 'error': f'no result within {args.duration + RESULT_MARGIN:.0f} s'}
+            worker.terminate()
+        worker.join()
+
+    return sorted(camera_results.values(), key=lambda r: r['camera'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Find how many cameras this box can run DIP on in real time.')
+    parser.add_argument('-c', '--config', type=str, default='ccm1', help='camera config used for every simulated camera')
+    parser.add_argument('--video', type=str, nargs='+', required=True, help='recorded fragment(s) to serve')
+    parser.add_argument('--cameras', type=int, nargs='+', default=[1, 2, 4, 8], help='camera counts to try')
+    parser.add_argument('--fps', type=float, default=25, help='source stream fps')
+    parser.add_argument('--jitter', type=float, default=0.1, help='frame interval jitter as a fraction of 1/fps')
+    parser.add_argument('--dropout-rate', type=float, default=0, help='chance per second that a feed drops')
+    parser.add_argument('--target-fps', type=float, default=None, help="analysis fps a camera needs to count as real time (default: 1 / the config's analysis-time-delta)")
+    parser.add_argument('--duration', type=float, default=60, help='seconds each round runs after startup')
+    parser.add_argument('--threads-per-camera', type=int, default=0, help='torch threads per camera process (0 = torch default)')
+    parser.add_argument('--port', type=int, default=8554)
+    parser.add_argument('--max-frames', type=int, default=1500, help='frames preloaded by the simulator')
+    args = parser.parse_args()
+
+    config = read_cam_config(args.config)
+    target_fps = args.target_fps or 1 / config['analysis-time-delta']
+
+    # build the cached model once here, camera processes would race on the export otherwise
+    weights_path, imgsz = config['ds-info']['pipe-model'], config_imgsz(config)
+    if not os.path.exists(cached_artifact_path(weights_path, imgsz)):
+        build_model_cache(weights_path, imgsz)
+
+    frames = load_frames(args.video, args.max_frames)
+    farm = CameraFarm(frames, max(args.cameras), args.fps, args.jitter, args.dropout_rate)
+    server = start_mjpeg_farm(farm, port=args.port)
+    urls = stream_urls(max(args.cameras), port=args.port)
+
+    print(f"🚀 Load test: {args.cameras} camera(s), source {args.fps} fps, target {target_fps:.2f} fps per camera")
+
+    best = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sorted(args.cameras):
+            results = run_round(n, urls, args, workdir)
+
+            errors = [r for r in results if 'error' in r]
+            fps = [r['fps'] for r in results if 'error' not in r]
+            sustained = not errors and min(fps) >= target_fps
+
+            print(f"\n{'='*60}")
+            print(f"📹 {n} camera(s): {'✅ real time' if sustained else '❌ falling behind'}")
+            for r in results:
+                if 'error' in r:
+                    print(f"   cam {r['camera']}: error {r['error']}")
+                else:
+                    print(f"   cam {r['camera']}: {r['fps']:.2f} fps, {r['frames_processed']} processed, {r['frames_skipped']} skipped of {r['frames_read']} read")
+            print(f"   dropouts so far: {sum(farm.dropouts)}")
+
+            if not sustained:
+                break
+            best = n
+
+    server.shutdown()
+
+    print(f"\n{'='*60}")
+    print(f"📊 Max cameras sustained in real time: {best}")
+
+if __name__ == '__main__':
+    main()
+
+# python loadtest.py -c ccm1 --video /Users/hanoon/Documents/eval/misc/fragments/00000000017000000/0.mp4 --cameras 1 2 4 8
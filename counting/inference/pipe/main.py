@@ -1,40 +1,71 @@
-import torch
-from typing import List, Tuple, Dict
+import time
+
+STARTUP_T0 = time.perf_counter()
+
+from typing import List, Tuple, Dict, Optional
 import argparse
-from ultralytics import YOLO
-import supervision as sv
-import utils.supervision_mods as svm
 import sys
-import time
+import threading
 from datetime import datetime
-import cv2
 import json
 import os
+import gc
+from collections import deque
 import numpy as np
 
-import cv2
-
 from utils.logging import logger
 from utils.dip_utils import cam_to_ccm_mapping, get_ist_timestamp, get_shift, log_camera_down, log_camera_reconnected
 from utils.scenarios import PipeCounter
 from utils.diameter_handler import DiameterHandler
+from utils.model_loader import load_model, config_imgsz, warmup, format_startup_report
+from utils.tracker_state import BoundedIdSet, alive_track_ids, format_memory_report
+from utils.checkpoint import CheckpointWriter, load_checkpoint
+from utils.frame_buffers import FrameBufferPool
 from data.config import read_cam_config
 
+# torch, ultralytics, supervision and cv2 are imported lazily inside DIP so that
+# argument parsing and config errors don't pay for them, and the capture can be
+# opened while the model is loading.
+
 class DIP:
 
-    def __init__(self, config: Dict, clientId: str, produce: str, video_path: str) -> None:
-        
-        # Temporarily patch torch.load to use weights_only=False for YOLO model loading
-        import torch
-        original_load = torch.load
-        torch.load = lambda *args, **kwargs: original_load(*args, **kwargs, weights_only=False)
-        
-        try:
-            self.model : YOLO = YOLO(config['ds-info']['pipe-model'])
-        finally:
-            # Restore original torch.load
-            torch.load = original_load
-        
+    def __init__(self, config: Dict, clientId: str, produce: str, video_path: str, use_model_cache: bool = True, warmup_runs: int = 2,
+                 checkpoint_dir: str = 'checkpoints', resume: bool = True, checkpoint_interval: float = 5, checkpoint_max_age: float = 8 * 3600,
+                 hot_loop: bool = False) -> None:
+
+        import supervision as sv
+
+        timings : Dict[str, float] = {'imports': time.perf_counter() - STARTUP_T0}
+
+        self.cropping = config['ds-info']['cropping']
+        crop_w = self.cropping['x'][1] - self.cropping['x'][0]
+        crop_h = self.cropping['y'][1] - self.cropping['y'][0]
+        self.imgsz : Tuple[int, int] = config_imgsz(config)
+
+        self.video_path : str = video_path
+
+        # Opening an RTSP/file capture is slow, overlap it with model loading
+        capture_start = time.perf_counter()
+        self.capture_open_time : Optional[float] = None
+        self.capture_error : Optional[BaseException] = None
+        capture_thread = threading.Thread(target=self.open_capture, daemon=True)
+        capture_thread.start()
+
+        t = time.perf_counter()
+        self.model = load_model(config['ds-info']['pipe-model'], self.imgsz, use_model_cache)
+        timings['model'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        warmup(self.model, (crop_h, crop_w, 3), self.imgsz, warmup_runs)
+        timings['warmup'] = time.perf_counter() - t
+
+        capture_thread.join()
+        if self.capture_error is not None:
+            # Raised here, not in the thread, so it isn't hidden behind a missing capture_open_time
+            raise self.capture_error
+        timings['capture'] = self.capture_open_time - capture_start
+        timings['total'] = time.perf_counter() - STARTUP_T0
+
         self.LINE_START : sv.Point = sv.Point(
             config['ds-info']['line-start'][0],
             config['ds-info']['line-start'][1]
@@ -46,9 +77,7 @@ class DIP:
 
         self.cross_point : int = config['ds-info']['line-start'][0]
 
-        self.cap : cv2.VideoCapture = cv2.VideoCapture(video_path)
         self.camera_id : str = config['cam-id']
-        self.video_path : str = video_path
 
         self.clientId : str = clientId
         self.produce : str = produce
@@ -61,15 +90,104 @@ class DIP:
         self.pipe_counter = PipeCounter(self.cross_point, self.camera_id)
 
         self.dia_handler : DiameterHandler = DiameterHandler(config['ds-info']['dia-handler'], config['ds-info']['ratios'], config['ds-info']['possible_dias'])
-        self.this_shift_ids = set()
+        self.this_shift_ids : BoundedIdSet = BoundedIdSet()
 
         # Initialize JSON tracking for unique YOLO IDs
         self.output_json_path = "output_2.json"
-        self.saved_yolo_ids = set()
-        self.pipe_detections = []  # Store pipe info for final JSON
+        self.saved_yolo_ids : BoundedIdSet = BoundedIdSet()
+        self.max_pipe_detections : int = 10000
+        self.pipe_detections : deque = deque(maxlen=self.max_pipe_detections)  # Store latest pipe info for final JSON
+        self.total_pipes : int = 0
         self.load_existing_json()
 
-        self.cropping = config['ds-info']['cropping']
+        self.last_memory_report_timestamp : float = time.time()
+        self.memory_report_delta : float = 600
+
+        # Tracker ids restart from 1 in every process, offset them past the ids of a restored
+        # checkpoint so they never collide with restored bookkeeping.
+        self.id_offset : int = 0
+        self.max_track_id : int = -1
+
+        self.checkpoint_path : str = os.path.join(checkpoint_dir, f'{self.camera_id}.json')
+        self.restored_state : Optional[Dict] = load_checkpoint(self.checkpoint_path, checkpoint_max_age) if resume else None
+        if self.restored_state is not None and self.restored_state['source'] != self.video_path:
+            logger.info(f"Checkpoint {self.checkpoint_path} is for {self.restored_state['source']}, not restoring.")
+            self.restored_state = None
+        if self.restored_state is not None:
+            self.restore_state(self.restored_state)
+
+        self.checkpoint_writer : CheckpointWriter = CheckpointWriter(self.checkpoint_path, checkpoint_interval)
+
+        self.running : bool = True
+        self.frames_processed : int = 0
+
+        # Hot-loop mode: decode/crop into reused buffers and reuse the response dict
+        self.hot_loop : bool = hot_loop
+        self.frame_buffers : Optional[FrameBufferPool] = FrameBufferPool(self.cropping) if hot_loop else None
+
+        logger.info(format_startup_report(timings))
+
+    def open_capture(self) -> None:
+        """Open the capture on the startup thread, keeping any error for __init__ to raise"""
+        try:
+            import cv2
+
+            if self.is_stream():
+                from rtsp.reader import RTSPReader
+                self.cap : RTSPReader = RTSPReader(self.video_path)
+            else:
+                self.cap : cv2.VideoCapture = cv2.VideoCapture(self.video_path)
+            self.capture_open_time = time.perf_counter()
+        except BaseException as e:
+            self.capture_error = e
+
+    def snapshot_state(self, line_counter, shift: str) -> Dict:
+        """Plain copy of the counting state, cheap enough to take on the frame loop"""
+        import cv2
+
+        return {
+            'source': self.video_path,
+            'cameraId': self.camera_id,
+            'shift': shift,
+            'framePos': int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)),
+            'maxTrackId': self.max_track_id,
+            'lineCounter': {'in': line_counter.in_count, 'out': line_counter.out_count},
+            'pipeCounter': self.pipe_counter.state_dict(),
+            'diaHandler': self.dia_handler.state_dict(),
+            'thisShiftIds': self.this_shift_ids.state_dict(),
+            'savedYoloIds': self.saved_yolo_ids.state_dict(),
+            'pipeDetections': list(self.pipe_detections),
+            'totalPipes': self.total_pipes,
+        }
+
+    def restore_state(self, state: Dict) -> None:
+        """
+        Restore counting state from a checkpoint. A pipe that was already on the line when the
+        process died gets a fresh track id that was never seen right of the line, so PipeCounter
+        won't count it a second time.
+        """
+        self.id_offset = state['maxTrackId'] + 1
+        self.max_track_id = state['maxTrackId']
+
+        self.pipe_counter.load_state_dict(state['pipeCounter'])
+        self.dia_handler.load_state_dict(state['diaHandler'])
+        self.saved_yolo_ids.load_state_dict(state['savedYoloIds'])
+        self.pipe_detections.extend(state['pipeDetections'])
+        self.total_pipes = state['totalPipes']
+
+        # per-shift state only carries over if the shift didn't change while we were down
+        if state['shift'] == get_shift():
+            self.this_shift_ids.load_state_dict(state['thisShiftIds'])
+
+        logger.info(f"Restored checkpoint {self.checkpoint_path}: {self.total_pipes} pipes, line in {state['lineCounter']['in']}, frame {state['framePos']}")
+
+    def stop(self) -> None:
+        """Make process() return after the current frame"""
+        self.running = False
+
+    def is_stream(self) -> bool:
+
+        return self.video_path.startswith(('rtsp://', 'http://', 'https://'))
 
     def init_response(self) -> Dict:
 
@@ -84,6 +202,17 @@ class DIP:
             'material': "dipcounter"
         }
     
+    def reset_response(self, response: Dict) -> Dict:
+        """Same as init_response but clears the given dict in place"""
+        response['imageId'] = None
+        response['createdAt'] = get_ist_timestamp()
+        response['cameraId'] = ''
+        response['originalImage'] = ''
+        response['annotatedImage'] = ''
+        response['pipeData'].clear()
+
+        return response
+
     def load_existing_json(self):
         """Load existing JSON file and populate saved_yolo_ids set"""
         if os.path.exists(self.output_json_path):
@@ -113,7 +242,7 @@ class DIP:
                 print(f"Loaded existing JSON with {len(self.saved_yolo_ids)} unique YOLO IDs for this video+camera")
             except (json.JSONDecodeError, KeyError) as e:
                 print(f"Error loading existing JSON: {e}. Starting with empty file.")
-                self.saved_yolo_ids = set()
+                self.saved_yolo_ids.clear()
         else:
             print("No existing output.json found. Starting fresh.")
 
@@ -129,6 +258,7 @@ class DIP:
             
             # Add to our internal list
             self.pipe_detections.append(pipe_info)
+            self.total_pipes += 1
             
             # Add to our tracking set
             self.saved_yolo_ids.add(yolo_id)
@@ -139,15 +269,14 @@ class DIP:
 
     def save_final_json(self):
         """Save final JSON with new format: video, camera, total_pipes, pipe_info"""
-        import os
         video_filename = os.path.basename(self.video_path)
         
         # Create new entry for this video+camera combination
         new_entry = {
             "video": video_filename,
             "camera": self.camera_id,
-            "total_pipes": len(self.pipe_detections),
-            "pipe_info": self.pipe_detections
+            "total_pipes": self.total_pipes,
+            "pipe_info": list(self.pipe_detections)
         }
         
         # Load existing data if file exists
@@ -190,10 +319,31 @@ class DIP:
         print(f"📄 Final JSON saved to {self.output_json_path}")
         print(f"   Video: {video_filename}")
         print(f"   Camera: {self.camera_id}")
-        print(f"   Total unique pipes detected: {len(self.pipe_detections)}")
+        print(f"   Total unique pipes detected: {self.total_pipes}")
         print(f"   Total entries in JSON: {len(existing_data)}")
     
+    def evict_tracker_state(self) -> None:
+        """Drop ids the tracker has removed from all per-track bookkeeping and report its size periodically"""
+        alive_ids = alive_track_ids(self.model, self.id_offset)
+
+        tracker_sets = {
+            'pipes_on_right': self.pipe_counter.pipes_on_right,
+            'this_shift_ids': self.this_shift_ids,
+            'saved_yolo_ids': self.saved_yolo_ids
+        }
+
+        for id_set in tracker_sets.values():
+            id_set.evict(alive_ids)
+
+        if time.time() - self.last_memory_report_timestamp > self.memory_report_delta:
+            logger.info(format_memory_report(tracker_sets) + f', pipe_detections {len(self.pipe_detections)}/{self.max_pipe_detections}')
+            self.last_memory_report_timestamp = time.time()
+
     def process(self) -> None:
+        import cv2
+        import supervision as sv
+        import utils.supervision_mods as svm
+
         logger.info("Starting analysis for camera: {}".format(self.camera_id))
 
         line_counter = svm.LineZone(start=self.LINE_START, end=self.LINE_END)
@@ -208,11 +358,31 @@ class DIP:
         script_start_time = get_ist_timestamp()
         script_start_shift = get_shift()
 
+        if self.restored_state is not None:
+            if self.restored_state['shift'] == script_start_shift:
+                line_counter.in_count = self.restored_state['lineCounter']['in']
+                line_counter.out_count = self.restored_state['lineCounter']['out']
+            if not self.is_stream():
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.restored_state['framePos'])
+
         response = self.init_response()
 
-        while True:
-            ret, frame = self.cap.read()
+        if self.hot_loop:
+            # everything allocated so far lives for the whole run, keep it out of the GC's way
+            gc.collect()
+            gc.freeze()
+
+        process_start = time.time()
+        while self.running:
+            if self.hot_loop and not self.is_stream():
+                ret, frame = self.frame_buffers.read(self.cap)
+            else:
+                ret, frame = self.cap.read()
             if not ret:
+                if self.is_stream():
+                    # RTSPReader has no new frame yet
+                    time.sleep(0.001)
+                    continue
                 # End of video - exit cleanly
                 print("End of video reached. Exiting...")
                 break
@@ -223,11 +393,15 @@ class DIP:
 
             response['originalImage'] = frame
 
-            frame = frame[self.cropping['y'][0]:self.cropping['y'][1], self.cropping['x'][0]:self.cropping['x'][1]]
+            if self.hot_loop:
+                frame = self.frame_buffers.crop(frame)
+            else:
+                frame = frame[self.cropping['y'][0]:self.cropping['y'][1], self.cropping['x'][0]:self.cropping['x'][1]]
 
             timestamp_curr = get_ist_timestamp()
 
-            result = self.model.track(frame, persist=True, retina_masks=True, device='cpu')[0]
+            self.frames_processed += 1
+            result = self.model.track(frame, persist=True, retina_masks=True, device='cpu', imgsz=self.imgsz)[0]
             shift = get_shift()
 
             line_annotator.custom_in_text = f"Shift {shift} in"
@@ -236,12 +410,13 @@ class DIP:
             detections = sv.Detections.from_ultralytics(result)
 
             if result.boxes.id is not None:
-                detections.tracker_id = result.boxes.id.cpu().numpy().astype(int)
+                detections.tracker_id = result.boxes.id.cpu().numpy().astype(int) + self.id_offset
+                self.max_track_id = max(self.max_track_id, int(detections.tracker_id.max()))
             else:
                 pass  # No tracker IDs available yet
 
             labels = [
-                f"{tracker_id} {self.model.model.names[class_id]} {confidence:0.2f}"
+                f"{tracker_id} {result.names[class_id]} {confidence:0.2f}"
                 for xyxy, mask, confidence, class_id, tracker_id, data
                 in detections
             ]
@@ -267,17 +442,17 @@ class DIP:
             response['annotatedImage'] = frame
 
             if len(detections):
-                mask = result.masks.cpu().numpy()
-                masks = mask.data.astype(bool)
+                # detections.mask is this frame's own bool copy of the masks and is not used after
+                # annotation, so PipeCounter can modify it in place without a per-detection copy
+                masks = detections.mask if detections.mask is not None else result.masks.cpu().numpy().data.astype(bool)
+                box_corners_x1 = detections.xyxy[:, 0].astype(int)
+                box_corners_x2 = detections.xyxy[:, 2].astype(int)
+                tracker_ids = detections.tracker_id
 
                 for i in range(len(detections)):
-                    mask_copy = masks[i].copy()
-
-                    box_corner_x1 = int(detections.xyxy[i][0])
-                    box_corner_x2 = int(detections.xyxy[i][2])
-                    foc_tracker_id = detections[i].tracker_id[0] if detections[i].tracker_id is not None else None
+                    foc_tracker_id = tracker_ids[i] if tracker_ids is not None else None
 
-                    ret, pipe_id, diaMM = self.pipe_counter.process(foc_tracker_id, box_corner_x1, box_corner_x2, mask_copy, frame, self.dia_handler)
+                    ret, pipe_id, diaMM = self.pipe_counter.process(foc_tracker_id, int(box_corners_x1[i]), int(box_corners_x2[i]), masks[i], frame, self.dia_handler)
 
                     if ret:
                         if pipe_id not in self.this_shift_ids:
@@ -298,7 +473,11 @@ class DIP:
                 # Calculate video timestamp based on frame number and FPS
                 current_frame = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
                 video_fps = self.cap.get(cv2.CAP_PROP_FPS)  # Get video FPS using cv2 property
-                video_timestamp_seconds = current_frame / video_fps
+                if video_fps > 0:
+                    video_timestamp_seconds = current_frame / video_fps
+                else:
+                    # Streams can report 0 (or NaN) fps, fall back to the time since processing started
+                    video_timestamp_seconds = time.time() - process_start
                 
                 # Format as MM:SS.mmm
                 minutes = int(video_timestamp_seconds // 60)
@@ -323,11 +502,19 @@ class DIP:
                     # Save pipe detection to JSON if we have valid tracker_id and confidence
                     if tracker_id != "N/A" and confidence != "N/A" and isinstance(tracker_id, (int, float, np.int64, np.float32)) and isinstance(confidence, (int, float, np.int64, np.float32)):
                         self.save_pipe_detection_to_json(int(tracker_id), video_time_formatted, current_frame, float(confidence))
+
+            if shift != script_start_shift:
                 logger.info(f"changing shift from {script_start_shift} to {shift} at {datetime.fromtimestamp(get_ist_timestamp())}")
                 script_start_shift = shift
-                line_counter.in_count = 1
+                line_counter.in_count = 0
                 line_counter.out_count = 0
-                self.this_shift_ids = set()
+                self.this_shift_ids.clear()
+
+            self.evict_tracker_state()
+            self.checkpoint_writer.maybe_save(lambda: self.snapshot_state(line_counter, shift))
+
+            if self.hot_loop:
+                self.frame_buffers.advance()
 
             if time.time() - self.last_push_timestamp < self.push_delta:
                 continue
@@ -357,12 +544,20 @@ class DIP:
                 print("="*50)
                 logger.info("Data processed and printed")
             
-            response = self.init_response()
+            response = self.reset_response(response) if self.hot_loop else self.init_response()
             self.last_push_timestamp = time.time()
 
         # Save final JSON at the end of processing
         self.save_final_json()
 
+        if self.is_stream():
+            self.cap.release()
+
+        # A finished video has nothing left to resume
+        self.checkpoint_writer.close()
+        if not self.is_stream() and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
 
 
 if __name__ == '__main__':
@@ -371,6 +566,12 @@ if __name__ == '__main__':
     parser.add_argument('--clientId', type=str, default='esldip-local', help='client id for sqs')
     parser.add_argument('--produce', type=str, default='debug', help='produce to debug or SQS')
     parser.add_argument('--video-path', type=str, default='/Users/hanoon/Documents/eval/misc/fragments/00000000017000000/0.mp4', help='Path to the video file to process')
+    parser.add_argument('--no-model-cache', action='store_true', help='load the .pt weights directly instead of the cached fused artifact')
+    parser.add_argument('--warmup-runs', type=int, default=2, help='number of warm-up inferences on a blank frame before processing')
+    parser.add_argument('--checkpoint-dir', type=str, default='checkpoints', help='folder for the per-camera counting state snapshots')
+    parser.add_argument('--checkpoint-interval', type=float, default=5, help='seconds between counting state snapshots')
+    parser.add_argument('--no-resume', action='store_true', help='ignore an existing checkpoint and start counting from zero')
+    parser.add_argument('--hot-loop', action='store_true', help='reuse preallocated frame buffers and response objects in the processing loop')
 
     args = parser.parse_args()
     cfg_file = args.config
@@ -383,7 +584,8 @@ if __name__ == '__main__':
         sys.exit()
 
     print(f"Processing video: {args.video_path}")
-    obj = DIP(config, args.clientId, args.produce, args.video_path)
+    obj = DIP(config, args.clientId, args.produce, args.video_path, not args.no_model_cache, args.warmup_runs,
+              args.checkpoint_dir, not args.no_resume, args.checkpoint_interval, hot_loop=args.hot_loop)
 
     try:
         obj.process()
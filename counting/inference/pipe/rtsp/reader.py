@@ -15,6 +15,7 @@ class RTSPReader(threading.Thread):
         self.__frame_width : Optional[float] = None
 
         self.frame : Optional[MatLike] = None
+        self.frames_read : int = 0
 
         self.super_killed : bool = False
 
@@ -42,7 +43,9 @@ class RTSPReader(threading.Thread):
     def run(self) -> None:
         while not self.super_killed:
             try:
-                self.camera = cv2.VideoCapture(self.cam_uri)
+                # the first connection is opened in __init__, only reconnect after a drop
+                if not self.camera.isOpened():
+                    self.camera = cv2.VideoCapture(self.cam_uri)
                 self.__camera_loop()
                 log_camera_down()
             except Exception as _:
@@ -61,6 +64,7 @@ class RTSPReader(threading.Thread):
                 if not ret:
                     break
 
+                self.frames_read += 1
                 self.__new_frame_available = True
 
             except cv2.error as e:
@@ -83,6 +87,10 @@ class RTSPReader(threading.Thread):
         
         return True, self.frame
 
+    def get(self, prop_id: int) -> float:
+
+        return self.camera.get(prop_id)
+
     def isOpened(self) -> bool:
 
         return self.camera.isOpened()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Local camera farm simulator.
+
+Serves recorded fragments as N concurrent MJPEG-over-HTTP streams (http://host:port/cam/<i>),
+which cv2.VideoCapture and RTSPReader open exactly like a plant camera. Each stream plays at a
+configurable FPS with frame-time jitter and random feed dropouts.
+
+    python -m rtsp.simulator --video /path/to/0.mp4 --cameras 8 --fps 25 --jitter 0.1 --dropout-rate 0.01
+
+With --rtsp-server the fragments are instead published as real RTSP streams through ffmpeg to an
+RTSP server (e.g. mediamtx) at <rtsp-server>/cam<i>; jitter is not applied in that mode and
+dropouts restart the ffmpeg publisher.
+"""
+
+from typing import List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import random
+import subprocess
+import threading
+import time
+
+import cv2
+
+BOUNDARY : str = 'frame'
+
+def load_frames(video_paths: List[str], max_frames: int, jpeg_quality: int = 80) -> List[bytes]:
+    """Decode and JPEG-encode up to max_frames frames once, shared by every stream."""
+    frames = []
+
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if ok:
+                frames.append(buf.tobytes())
+        cap.release()
+
+        if len(frames) >= max_frames:
+            break
+
+    if not frames:
+        raise ValueError(f'No frames could be read from {video_paths}')
+
+    return frames
+
+class CameraFarm:
+    """Playback settings and per-camera counters shared by the HTTP handlers."""
+
+    def __init__(self, frames: List[bytes], cameras: int, fps: float, jitter: float = 0, dropout_rate: float = 0, dropout_seconds: float = 2) -> None:
+
+        self.frames : List[bytes] = frames
+        self.cameras : int = cameras
+        self.fps : float = fps
+        self.jitter : float = jitter
+        self.dropout_rate : float = dropout_rate
+        self.dropout_seconds : float = dropout_seconds
+
+        self.frames_sent : List[int] = [0] * cameras
+        self.dropouts : List[int] = [0] * cameras
+        self.down_until : List[float] = [0.0] * cameras
+
+    def frame_delay(self) -> float:
+        delay = 1 / self.fps
+        if self.jitter:
+            delay = max(0.0, random.gauss(delay, delay * self.jitter))
+        return delay
+
+    def should_drop(self) -> bool:
+        # dropout_rate is the chance per second of stream time that the feed drops
+        return self.dropout_rate > 0 and random.random() < self.dropout_rate / self.fps
+
+class MJPEGHandler(BaseHTTPRequestHandler):
+
+    farm : Optional[CameraFarm] = None
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        farm = self.farm
+        parts = self.path.strip('/').split('/')
+
+        if len(parts) != 2 or parts[0] != 'cam' or not parts[1].isdigit() or int(parts[1]) >= farm.cameras:
+            self.send_error(404)
+            return
+
+        cam = int(parts[1])
+        if time.time() < farm.down_until[cam]:
+            self.send_error(503)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+        self.end_headers()
+
+        # every camera starts at a different point of the recording
+        index = random.randrange(len(farm.frames))
+        next_time = time.perf_counter()
+
+        try:
+            while True:
+                if farm.should_drop():
+                    farm.dropouts[cam] += 1
+                    farm.down_until[cam] = time.time() + farm.dropout_seconds
+                    break
+
+                jpeg = farm.frames[index]
+                self.wfile.write(f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n'.encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+                farm.frames_sent[cam] += 1
+                index = (index + 1) % len(farm.frames)
+
+                next_time += farm.frame_delay()
+                sleep_for = next_time - time.perf_counter()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    next_time = time.perf_counter()
+
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def start_mjpeg_farm(farm: CameraFarm, host: str = '127.0.0.1', port: int = 8554) -> ThreadingHTTPServer:
+    """Start serving the farm on a background thread, returns the server (call shutdown() to stop)."""
+    handler = type('FarmHandler', (MJPEGHandler,), {'farm': farm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
+
+def stream_urls(cameras: int, host: str = '127.0.0.1', port: int = 8554) -> List[str]:
+    return [f'http://{host}:{port}/cam/{i}' for i in range(cameras)]
+
+class RTSPPublisher(threading.Thread):
+    """Publishes one fragment in a loop to an RTSP server with ffmpeg, restarting it on simulated dropouts."""
+
+    def __init__(self, video_path: str, url: str, fps: float, dropout_rate: float = 0, dropout_seconds: float = 2) -> None:
+
+        self.video_path : str = video_path
+        self.url : str = url
+        self.fps : float = fps
+        self.dropout_rate : float = dropout_rate
+        self.dropout_seconds : float = dropout_seconds
+        self.dropouts : int = 0
+
+        self.super_killed : bool = False
+        self.process : Optional[subprocess.Popen] = None
+
+        super().__init__(daemon=True)
+        self.start()
+
+    def run(self) -> None:
+        cmd = [
+            'ffmpeg', '-loglevel', 'error', '-re', '-stream_loop', '-1', '-i', self.video_path,
+            '-an', '-r', str(self.fps), '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-f', 'rtsp', '-rtsp_transport', 'tcp', self.url
+        ]
+
+        while not self.super_killed:
+            self.process = subprocess.Popen(cmd)
+
+            while not self.super_killed and self.process.poll() is None:
+                time.sleep(1)
+                if self.dropout_rate > 0 and random.random() < self.dropout_rate:
+                    self.dropouts += 1
+                    self.process.terminate()
+                    time.sleep(self.dropout_seconds)
+
+            if self.process.poll() is None:
+                self.process.terminate()
+
+    def release(self) -> None:
+
+        self.super_killed = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve recorded fragments as a farm of simulated cameras.')
+    parser.add_argument('--video', type=str, nargs='+', required=True, help='recorded fragment(s) to play')
+    parser.add_argument('--cameras', type=int, default=4, help='number of concurrent streams')
+    parser.add_argument('--fps', type=float, default=25, help='frames per second of every stream')
+    parser.add_argument('--jitter', type=float, default=0, help='std-dev of frame interval as a fraction of 1/fps')
+    parser.add_argument('--dropout-rate', type=float, default=0, help='chance per second that a feed drops')
+    parser.add_argument('--dropout-seconds', type=float, default=2, help='how long a dropped feed stays down')
+    parser.add_argument('--max-frames', type=int, default=1500, help='frames preloaded in memory (mjpeg mode)')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8554)
+    parser.add_argument('--rtsp-server', type=str, default=None, help='publish real RTSP to this server (e.g. rtsp://127.0.0.1:8554) instead of MJPEG')
+    args = parser.parse_args()
+
+    if args.rtsp_server:
+        publishers = [
+            RTSPPublisher(args.video[i % len(args.video)], f'{args.rtsp_server}/cam{i}', args.fps, args.dropout_rate, args.dropout_seconds)
+            for i in range(args.cameras)
+        ]
+        for publisher in publishers:
+            print(publisher.url)
+    else:
+        frames = load_frames(args.video, args.max_frames)
+        farm = CameraFarm(frames, args.cameras, args.fps, args.jitter, args.dropout_rate, args.dropout_seconds)
+        start_mjpeg_farm(farm, args.host, args.port)
+        print(f'Serving {args.cameras} camera(s) from {len(frames)} preloaded frames')
+        for url in stream_urls(args.cameras, args.host, args.port):
+            print(url)
+
+    try:
+        while True:
+            time.sleep(10)
+            if not args.rtsp_server:
+                print(f'frames sent: {farm.frames_sent}, dropouts: {farm.dropouts}')
+    except KeyboardInterrupt:
+        if args.rtsp_server:
+            for publisher in publishers:
+                publisher.release()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+from typing import Any, Callable, Dict, Optional
+import json
+import os
+import queue
+import threading
+import time
+
+from utils.logging import logger
+
+CHECKPOINT_VERSION : int = 1
+
+def _to_builtin(obj: Any) -> Any:
+    # numpy scalars (tracker ids, medians) end up in the counting state
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def write_atomic(path: str, data: Dict) -> None:
+    """Write JSON to a temp file in the same folder, fsync it and rename it over `path`."""
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, default=_to_builtin)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path: str, max_age: float) -> Optional[Dict]:
+    """Return the checkpoint at `path` if it exists, is readable and is newer than `max_age` seconds."""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.error(f'Could not read checkpoint {path}: {e}. Starting fresh.')
+        return None
+
+    if data.get('version') != CHECKPOINT_VERSION:
+        logger.error(f'Checkpoint {path} has version {data.get("version")}, expected {CHECKPOINT_VERSION}. Starting fresh.')
+        return None
+
+    age = time.time() - data.get('savedAt', 0)
+    if age > max_age:
+        logger.info(f'Checkpoint {path} is {age:.0f}s old, older than {max_age:.0f}s. Starting fresh.')
+        return None
+
+    return data
+
+class CheckpointWriter(threading.Thread):
+    """
+    Periodically persists counting state without blocking the frame loop.
+
+    The loop calls `maybe_save` every frame; once `interval` seconds have passed it builds a
+    snapshot (plain dicts/lists) and hands it to this thread, which does the JSON encoding,
+    fsync and rename. Only the newest pending snapshot is kept.
+    """
+
+    def __init__(self, path: str, interval: float = 5) -> None:
+
+        self.path : str = path
+        self.interval : float = interval
+        self.last_save_timestamp : float = time.time()
+
+        self.__pending : queue.Queue = queue.Queue(maxsize=1)
+        self.super_killed : bool = False
+
+        super().__init__(daemon=True)
+        self.start()
+
+    def maybe_save(self, snapshot_fn: Callable[[], Dict]) -> None:
+
+        if time.time() - self.last_save_timestamp < self.interval:
+            return
+        self.last_save_timestamp = time.time()
+
+        self.submit(snapshot_fn())
+
+    def submit(self, snapshot: Dict) -> None:
+
+        snapshot['version'] = CHECKPOINT_VERSION
+        snapshot['savedAt'] = time.time()
+
+        # replace a snapshot the writer hasn't picked up yet
+        try:
+            self.__pending.get_nowait()
+        except queue.Empty:
+            pass
+        self.__pending.put_nowait(snapshot)
+
+    def run(self) -> None:
+        while not self.super_killed or not self.__pending.empty():
+            try:
+                snapshot = self.__pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                write_atomic(self.path, snapshot)
+            except Exception as e:
+                logger.error(f'Could not write checkpoint {self.path}: {e}')
+
+    def close(self, snapshot: Optional[Dict] = None) -> None:
+        """Write a last snapshot (if given) and wait for the writer to finish."""
+        if snapshot is not None:
+            self.submit(snapshot)
+
+        self.super_killed = True
+        self.join()
@@ -29,6 +29,27 @@ class DiameterHandler:
 
         self.diameters_curr = [] if self.handler_type == 'LIST' else defaultdict(list)
 
+    def state_dict(self) -> Dict:
+
+        # DICT handler keys are tracker ids, keep them as pairs so they survive JSON
+        curr = self.diameters_curr if self.handler_type == 'LIST' else [[k, v] for k, v in self.diameters_curr.items()]
+
+        return {
+            'diameters_curr': curr,
+            'diameters_queue': [[pipe, dia] for pipe, dia in self.diameters_queue],
+            'last_dia_time': self.last_dia_time,
+        }
+
+    def load_state_dict(self, state: Dict) -> None:
+
+        if self.handler_type == 'LIST':
+            self.diameters_curr = list(state['diameters_curr'])
+        else:
+            self.diameters_curr = defaultdict(list, {k: v for k, v in state['diameters_curr']})
+
+        self.diameters_queue = [(pipe, dia) for pipe, dia in state['diameters_queue']]
+        self.last_dia_time = state['last_dia_time']
+
     def non_zero_median(self, pipe_id: Optional[str] = None) -> Optional[int]:
 
         if self.handler_type == 'LIST':
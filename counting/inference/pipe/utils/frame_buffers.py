@@ -0,0 +1,46 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+class FrameBufferPool:
+    """
+    Ring of preallocated decode and crop buffers reused by DIP.process in hot-loop mode.
+
+    A slot's buffers are only written again `size` frames later, so the frame/crop referenced
+    by the current response stays intact until it has been pushed.
+    """
+
+    def __init__(self, cropping: Dict, size: int = 2) -> None:
+
+        self.cropping : Dict = cropping
+        self.size : int = size
+        self.index : int = 0
+
+        # allocated lazily from the first decoded frame, the stream resolution isn't known before
+        self.frames : List[Optional[np.ndarray]] = [None] * size
+        self.crops : List[Optional[np.ndarray]] = [None] * size
+
+    def read(self, cap: Any) -> Tuple[bool, Optional[np.ndarray]]:
+        """Decode the next frame of a cv2.VideoCapture into the current slot's buffer."""
+        buf = self.frames[self.index]
+        ret, frame = cap.read(buf) if buf is not None else cap.read()
+
+        if ret:
+            # cv2 reallocates if the resolution changed, keep whatever it returned
+            self.frames[self.index] = frame
+
+        return ret, frame
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """Copy the configured crop of `frame` into the current slot's crop buffer."""
+        view = frame[self.cropping['y'][0]:self.cropping['y'][1], self.cropping['x'][0]:self.cropping['x'][1]]
+
+        buf = self.crops[self.index]
+        if buf is None or buf.shape != view.shape:
+            buf = self.crops[self.index] = np.empty_like(view)
+
+        np.copyto(buf, view)
+        return buf
+
+    def advance(self) -> None:
+
+        self.index = (self.index + 1) % self.size
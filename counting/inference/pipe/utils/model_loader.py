@@ -0,0 +1,98 @@
+from typing import Any, Dict, Tuple
+from contextlib import contextmanager
+import math
+import os
+
+from utils.logging import logger
+
+MODEL_CACHE_DIR : str = 'models/.cache'
+MODEL_STRIDE : int = 32
+
+@contextmanager
+def unsafe_torch_load():
+    """
+    Temporarily patch torch.load to use weights_only=False.
+    Only needed when reading the original ultralytics .pt checkpoint.
+    """
+    import torch
+
+    original_load = torch.load
+
+    def patched_load(*args, **kwargs):
+        kwargs['weights_only'] = False
+        return original_load(*args, **kwargs)
+
+    torch.load = patched_load
+    try:
+        yield
+    finally:
+        torch.load = original_load
+
+def static_imgsz(crop_w: int, crop_h: int, imgsz: int = 640, stride: int = MODEL_STRIDE) -> Tuple[int, int]:
+    """
+    (h, w) inference shape matching the rect letterbox ultralytics applies to .pt models,
+    so the fixed-shape cached artifact sees the same input as the original weights.
+    """
+    scale = imgsz / max(crop_w, crop_h)
+    h = int(math.ceil(crop_h * scale / stride) * stride)
+    w = int(math.ceil(crop_w * scale / stride) * stride)
+    return h, w
+
+def config_imgsz(config: Dict) -> Tuple[int, int]:
+    cropping = config['ds-info']['cropping']
+    return static_imgsz(cropping['x'][1] - cropping['x'][0], cropping['y'][1] - cropping['y'][0])
+
+def cached_artifact_path(weights_path: str, imgsz: Tuple[int, int]) -> str:
+    stat = os.stat(weights_path)
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    name = f'{stem}_{int(stat.st_mtime)}_{stat.st_size}_{imgsz[0]}x{imgsz[1]}.torchscript'
+    return os.path.join(MODEL_CACHE_DIR, name)
+
+def build_model_cache(weights_path: str, imgsz: Tuple[int, int]) -> str:
+    """Export the .pt weights once into a fused TorchScript artifact in MODEL_CACHE_DIR."""
+    from ultralytics import YOLO
+
+    cache_path = cached_artifact_path(weights_path, imgsz)
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+
+    with unsafe_torch_load():
+        model = YOLO(weights_path)
+        exported = model.export(format='torchscript', imgsz=list(imgsz), device='cpu')
+
+    os.replace(exported, cache_path)
+    logger.info(f'Cached fused model artifact at {cache_path}')
+
+    return cache_path
+
+def load_model(weights_path: str, imgsz: Tuple[int, int], use_cache: bool = True) -> Any:
+    """
+    Load the segmentation model. With use_cache the fused TorchScript artifact is used
+    (built on first run), which skips both the torch.load patch and the fuse step.
+    """
+    from ultralytics import YOLO
+
+    if not use_cache:
+        with unsafe_torch_load():
+            return YOLO(weights_path)
+
+    cache_path = cached_artifact_path(weights_path, imgsz)
+    if not os.path.exists(cache_path):
+        try:
+            cache_path = build_model_cache(weights_path, imgsz)
+        except Exception as e:
+            logger.error(f'Could not build model cache for {weights_path}: {e}. Falling back to .pt weights.')
+            with unsafe_torch_load():
+                return YOLO(weights_path)
+
+    return YOLO(cache_path, task='segment')
+
+def warmup(model: Any, frame_shape: Tuple[int, int, int], imgsz: Tuple[int, int], runs: int = 2) -> None:
+    """Run inference on a blank frame so lazy initialisation happens before the stream starts."""
+    import numpy as np
+
+    dummy = np.zeros(frame_shape, dtype=np.uint8)
+    for _ in range(runs):
+        model.predict(dummy, imgsz=imgsz, retina_masks=True, device='cpu', verbose=False)
+
+def format_startup_report(timings: Dict[str, float]) -> str:
+    return 'Startup: ' + ', '.join(f'{k} {v:.2f}s' for k, v in timings.items())
@@ -1,8 +1,5 @@
-import boto3
 from dotenv import load_dotenv
 from os import environ
-import cv2
-import logging
 import json
 from datetime import datetime, timedelta
 import os
@@ -13,9 +10,21 @@ load_dotenv(dotenv_path)
 ACCESS_KEY = environ.get('AWS_ACCESS_KEY')
 SECRET_KEY = environ.get('AWS_SECRET_ACCESS_KEY')
 
-sqs = boto3.client('sqs', 'ap-south-1', aws_access_key_id= ACCESS_KEY, aws_secret_access_key= SECRET_KEY)
+_sqs = None
+
+def get_sqs_client():
+    """Create the SQS client on first use so importing this module stays cheap."""
+    global _sqs
+
+    if _sqs is None:
+        import boto3
+        _sqs = boto3.client('sqs', 'ap-south-1', aws_access_key_id= ACCESS_KEY, aws_secret_access_key= SECRET_KEY)
+
+    return _sqs
 
 def save_image(image, path):
+    import cv2
+
     cv2.imwrite(path, image)
     return path
 
@@ -36,4 +45,4 @@ def push_data_to_sqs(record, queue_url):
 
     unique_id = str(int(datetime.now().timestamp()))
 
-    sqs.send_message(QueueUrl = queue_url, MessageBody = json.dumps(record), MessageGroupId = 'esl-dip', MessageDeduplicationId=unique_id)
\ No newline at end of file
+    get_sqs_client().send_message(QueueUrl = queue_url, MessageBody = json.dumps(record), MessageGroupId = 'esl-dip', MessageDeduplicationId=unique_id)
\ No newline at end of file
@@ -1,5 +1,6 @@
-from typing import Tuple, Optional, Any
+from typing import Tuple, Optional, Any, Dict
 from utils.diameter_handler import DiameterHandler
+from utils.tracker_state import BoundedIdSet
 from utils.logging import logger
 import numpy as np
 
@@ -8,7 +9,7 @@ class PipeCounter:
     def __init__(self, cross_line: int, camera_id: str) -> None:
         
         self.cross_line : int = cross_line
-        self.pipes_on_right : set = set()
+        self.pipes_on_right : BoundedIdSet = BoundedIdSet()
         self.curr_pipe_on_line : int = -1
         self.curr_pipe_on_line_count : int = 0
         self.camera_id = camera_id
@@ -41,4 +42,18 @@ class PipeCounter:
         if box_corner_x1 > self.cross_line and box_corner_x2 > self.cross_line and foc_tracker_id:
             self.pipes_on_right.add(foc_tracker_id)
 
-        return False, None, None
\ No newline at end of file
+        return False, None, None
+
+    def state_dict(self) -> Dict:
+
+        return {
+            'pipes_on_right': self.pipes_on_right.state_dict(),
+            'curr_pipe_on_line': int(self.curr_pipe_on_line),
+            'curr_pipe_on_line_count': self.curr_pipe_on_line_count,
+        }
+
+    def load_state_dict(self, state: Dict) -> None:
+
+        self.pipes_on_right.load_state_dict(state['pipes_on_right'])
+        self.curr_pipe_on_line = state['curr_pipe_on_line']
+        self.curr_pipe_on_line_count = state['curr_pipe_on_line_count']
\ No newline at end of file
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+import sys
+import time
+
+class BoundedIdSet:
+    """
+    Set of tracker ids that forgets ids once the tracker has dropped them.
+
+    Ultralytics' BYTETracker/BOTSORT hand out increasing ids and never reuse one, so an id at or
+    below the newest id the tracker has used that is neither tracked nor lost can not show up
+    again and is safe to evict. Ids above it (e.g. reloaded from a previous run) are kept.
+    When the tracker state is not available, ids unseen for `ttl` seconds are evicted instead.
+    `id_window` is a hard cap: ids more than `id_window` below the newest id are always evicted.
+    """
+
+    def __init__(self, ttl: float = 600, id_window: int = 5000) -> None:
+
+        self.ttl : float = ttl
+        self.id_window : int = id_window
+
+        # id -> last time it was added, insertion ordered
+        self.last_seen : Dict[int, float] = {}
+        self.max_id : Optional[int] = None
+        self.tracker_max_id : int = -1
+        self.evicted_count : int = 0
+
+    def add(self, track_id: int) -> None:
+
+        self.last_seen[track_id] = time.time()
+        if self.max_id is None or track_id > self.max_id:
+            self.max_id = track_id
+
+    def update(self, track_ids: Iterable[int]) -> None:
+
+        for track_id in track_ids:
+            self.add(track_id)
+
+    def discard(self, track_id: int) -> None:
+
+        self.last_seen.pop(track_id, None)
+
+    def clear(self) -> None:
+
+        self.last_seen = {}
+
+    def __contains__(self, track_id: Any) -> bool:
+        return track_id in self.last_seen
+
+    def __len__(self) -> int:
+        return len(self.last_seen)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.last_seen)
+
+    def evict(self, alive_ids: Optional[Set[int]] = None) -> int:
+        """
+        Drop ids the tracker no longer knows about (alive_ids), or, without tracker state,
+        ids older than ttl. Returns the number of evicted ids.
+        """
+        to_be_deleted = []
+        now = time.time()
+        min_id = self.max_id - self.id_window if self.max_id is not None else None
+
+        if alive_ids:
+            self.tracker_max_id = max(self.tracker_max_id, max(alive_ids))
+
+        for track_id, seen_at in self.last_seen.items():
+            if min_id is not None and track_id < min_id:
+                to_be_deleted.append(track_id)
+            elif alive_ids is not None:
+                if track_id <= self.tracker_max_id and track_id not in alive_ids:
+                    to_be_deleted.append(track_id)
+            elif now - seen_at > self.ttl:
+                to_be_deleted.append(track_id)
+
+        for track_id in to_be_deleted:
+            del self.last_seen[track_id]
+
+        self.evicted_count += len(to_be_deleted)
+        return len(to_be_deleted)
+
+    def state_dict(self) -> Dict:
+
+        return {
+            'last_seen': [[int(k), v] for k, v in self.last_seen.items()],
+            'max_id': self.max_id,
+            'tracker_max_id': self.tracker_max_id,
+        }
+
+    def load_state_dict(self, state: Dict) -> None:
+
+        self.last_seen = {int(k): v for k, v in state['last_seen']}
+        self.max_id = state['max_id']
+        self.tracker_max_id = state['tracker_max_id']
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the set (dict plus keys and timestamps)."""
+        return sys.getsizeof(self.last_seen) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.last_seen.items())
+
+def alive_track_ids(model: Any, id_offset: int = 0) -> Optional[Set[int]]:
+    """Ids the ultralytics tracker still tracks or may recover (lost), None if no tracker yet."""
+    predictor = getattr(model, 'predictor', None)
+    trackers = getattr(predictor, 'trackers', None)
+
+    if not trackers:
+        return None
+
+    tracker = trackers[0]
+    return {int(t.track_id) + id_offset for t in tracker.tracked_stracks + tracker.lost_stracks}
+
+def format_memory_report(sets: Dict[str, BoundedIdSet]) -> str:
+    parts = [f'{name} {len(s)} ids/{s.memory_bytes() / 1024:.1f}KB (evicted {s.evicted_count})' for name, s in sets.items()]
+    return 'Tracker state: ' + ', '.join(parts)
@@ -1,4 +1,5 @@
 # Video processing module
 from .reader import VideoReader
+from .transcode import TranscodeParams, camera_cropping, transcode, transcode_all
 
-__all__ = ['VideoReader']
+__all__ = ['VideoReader', 'TranscodeParams', 'camera_cropping', 'transcode', 'transcode_all']
@@ -0,0 +1,126 @@
+"""
+Client-side transcoding of fragments before they are uploaded for video counting.
+
+Raw fragments are 10 minutes of full-resolution, full-frame-rate video, but counting pipes needs
+neither. transcode() lowers the frame rate and resolution, crops to the camera's ds-info.cropping
+region and can drop static stretches (ffmpeg mpdecimate), then re-encodes with H.264. Outputs
+are cached by (fragment content hash, params), so every model and every rerun uploads the same
+small file.
+
+    params = TranscodeParams(fps=2, max_height=480, cropping=camera_cropping('ccm1'))
+    small_path = transcode(video_path, params)
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+TRANSCODE_CACHE_DIR : str = os.environ.get('TRANSCODE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+TRANSCODE_WORKERS : int = 4
+
+@dataclass(frozen=True)
+class TranscodeParams:
+    fps: Optional[float] = 2.0          # output frame rate, None keeps the source rate
+    max_height: Optional[int] = 480     # downscale to at most this height, None keeps the size
+    cropping: Optional[Tuple[Tuple[int, int], Tuple[int, int]]] = None  # ((x0, x1), (y0, y1)), see camera_cropping
+    motion_only: bool = False           # drop near-duplicate frames so only motion segments remain
+    crf: int = 28                       # H.264 quality, higher is smaller
+
+    def key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True)
+
+    def name(self) -> str:
+        """Short readable label for reports"""
+        parts = [f"fps={self.fps or 'src'}", f"h={self.max_height or 'src'}"]
+        if self.cropping:
+            parts.append('crop')
+        if self.motion_only:
+            parts.append('motion')
+        return ','.join(parts)
+
+def camera_cropping(cfg_path: str) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """ds-info.cropping of a camera config as ((x0, x1), (y0, y1))"""
+    from data.config import read_cam_config
+
+    cropping = read_cam_config(cfg_path)['ds-info']['cropping']
+    return (tuple(cropping['x']), tuple(cropping['y']))
+
+def video_hash(video_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(video_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def filter_chain(params: TranscodeParams) -> List[str]:
+    """ffmpeg -vf filters for the params: crop, drop static frames, frame rate, downscale"""
+    filters = []
+    if params.cropping:
+        (x0, x1), (y0, y1) = params.cropping
+        # yuv420p needs even dimensions
+        width, height = (x1 - x0) // 2 * 2, (y1 - y0) // 2 * 2
+        filters.append(f"crop={width}:{height}:{x0}:{y0}")
+    if params.motion_only:
+        # mpdecimate drops frames that barely differ from the last kept one; setpts closes the gaps
+        filters += ['mpdecimate', 'setpts=N/FRAME_RATE/TB']
+    if params.fps:
+        filters.append(f"fps={params.fps}")
+    if params.max_height:
+        filters.append(f"scale=-2:'min({params.max_height},ih)'")
+    return filters
+
+def ffmpeg_command(video_path: str, output_path: str, params: TranscodeParams) -> List[str]:
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', video_path]
+    filters = filter_chain(params)
+    if filters:
+        cmd += ['-vf', ','.join(filters)]
+    cmd += ['-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(params.crf), '-pix_fmt', 'yuv420p', '-movflags', '+faststart', output_path]
+    return cmd
+
+def cached_path(video_path: str, params: TranscodeParams, cache_dir: str = TRANSCODE_CACHE_DIR) -> str:
+    key = hashlib.sha256(f"{video_hash(video_path)}:{params.key()}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key[:32]}.mp4")
+
+def transcode(video_path: str, params: Optional[TranscodeParams], cache_dir: str = TRANSCODE_CACHE_DIR) -> str:
+    """Path of the transcoded fragment (the original when params is None), encoding it on a cache miss"""
+    if params is None:
+        return video_path
+
+    output_path = cached_path(video_path, params, cache_dir)
+    if os.path.exists(output_path):
+        return output_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{output_path[:-4]}.{os.getpid()}.tmp.mp4"
+    try:
+        subprocess.run(ffmpeg_command(video_path, tmp_path, params), check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"ffmpeg failed on {video_path}: {e.stderr.decode(errors='replace').strip()}") from e
+
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def transcode_all(video_paths: List[str], params: Optional[TranscodeParams], max_workers: int = TRANSCODE_WORKERS) -> Dict[str, str]:
+    """Transcode fragments in parallel, returns {original path: path to upload}"""
+    if params is None:
+        return {video_path: video_path for video_path in video_paths}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outputs = list(executor.map(lambda video_path: transcode(video_path, params), video_paths))
+
+    return dict(zip(video_paths, outputs))
+
+def probe_duration(video_path: str) -> Optional[float]:
+    """Duration in seconds using ffprobe, None if it can't be read"""
+    cmd = ['ffprobe', '-v', 'quiet', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError, FileNotFoundError):
+        return None
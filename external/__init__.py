@@ -0,0 +1,15 @@
+# Shared client layer for the external model providers
+from .batch import run_batch
+from .client import MODELS, ModelResponse, ModelSpec, agenerate, generate
+from .hedging import Hedger
+from .latency import latency_report
+from .output import OutputFormat
+from .packing import run_packed
+from .preprocess import Preprocess
+from .pricing import MODEL_PRICING, response_cost, response_savings
+from .results import ResultWriter
+from .scheduler import Request, Scheduler, run_requests
+from .transport import AsyncTransport
+from .uploads import upload_videos
+
+__all__ = ['MODELS', 'ModelResponse', 'ModelSpec', 'agenerate', 'generate', 'Hedger', 'latency_report', 'AsyncTransport', 'MODEL_PRICING', 'OutputFormat', 'Preprocess', 'Request', 'ResultWriter', 'Scheduler', 'run_batch', 'run_packed', 'response_cost', 'response_savings', 'run_requests', 'upload_videos']
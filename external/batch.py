@@ -0,0 +1,466 @@
+"""
+Batch-API execution mode for offline evaluation sweeps.
+
+Instead of one interactive request per image, the requests of a sweep are written as JSONL job
+files in each provider's batch format, submitted, polled until they finish and mapped back to
+(model_id, image path), the same ResultSet the scheduler returns, so a runner can switch with
+
+    responses = run_batch([Request(model_id, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=p) for p in images])
+
+OpenRouter has no batch API, so the Claude and OpenAI models are batched directly against the
+Anthropic and OpenAI APIs (ANTHROPIC_API_KEY / OPENAI_API_KEY); Gemini uses the Gemini Batch
+API with GEMINI_API_KEY. Base URLs can be pointed at external/mock_server.py with configure().
+Job files, the custom_id manifest and raw results are kept in the batch folder, and every result
+is written to the response cache. The manifest records the batch id and a digest of the job, so a
+run that crashed while its batches were in flight re-attaches to them instead of resubmitting.
+"""
+
+import base64
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+from . import transport
+from .cache import get_cache, request_key
+from .client import ModelResponse, get_spec
+from .payload import image_bytes, image_data_url
+from .output import gemini_generation_config, openrouter_params, output_key
+from .prompt_cache import anthropic_cache_control
+from .scheduler import ResultSet
+
+# Load environment variables from .env file
+load_dotenv()
+
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "batches")
+
+BASE_URLS = {
+    "openai": os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    "anthropic": os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com/v1"),
+    "gemini": os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+}
+
+# OpenRouter model names -> names on the provider's own API
+BATCH_MODEL_NAMES = {
+    "anthropic/claude-sonnet-4": "claude-sonnet-4-20250514",
+    "anthropic/claude-3.7-sonnet": "claude-3-7-sonnet-20250219",
+    "anthropic/claude-3.5-haiku": "claude-3-5-haiku-20241022",
+    "anthropic/claude-3.5-sonnet": "claude-3-5-sonnet-20241022",
+}
+
+# OpenRouter models the provider batch APIs don't serve: chatgpt-4o-latest is a moving alias that
+# only exists interactively, and batching gpt-4o instead would price and answer as another model
+NO_BATCH_MODELS = {"openai/chatgpt-4o-latest"}
+
+ANTHROPIC_VERSION = "2023-06-01"
+MAX_OUTPUT_TOKENS = 1024
+POLL_INTERVAL = 10.0       # first poll delay, seconds
+POLL_INTERVAL_MAX = 300.0  # polls back off up to this
+
+def configure(**base_urls):
+    """Override batch base URLs, e.g. configure(openai="http://127.0.0.1:8600/v1")"""
+    BASE_URLS.update({k: v for k, v in base_urls.items() if v})
+
+def batch_provider(model_id):
+    """Batch API used for a model: "gemini", "openai" or "anthropic" """
+    spec = get_spec(model_id)
+    if spec.name in NO_BATCH_MODELS:
+        raise ValueError(f"Model '{model_id}' ({spec.name}) has no batch API equivalent, run it interactively")
+    if spec.provider == "gemini":
+        return "gemini"
+    if spec.name.startswith("anthropic/"):
+        return "anthropic"
+    if spec.name.startswith("openai/"):
+        return "openai"
+    raise ValueError(f"No batch API for model '{model_id}'")
+
+def batch_model_name(model_id):
+    name = get_spec(model_id).name
+    return BATCH_MODEL_NAMES.get(name, name.split("/", 1)[-1])
+
+def url(provider, path):
+    return f"{BASE_URLS[provider].rstrip('/')}/{path.lstrip('/')}"
+
+def request_output(request):
+    """The request's OutputFormat as sent to its model"""
+    return request.output.for_model(get_spec(request.model_id)) if request.output is not None else None
+
+def camel_case(name):
+    head, *rest = name.split("_")
+    return head + "".join(word.title() for word in rest)
+
+def timeout():
+    settings = transport.get_settings()
+    return (settings["connect_timeout"], settings["read_timeout"])
+
+class OpenAIBatch:
+    """Files API upload + /v1/batches on /v1/chat/completions"""
+
+    provider = "openai"
+
+    def headers(self):
+        return {"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY')}"}
+
+    def job_line(self, custom_id, request):
+        content = [{"type": "text", "text": request.prompt}]
+        if request.image_path:
+            content.append({"type": "image_url", "image_url": {"url": image_data_url(request.image_path, request.preprocess)}})
+
+        messages = []
+        if request.system_instruction:
+            messages.append({"role": "system", "content": request.system_instruction})
+        messages.append({"role": "user", "content": content})
+
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": batch_model_name(request.model_id), "messages": messages, **openrouter_params(request_output(request))},
+        }
+
+    def submit(self, job_path, lines):
+        session = transport.get_session()
+        with open(job_path, "rb") as f:
+            response = session.post(url("openai", "files"), headers=self.headers(), data={"purpose": "batch"},
+                                    files={"file": (os.path.basename(job_path), f, "application/jsonl")}, timeout=timeout())
+        response.raise_for_status()
+
+        response = session.post(url("openai", "batches"), headers=self.headers(), timeout=timeout(), json={
+            "input_file_id": response.json()["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        })
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def poll(self, batch_id):
+        """Returns (done, status, batch object)"""
+        response = transport.get_session().get(url("openai", f"batches/{batch_id}"), headers=self.headers(), timeout=timeout())
+        response.raise_for_status()
+        batch = response.json()
+        return batch["status"] in ("completed", "failed", "expired", "cancelled"), batch["status"], batch
+
+    def results(self, batch):
+        """Yields (custom_id, ModelResponse or Exception, raw line)"""
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            response = transport.get_session().get(url("openai", f"files/{batch[file_key]}/content"), headers=self.headers(), timeout=timeout())
+            response.raise_for_status()
+
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                result = item.get("response") or {}
+                if item.get("error") or result.get("status_code") != 200:
+                    yield item["custom_id"], RuntimeError(f"Batch request failed: {item.get('error') or result.get('body')}"), item
+                    continue
+
+                body = result["body"]
+                usage = body.get("usage") or {}
+                yield item["custom_id"], ModelResponse(
+                    model_id="",
+                    text=body["choices"][0]["message"]["content"] or "",
+                    input_tokens=usage.get("prompt_tokens"),
+                    output_tokens=usage.get("completion_tokens"),
+                    total_tokens=usage.get("total_tokens"),
+                    cached_input_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+                    raw=body
+                ), item
+
+class AnthropicBatch:
+    """Message Batches API"""
+
+    provider = "anthropic"
+
+    def headers(self):
+        return {"x-api-key": os.environ.get("ANTHROPIC_API_KEY", ""), "anthropic-version": ANTHROPIC_VERSION}
+
+    def job_line(self, custom_id, request):
+        content = []
+        if request.image_path:
+            mime_type, data = image_bytes(request.image_path, request.preprocess)
+            content.append({"type": "image", "source": {"type": "base64", "media_type": mime_type, "data": base64.b64encode(data).decode("utf-8")}})
+        content.append({"type": "text", "text": request.prompt})
+
+        # The Messages API has no response schema, the cap and temperature still apply
+        output = request_output(request)
+        params = {
+            "model": batch_model_name(request.model_id),
+            "max_tokens": output.max_output_tokens if output is not None and output.max_output_tokens else MAX_OUTPUT_TOKENS,
+            "messages": [{"role": "user", "content": content}],
+        }
+        if output is not None and output.temperature is not None:
+            params["temperature"] = output.temperature
+        if request.system_instruction:
+            params["system"] = [{"type": "text", "text": request.system_instruction}]
+            cache_control = anthropic_cache_control(get_spec(request.model_id).name)
+            if cache_control:
+                params["system"][0]["cache_control"] = cache_control
+
+        return {"custom_id": custom_id, "params": params}
+
+    def submit(self, job_path, lines):
+        response = transport.get_session().post(url("anthropic", "messages/batches"), headers=self.headers(), json={"requests": lines}, timeout=timeout())
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def poll(self, batch_id):
+        response = transport.get_session().get(url("anthropic", f"messages/batches/{batch_id}"), headers=self.headers(), timeout=timeout())
+        response.raise_for_status()
+        batch = response.json()
+        return batch["processing_status"] == "ended", batch["processing_status"], batch
+
+    def results(self, batch):
+        response = transport.get_session().get(batch["results_url"], headers=self.headers(), timeout=timeout())
+        response.raise_for_status()
+
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = item["result"]
+            if result["type"] != "succeeded":
+                yield item["custom_id"], RuntimeError(f"Batch request {result['type']}: {result.get('error')}"), item
+                continue
+
+            message = result["message"]
+            usage = message.get("usage") or {}
+            # Anthropic reports cache reads and writes apart from input_tokens
+            cache_read, cache_write = usage.get("cache_read_input_tokens"), usage.get("cache_creation_input_tokens")
+            input_tokens = usage.get("input_tokens")
+            if input_tokens is not None:
+                input_tokens += (cache_read or 0) + (cache_write or 0)
+            output_tokens = usage.get("output_tokens")
+            yield item["custom_id"], ModelResponse(
+                model_id="",
+                text="".join(block.get("text", "") for block in message["content"] if block.get("type") == "text"),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=(input_tokens or 0) + (output_tokens or 0) if usage else None,
+                cached_input_tokens=cache_read,
+                cache_write_tokens=cache_write,
+                raw=message
+            ), item
+
+class GeminiBatch:
+    """Gemini Batch API (batchGenerateContent) with inlined requests, one batch per model"""
+
+    provider = "gemini"
+
+    def headers(self):
+        return {"x-goog-api-key": os.environ.get("GEMINI_API_KEY", "")}
+
+    def job_line(self, custom_id, request):
+        if request.video_path:
+            raise ValueError("Video requests are not supported in batch mode")
+
+        parts = [{"text": request.prompt}]
+        if request.image_path:
+            mime_type, data = image_bytes(request.image_path, request.preprocess)
+            parts.append({"inline_data": {"mime_type": mime_type, "data": base64.b64encode(data).decode("utf-8")}})
+
+        body = {"contents": [{"role": "user", "parts": parts}]}
+        if request.system_instruction:
+            body["system_instruction"] = {"parts": [{"text": request.system_instruction}]}
+        generation_config = gemini_generation_config(request_output(request))
+        if generation_config:
+            body["generationConfig"] = {camel_case(name): value for name, value in generation_config.items()}
+
+        return {"key": custom_id, "model": batch_model_name(request.model_id), "request": body}
+
+    def submit(self, job_path, lines):
+        model = lines[0]["model"]
+        response = transport.get_session().post(url("gemini", f"models/{model}:batchGenerateContent"), headers=self.headers(), timeout=timeout(), json={
+            "batch": {
+                "display_name": os.path.basename(os.path.dirname(job_path)),
+                "input_config": {"requests": {"requests": [{"request": line["request"], "metadata": {"key": line["key"]}} for line in lines]}},
+            }
+        })
+        response.raise_for_status()
+        return response.json()["name"]
+
+    def poll(self, batch_id):
+        response = transport.get_session().get(url("gemini", batch_id), headers=self.headers(), timeout=timeout())
+        response.raise_for_status()
+        batch = response.json()
+        state = (batch.get("metadata") or {}).get("state", "")
+        return bool(batch.get("done")), state, batch
+
+    def results(self, batch):
+        output = batch.get("response") or (batch.get("metadata") or {}).get("output") or {}
+        inlined = (output.get("inlinedResponses") or {}).get("inlinedResponses", [])
+
+        for item in inlined:
+            custom_id = (item.get("metadata") or {}).get("key")
+            if "error" in item or "response" not in item:
+                yield custom_id, RuntimeError(f"Batch request failed: {item.get('error')}"), item
+                continue
+
+            body = item["response"]
+            usage = body.get("usageMetadata") or {}
+            parts = ((body.get("candidates") or [{}])[0].get("content") or {}).get("parts", [])
+            yield custom_id, ModelResponse(
+                model_id="",
+                text="".join(part.get("text", "") for part in parts),
+                input_tokens=usage.get("promptTokenCount"),
+                output_tokens=usage.get("candidatesTokenCount"),
+                total_tokens=usage.get("totalTokenCount"),
+                cached_input_tokens=usage.get("cachedContentTokenCount"),
+                raw=body
+            ), item
+
+BACKENDS = {"openai": OpenAIBatch, "anthropic": AnthropicBatch, "gemini": GeminiBatch}
+
+def job_fingerprint(lines):
+    """Digest of a job's request lines, so a rerun can find the batch it already submitted"""
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(json.dumps(line, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def find_submitted(batch_root, job_name, fingerprint):
+    """Manifest path of an uncollected batch of the same requests submitted by an earlier run, or None"""
+    for manifest_path in sorted(glob.glob(os.path.join(batch_root, "*", job_name, "manifest.json")), reverse=True):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except ValueError:
+            continue
+        if manifest.get("fingerprint") == fingerprint and not manifest.get("collected"):
+            return manifest_path
+    return None
+
+def submit_job(backend, job_name, job_requests, batch_dir, resume=True):
+    """Write the job file and submit it, or re-attach to the same job an interrupted run submitted"""
+    # custom ids must be short and [a-zA-Z0-9_-], the manifest maps them back
+    entries, lines = {}, []
+    for i, (request, key) in enumerate(job_requests):
+        custom_id = f"req-{i}"
+        entries[custom_id] = {"model_id": request.model_id, "path": request.image_path or request.video_path, "cache_key": key}
+        lines.append(backend.job_line(custom_id, request))
+    fingerprint = job_fingerprint(lines)
+
+    manifest_path = find_submitted(os.path.dirname(os.path.abspath(batch_dir)), job_name, fingerprint) if resume else None
+    if manifest_path is not None:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        print(f"Re-attaching to {job_name} batch {manifest['batch_id']} submitted by an earlier run")
+        return manifest_path, manifest
+
+    job_dir = os.path.join(batch_dir, job_name)
+    os.makedirs(job_dir, exist_ok=True)
+    job_path = os.path.join(job_dir, "requests.jsonl")
+    with open(job_path, "w") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+
+    batch_id = backend.submit(job_path, lines)
+    manifest = {"batch_id": batch_id, "fingerprint": fingerprint, "submitted_at": time.time(), "collected": False, "requests": entries}
+    manifest_path = os.path.join(job_dir, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Submitted {len(lines)} requests to the {job_name} batch API as {batch_id}")
+    return manifest_path, manifest
+
+def wait_for_batches(jobs, poll_interval=POLL_INTERVAL, poll_interval_max=POLL_INTERVAL_MAX):
+    """
+    Poll submitted batches together, each with its own exponential backoff (and a little jitter),
+    yielding (job, status, batch) as each one finishes
+    """
+    next_poll = {name: time.time() for name in jobs}
+    delay = {name: poll_interval for name in jobs}
+    while next_poll:
+        name = min(next_poll, key=next_poll.get)
+        time.sleep(max(0.0, next_poll[name] - time.time()))
+
+        job = jobs[name]
+        done, status, batch = job["backend"].poll(job["manifest"]["batch_id"])
+        if done:
+            del next_poll[name]
+            yield job, status, batch
+            continue
+
+        print(f"Batch {job['manifest']['batch_id']} {status}, checking again in {delay[name]:.0f}s")
+        next_poll[name] = time.time() + delay[name] * random.uniform(0.9, 1.1)
+        delay[name] = min(poll_interval_max, delay[name] * 1.5)
+
+def run_batch(requests, batch_dir=None, poll_interval=POLL_INTERVAL, poll_interval_max=POLL_INTERVAL_MAX, use_cache=True, on_result=None, resume=True):
+    """
+    Run requests through the provider batch APIs, returns a ResultSet keyed like the scheduler's.
+
+    Requests already in the response cache are not submitted. One batch is submitted per
+    provider (and per model for Gemini), all of them before any is polled; they are then polled
+    together and collected as each finishes. A batch of the same requests that an interrupted run
+    submitted but never collected is re-attached to from its manifest instead of being paid for
+    again (resume=False always submits). on_result(key, response or exception) is called for
+    cached requests up front and for each batch as it finishes.
+    """
+    results = ResultSet()
+    cache = get_cache() if use_cache else None
+    batch_dir = batch_dir or os.path.join(BATCH_DIR, time.strftime("%Y%m%d_%H%M%S"))
+
+    # group what isn't cached by batch job
+    grouped = {}
+    for request in requests:
+        key = request_key(get_spec(request.model_id), request.system_instruction, request.prompt, request.image_path, request.video_path, request.preprocess, output_key(request.output)) if cache else None
+        cached = cache.get(key, request.cache_ttl) if cache else None
+        if cached is not None:
+            results.results[request.key] = cached
+            if on_result is not None:
+                on_result(request.key, cached)
+            continue
+
+        provider = batch_provider(request.model_id)
+        job = (provider, request.model_id) if provider == "gemini" else (provider, None)
+        grouped.setdefault(job, []).append((request, key))
+
+    if not grouped:
+        print(f"All {len(requests)} requests served from the response cache")
+        return results
+
+    # Submit every job first so their completion windows overlap
+    jobs = {}
+    for (provider, model_id), job_requests in grouped.items():
+        backend = BACKENDS[provider]()
+        job_name = f"{provider}_{model_id}" if model_id else provider
+        manifest_path, manifest = submit_job(backend, job_name, job_requests, batch_dir, resume)
+        jobs[job_name] = {"backend": backend, "manifest_path": manifest_path, "manifest": manifest}
+
+    for job, status, batch in wait_for_batches(jobs, poll_interval, poll_interval_max):
+        manifest, batch_id = job["manifest"], job["manifest"]["batch_id"]
+        elapsed = time.time() - manifest.get("submitted_at", time.time())
+        print(f"Batch {batch_id} finished with status {status} after {elapsed:.0f}s")
+
+        entries = manifest["requests"]
+        with open(os.path.join(os.path.dirname(job["manifest_path"]), "results.jsonl"), "w") as f:
+            for custom_id, result, raw in job["backend"].results(batch):
+                f.write(json.dumps(raw) + "\n")
+                entry = entries.get(custom_id)
+                if entry is None:
+                    continue
+
+                if isinstance(result, ModelResponse):
+                    result.model_id = entry["model_id"]
+                    result.timings = {"batch": elapsed}
+                    if cache and entry["cache_key"]:
+                        cache.put(entry["cache_key"], result)
+                results.results[(entry["model_id"], entry["path"])] = result
+
+        # anything the batch didn't return counts as failed
+        for entry in entries.values():
+            key = (entry["model_id"], entry["path"])
+            results.results.setdefault(key, RuntimeError(f"No result in batch {batch_id} (status {status})"))
+            if on_result is not None:
+                on_result(key, results.results[key])
+
+        # Collected: a rerun submits anew rather than re-attaching
+        manifest["collected"] = True
+        with open(job["manifest_path"], "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    return results
@@ -0,0 +1,154 @@
+"""
+Content-addressed response cache for model calls.
+
+Responses are stored in SQLite under a sha256 of (provider, model, system instruction, prompt,
+image/video content hash, preprocessing, generation params), together with their usage and
+timings, so re-running a sweep after a scoring or post-processing change costs nothing. Entries
+older than the TTL are treated as misses. generate(..., use_cache=False) bypasses the cache,
+RESPONSE_CACHE=0 turns it off everywhere.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .payload import file_hash
+
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "responses.sqlite"))
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 30 * 24 * 3600))  # seconds
+
+def request_key(spec, system_instruction, prompt, image_path=None, video_path=None, preprocess=None, params=None, images=None):
+    """sha256 identifying a request by content, not by file path"""
+    parts = {
+        "provider": spec.provider,
+        "model": spec.name,
+        "system_instruction": system_instruction,
+        "prompt": prompt,
+        "image": file_hash(image_path) if image_path else None,
+        "video": file_hash(video_path) if video_path else None,
+        "images": [[label, file_hash(path)] for label, path in images] if images else None,
+        "preprocess": preprocess.key() if preprocess is not None and not preprocess.is_noop() else None,
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def raw_to_json(raw):
+    """JSON-serializable form of a provider response (OpenRouter dicts as-is, Gemini via to_dict)"""
+    if raw is None or isinstance(raw, (dict, list)):
+        return raw
+    if hasattr(type(raw), "to_dict"):
+        try:
+            return type(raw).to_dict(raw)
+        except Exception:
+            pass
+    if hasattr(raw, "to_dict"):
+        try:
+            return raw.to_dict()
+        except Exception:
+            pass
+    return None
+
+class ResponseCache:
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def connection(self):
+        """One connection per thread, sqlite3 connections can't be shared across threads"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model_id TEXT,
+                    text TEXT,
+                    input_tokens INTEGER,
+                    output_tokens INTEGER,
+                    total_tokens INTEGER,
+                    timings TEXT,
+                    raw TEXT,
+                    created_at REAL,
+                    cached_input_tokens INTEGER,
+                    cache_write_tokens INTEGER
+                )
+            """)
+            # caches created before prompt caching was tracked
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+            for column in ("cached_input_tokens", "cache_write_tokens"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE responses ADD COLUMN {column} INTEGER")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key, ttl=None):
+        """Cached ModelResponse for key, or None on a miss or an expired entry"""
+        from .client import ModelResponse
+
+        ttl = self.ttl if ttl is None else ttl
+        row = self.connection().execute(
+            "SELECT model_id, text, input_tokens, output_tokens, total_tokens, timings, raw, created_at, cached_input_tokens, cache_write_tokens FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        if row is None or (ttl and time.time() - row[7] > ttl):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return ModelResponse(
+            model_id=row[0],
+            text=row[1],
+            input_tokens=row[2],
+            output_tokens=row[3],
+            total_tokens=row[4],
+            cached_input_tokens=row[8],
+            cache_write_tokens=row[9],
+            timings=json.loads(row[5]),
+            raw=json.loads(row[6]) if row[6] else None,
+            cached=True
+        )
+
+    def put(self, key, response):
+        raw = raw_to_json(response.raw)
+        conn = self.connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model_id, text, input_tokens, output_tokens, total_tokens, timings, raw, created_at, cached_input_tokens, cache_write_tokens) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, response.model_id, response.text, response.input_tokens, response.output_tokens, response.total_tokens,
+             json.dumps(response.timings), json.dumps(raw) if raw is not None else None, time.time(),
+             response.cached_input_tokens, response.cache_write_tokens)
+        )
+        conn.commit()
+
+    def purge_expired(self, ttl=None):
+        """Delete entries older than the TTL, returns how many were removed"""
+        ttl = self.ttl if ttl is None else ttl
+        conn = self.connection()
+        deleted = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,)).rowcount
+        conn.commit()
+        return deleted
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Shared ResponseCache, None when caching is disabled"""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
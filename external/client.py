@@ -0,0 +1,166 @@
+"""
+Single entry point for every vision LLM used in the evaluations.
+
+Models are addressed by the same IDs the result files are named after (e.g. "gemini_2_0_flash",
+"claude_sonnet_4", "gpt_4o"). Every call returns a ModelResponse with the text, token usage and
+timings, whatever the provider. Timings (seconds) always include "total"; "connect" is the time
+spent opening a connection (OpenRouter, 0 on a reused one), "upload" the Gemini video upload and
+"ttft" the time to first token of a streamed request (see external/latency.py). input_tokens
+includes the prompt tokens served from the provider's prompt cache, cached_input_tokens and
+cache_write_tokens tell them apart for pricing (see external/prompt_cache.py).
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+@dataclass(frozen=True)
+class ModelSpec:
+    provider: str  # "gemini" or "openrouter"
+    name: str      # provider-side model name
+    reasoning: bool = False  # thinks before answering, its output tokens include the thinking
+
+@dataclass
+class ModelResponse:
+    model_id: str
+    text: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    cached_input_tokens: Optional[int] = None  # input tokens read from the provider's prompt cache
+    cache_write_tokens: Optional[int] = None   # input tokens written to it (Anthropic)
+    timings: Dict[str, float] = field(default_factory=dict)
+    raw: Any = None
+    cached: bool = False  # served from the response cache, timings are from the original call
+
+MODELS: Dict[str, ModelSpec] = {
+    # Gemini
+    "gemini_2_5_pro_preview": ModelSpec("gemini", "gemini-2.5-pro-preview-05-06", reasoning=True),
+    "gemini_2_5_flash_preview": ModelSpec("gemini", "gemini-2.5-flash-preview-05-20", reasoning=True),
+    "gemini_2_0_flash": ModelSpec("gemini", "gemini-2.0-flash"),
+    "gemini_1_5_flash": ModelSpec("gemini", "gemini-1.5-flash"),
+    "gemini_1_5_pro": ModelSpec("gemini", "gemini-1.5-pro"),
+    # Claude via OpenRouter
+    "claude_sonnet_4": ModelSpec("openrouter", "anthropic/claude-sonnet-4"),
+    "claude_3_7_sonnet": ModelSpec("openrouter", "anthropic/claude-3.7-sonnet"),
+    "claude_3_5_haiku": ModelSpec("openrouter", "anthropic/claude-3.5-haiku"),
+    "claude_3_5_sonnet": ModelSpec("openrouter", "anthropic/claude-3.5-sonnet"),
+    # OpenAI via OpenRouter
+    "o4_mini": ModelSpec("openrouter", "openai/o4-mini", reasoning=True),
+    "gpt_4_1": ModelSpec("openrouter", "openai/gpt-4.1"),
+    "gpt_4_1_mini": ModelSpec("openrouter", "openai/gpt-4.1-mini"),
+    "gpt_4o": ModelSpec("openrouter", "openai/chatgpt-4o-latest"),
+}
+
+def get_spec(model_id):
+    """Look up a model by ID, raising a helpful error for unknown IDs"""
+    if model_id not in MODELS:
+        raise ValueError(f"Unknown model '{model_id}'. Available models: {', '.join(MODELS)}")
+    return MODELS[model_id]
+
+def cached_response(model_id, system_instruction, prompt, image_path=None, video_path=None, preprocess=None, cache_ttl=None, images=None, output=None):
+    """Return (cached ModelResponse or None, cache key or None when caching is off)"""
+    from .cache import get_cache, request_key
+    from .output import output_key
+
+    cache = get_cache()
+    if cache is None:
+        return None, None
+
+    key = request_key(get_spec(model_id), system_instruction, prompt, image_path, video_path, preprocess, output_key(output), images)
+    return cache.get(key, cache_ttl), key
+
+def store_response(key, response):
+    from .cache import get_cache
+
+    if key is not None:
+        get_cache().put(key, response)
+
+def generate(model_id, system_instruction, prompt, image_path=None, video_path=None, count_tokens=False, preprocess=None, use_cache=True, cache_ttl=None, images=None, stream=False, output=None):
+    """
+    Run one request against any registered model.
+
+    Args:
+        model_id (str): Key of MODELS
+        system_instruction (str): System prompt
+        prompt (str): User prompt
+        image_path (str): Optional image to attach
+        video_path (str): Optional video to attach (Gemini only)
+        count_tokens (bool): Gemini only, pre-count input tokens before generating
+            (an extra round-trip, off by default)
+        preprocess (Preprocess): Optional crop/grayscale/downscale applied to the image
+        use_cache (bool): Read through the response cache (external/cache.py); False always
+            calls the model and doesn't store the result
+        cache_ttl (float): Max age in seconds of a cached response, defaults to RESPONSE_CACHE_TTL
+        images (list): Optional (label, image path) pairs sent in one request, each image
+            preceded by its label (see external/packing.py)
+        stream (bool): Stream the response to record time to first token ("ttft")
+        output (OutputFormat): Optional response schema, output-token cap and temperature
+            (see external/output.py)
+
+    Returns:
+        ModelResponse: Normalized text, usage and timings
+    """
+    key = None
+    if use_cache:
+        response, key = cached_response(model_id, system_instruction, prompt, image_path, video_path, preprocess, cache_ttl, images, output)
+        if response is not None:
+            return response
+
+    response = call_provider(model_id, system_instruction, prompt, image_path, video_path, count_tokens, preprocess, images, stream, output)
+    store_response(key, response)
+    return response
+
+def call_provider(model_id, system_instruction, prompt, image_path=None, video_path=None, count_tokens=False, preprocess=None, images=None, stream=False, output=None):
+    """Send the request to the model's provider, bypassing the cache"""
+    spec = get_spec(model_id)
+    output = output.for_model(spec) if output is not None else None
+
+    if spec.provider == "gemini":
+        from .providers import gemini
+        return gemini.generate(model_id, spec.name, system_instruction, prompt, image_path, video_path, count_tokens, preprocess, images, stream, output)
+
+    if spec.provider == "openrouter":
+        from .providers import openrouter
+        if video_path:
+            print(f"Warning: Video processing not supported for {model_id}")
+        return openrouter.generate(model_id, spec.name, system_instruction, prompt, image_path, preprocess, images, stream, output)
+
+    raise ValueError(f"Unknown provider '{spec.provider}' for model '{model_id}'")
+
+async def agenerate(model_id, system_instruction, prompt, image_path=None, video_path=None, async_transport=None, preprocess=None, use_cache=True, cache_ttl=None, images=None, output=None):
+    """
+    Async variant of generate for running many requests concurrently.
+
+    Args:
+        async_transport (AsyncTransport): Shared connection pool for OpenRouter models;
+            a temporary one is opened per call if not given
+        preprocess (Preprocess): Optional crop/grayscale/downscale applied to the image
+        use_cache (bool), cache_ttl (float), images (list), output (OutputFormat): See generate
+
+    Returns:
+        ModelResponse: Normalized text, usage and timings
+    """
+    spec = get_spec(model_id)
+    provider_output = output.for_model(spec) if output is not None else None
+
+    key = None
+    if use_cache:
+        response, key = cached_response(model_id, system_instruction, prompt, image_path, video_path, preprocess, cache_ttl, images, output)
+        if response is not None:
+            return response
+
+    if spec.provider == "gemini":
+        from .providers import gemini
+        response = await gemini.agenerate(model_id, spec.name, system_instruction, prompt, image_path, video_path, preprocess, images, provider_output)
+
+    elif spec.provider == "openrouter":
+        from .providers import openrouter
+        if video_path:
+            print(f"Warning: Video processing not supported for {model_id}")
+        response = await openrouter.agenerate(model_id, spec.name, system_instruction, prompt, image_path, async_transport, preprocess, images, provider_output)
+
+    else:
+        raise ValueError(f"Unknown provider '{spec.provider}' for model '{model_id}'")
+
+    store_response(key, response)
+    return response
@@ -0,0 +1,200 @@
+"""
+Hedged requests for latency-bound use cases.
+
+A request goes to its primary model; if no answer has come back once the primary's recent latency
+percentile (p95 by default) has passed, or the answer fails validation, the same request is also
+sent to a backup model, ideally on another provider, and the first valid answer wins. The other
+request is cancelled. Requests run as asyncio tasks on a background event loop, so cancelling
+really closes the connection instead of leaving a thread waiting on it:
+
+    with Hedger({"gemini_2_0_flash": "gpt_4_1_mini"}) as hedger:
+        response = hedger.generate("gemini_2_0_flash", SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=p, validate=is_valid)
+        print(hedger.summary())  # hedge rate, backup wins, cost overhead
+
+The returned response's timings["total"] is the wall time of the hedged call.
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import replace
+
+from .client import agenerate
+from .latency import percentile
+from .pricing import response_cost
+from .transport import AsyncTransport
+
+HEDGE_PERCENTILE = 95       # hedge once the primary is slower than this percentile of its recent requests
+INITIAL_HEDGE_AFTER = 3.0   # seconds, until a model has MIN_SAMPLES latencies
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 200        # recent latencies kept per model
+
+class Hedger:
+
+    def __init__(self, backups, hedge_percentile=HEDGE_PERCENTILE, initial_hedge_after=INITIAL_HEDGE_AFTER, min_samples=MIN_SAMPLES):
+        self.backups = dict(backups)
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_after = initial_hedge_after
+        self.min_samples = min_samples
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.costs = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self.lock = threading.Lock()
+
+        self.requests = 0        # hedge-enabled requests
+        self.hedged = 0          # ... that fired a backup
+        self.backup_wins = 0
+        self.cancelled = 0
+        self.cost = 0.0          # cost of the hedge-enabled requests, losers included
+        self.overhead_cost = 0.0 # completed losers plus an estimate for cancelled requests
+
+        self.loop = None
+        self.thread = None
+        self.transport = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """Start the background event loop and its connection pool"""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.transport = AsyncTransport()
+
+    def close(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.transport.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def hedge_after(self, model_id):
+        """Seconds to wait for the primary before firing the backup"""
+        with self.lock:
+            samples = list(self.latencies[model_id])
+        if len(samples) < self.min_samples:
+            return self.initial_hedge_after
+        return percentile(samples, self.hedge_percentile)
+
+    def record(self, model_id, elapsed, response=None):
+        """Latency of a finished call, or the elapsed time of a cancelled one (response None)"""
+        with self.lock:
+            self.latencies[model_id].append(elapsed)
+            if response is not None:
+                self.costs[model_id].append(response_cost(response))
+
+    def expected_cost(self, model_id):
+        with self.lock:
+            costs = list(self.costs[model_id])
+        return sum(costs) / len(costs) if costs else 0.0
+
+    async def call(self, model_id, system_instruction, prompt, image_path, preprocess, use_cache, output):
+        start = time.perf_counter()
+        try:
+            response = await agenerate(model_id, system_instruction, prompt, image_path=image_path, async_transport=self.transport,
+                                       preprocess=preprocess, use_cache=use_cache, output=output)
+        except asyncio.CancelledError:
+            # The losing call would have taken at least this long; leaving it out would drop exactly the
+            # slow tail from hedge_after's percentile and pull the threshold down over a run
+            self.record(model_id, time.perf_counter() - start)
+            raise
+        self.record(model_id, time.perf_counter() - start, response)
+        return response
+
+    async def ahedged(self, model_id, system_instruction, prompt, image_path=None, preprocess=None, use_cache=True, validate=None, hedge=True, output=None):
+        """Run the request hedged against the model's backup, returns the first valid ModelResponse"""
+        start = time.perf_counter()
+        backup_id = self.backups.get(model_id) if hedge else None
+
+        def launch(target):
+            return asyncio.ensure_future(self.call(target, system_instruction, prompt, image_path, preprocess, use_cache, output))
+
+        tasks = {launch(model_id): model_id}
+        pending = set(tasks)
+        timeout = self.hedge_after(model_id) if backup_id else None
+        fired = False
+        winner, fallback, error = None, None, None
+        spent, losers_cost = 0.0, 0.0
+
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                try:
+                    response = task.result()
+                except Exception as e:
+                    error = e
+                    continue
+                spent += response_cost(response)
+                if winner is None and (validate is None or validate(response.text)):
+                    winner = response
+                else:
+                    losers_cost += response_cost(response)
+                    fallback = fallback or response
+
+            # Hedge when the primary is late, failed or gave an invalid answer
+            if winner is None and backup_id and not fired:
+                backup = launch(backup_id)
+                tasks[backup] = backup_id
+                pending.add(backup)
+                fired = True
+                timeout = None
+
+        for task in pending:
+            task.cancel()
+            losers_cost += self.expected_cost(tasks[task])
+
+        if backup_id:
+            with self.lock:
+                self.requests += 1
+                self.hedged += fired
+                self.backup_wins += winner is not None and winner.model_id == backup_id
+                self.cancelled += len(pending)
+                self.cost += spent
+                self.overhead_cost += losers_cost if fired else 0.0
+
+        result = winner or fallback
+        if result is None:
+            raise error
+        return replace(result, timings=dict(result.timings, total=time.perf_counter() - start))
+
+    def generate(self, model_id, system_instruction, prompt, image_path=None, preprocess=None, use_cache=True, validate=None, hedge=True, output=None):
+        """
+        Blocking hedged request, safe to call from several threads.
+
+        Args:
+            model_id (str): Primary model, hedged to backups[model_id] if it has one
+            validate (callable): Optional raw text -> bool; invalid answers don't win and
+                trigger the backup straight away
+            hedge (bool): False sends the primary only (same path, for comparisons)
+            output (OutputFormat): Optional response schema and output-token cap, see external/output.py
+
+        Returns:
+            ModelResponse: The winning response, model_id tells which model answered
+        """
+        self.start()
+        coroutine = self.ahedged(model_id, system_instruction, prompt, image_path, preprocess, use_cache, validate, hedge, output)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def summary(self):
+        hedge_after = {model_id: self.hedge_after(model_id) for model_id in self.backups}
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+                "backup_wins": self.backup_wins,
+                "cancelled": self.cancelled,
+                "cost": self.cost,
+                "overhead_cost": self.overhead_cost,
+                "overhead": self.overhead_cost / self.cost if self.cost else 0.0,
+                "hedge_after": hedge_after,
+            }
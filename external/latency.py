@@ -0,0 +1,72 @@
+"""
+Latency summaries for the latency scripts.
+
+Every ModelResponse carries its own timings, measured around the provider call only (no progress
+bar, JSON writes or scheduler queueing): "connect", "upload", "ttft" and "total", see
+external/client.py. These are summarized per model as p50/p95/p99, next to the output tokens:
+
+    report = latency_report({model_id: [(image_path, response), ...]})
+"""
+
+import os
+import statistics
+
+TIMING_KEYS = ["connect", "upload", "ttft", "total"]
+PERCENTILES = [50, 95, 99]
+
+def percentile(values, q):
+    """Nearest-rank percentile, 0.0 for no values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def describe(values):
+    summary = {"count": len(values), "mean": statistics.mean(values) if values else 0.0}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(values, q)
+    return summary
+
+def summarize(responses):
+    """Per timing (and output tokens): count, mean, p50, p95, p99 over the responses that recorded it"""
+    summary = {}
+    for key in TIMING_KEYS:
+        values = [r.timings[key] for r in responses if r.timings.get(key) is not None]
+        if values:
+            summary[key] = describe(values)
+
+    output_tokens = [r.output_tokens for r in responses if r.output_tokens is not None]
+    if output_tokens:
+        summary["output_tokens"] = describe(output_tokens)
+    return summary
+
+def request_record(path, response):
+    """Per-request timings and output tokens, as saved in the latency reports"""
+    record = {"file": os.path.basename(path) if path else None}
+    record.update({key: response.timings[key] for key in TIMING_KEYS if key in response.timings})
+    record["output_tokens"] = response.output_tokens
+    return record
+
+def print_summary(model_id, summary):
+    print(f"\nLatency for {model_id} ({summary.get('total', {}).get('count', 0)} requests)")
+    print(f"{'':<15}{'MEAN':>10}" + "".join(f"{f'P{q}':>10}" for q in PERCENTILES))
+    for key, stats in summary.items():
+        unit = "" if key == "output_tokens" else " (s)"
+        print(f"{key + unit:<15}{stats['mean']:>10.3f}" + "".join(f"{stats[f'p{q}']:>10.3f}" for q in PERCENTILES))
+
+def latency_report(results):
+    """
+    Summarize and print per-model latency.
+
+    Args:
+        results (dict): model_id -> list of (image/video path, ModelResponse)
+
+    Returns:
+        dict: model_id -> {"summary": ..., "requests": [per-request records]}
+    """
+    report = {}
+    for model_id, pairs in results.items():
+        summary = summarize([response for _, response in pairs])
+        print_summary(model_id, summary)
+        report[model_id] = {"summary": summary, "requests": [request_record(path, response) for path, response in pairs]}
+    return report
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the provider APIs used by the client layer.
+
+- OpenRouter chat completions: POST /api/v1/chat/completions (server-sent events with "stream": true)
+- OpenAI batches: POST /v1/files, POST /v1/batches, GET /v1/batches/<id>, GET /v1/files/<id>/content
+- Anthropic message batches: POST /v1/messages/batches, GET /v1/messages/batches/<id>[/results]
+- Gemini batches: POST /v1beta/models/<model>:batchGenerateContent, GET /v1beta/batches/<id>
+
+Every request gets the same canned reply (with usage), or reply(prompt) when reply is a function of
+the request's prompt text, after an optional artificial latency, over HTTP/1.1 keep-alive; batches
+finish after `batch_polls` status checks and return their results out of order, as providers may. It counts requests and TCP
+connections, so connection reuse by the transport can be checked:
+
+    python -m external.mock_server --port 8600 --latency 0.2
+
+    from external import batch, transport
+    transport.configure(base_url="http://127.0.0.1:8600/api/v1")
+    batch.configure(openai="http://127.0.0.1:8600/v1", anthropic="http://127.0.0.1:8600/v1", gemini="http://127.0.0.1:8600/v1beta")
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockState:
+    """Canned reply, batch jobs and counters shared by the handler threads"""
+
+    def __init__(self, reply="1234", latency=0.0, status=200, batch_polls=1):
+        self.reply = reply
+        self.latency = latency
+        self.status = status
+        self.batch_polls = batch_polls
+        self.requests = 0
+        self.connections = 0
+        self.files = {}
+        self.batches = {}
+        self.prefixes = set()  # prompt-cache prefixes seen, see cache_usage
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}{next(self.ids)}"
+
+    def reply_for(self, messages):
+        """Reply to a request's messages (or Gemini contents)"""
+        return self.reply(prompt_text(messages)) if callable(self.reply) else self.reply
+
+    def usage(self, request, reply):
+        prompt_tokens = len(json.dumps(request)) // 4
+        completion_tokens = max(1, len(reply) // 4)
+        return prompt_tokens, completion_tokens
+
+    def cache_usage(self, messages):
+        """prompt_tokens_details for a request: messages up to the last cache_control are a write the first time, a read after"""
+        prefix = []
+        for index, message in enumerate(messages):
+            parts = message.get("content") if isinstance(message.get("content"), list) else []
+            for i, part in enumerate(parts):
+                if "cache_control" in part:
+                    prefix = messages[:index] + [dict(message, content=parts[:i + 1])]
+        if not prefix:
+            return {}
+
+        key = json.dumps(prefix, sort_keys=True)
+        tokens = len(key) // 4
+        with self.lock:
+            seen = key in self.prefixes
+            self.prefixes.add(key)
+        return {"cached_tokens": tokens} if seen else {"cached_tokens": 0, "cache_write_tokens": tokens}
+
+def prompt_text(messages):
+    """Text parts of the last message of OpenAI/Anthropic messages or Gemini contents"""
+    message = messages[-1] if messages else {}
+    parts = message.get("content", message.get("parts", []))
+    if isinstance(parts, str):
+        return parts
+    return " ".join(part["text"] for part in parts if isinstance(part, dict) and "text" in part)
+
+def parse_multipart_file(body, content_type):
+    """Content of the first file part of a multipart/form-data body"""
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+    for part in body.split(b"--" + boundary):
+        headers, _, content = part.partition(b"\r\n\r\n")
+        if b"filename=" in headers:
+            return content.rsplit(b"\r\n", 1)[0]
+    return b""
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def send_body(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, body):
+        self.send_body(status, json.dumps(body).encode(), "application/json")
+
+    def send_stream(self, completion):
+        """Send a completion as server-sent events: a keep-alive comment, content deltas, usage, [DONE]"""
+        events = [b": OPENROUTER PROCESSING\n\n"]
+        content = completion["choices"][0]["message"]["content"]
+        for i in range(0, len(content), 4):
+            delta = {"id": completion["id"], "model": completion["model"], "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}}]}
+            events.append(f"data: {json.dumps(delta)}\n\n".encode())
+        usage = {"id": completion["id"], "model": completion["model"], "choices": [], "usage": completion["usage"]}
+        events.append(f"data: {json.dumps(usage)}\n\n".encode())
+        events.append(b"data: [DONE]\n\n")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(sum(len(e) for e in events)))
+        self.end_headers()
+        for event in events:
+            self.wfile.write(event)
+            self.wfile.flush()
+
+    def begin(self):
+        """Count the request and apply the artificial latency, False if the configured status is an error"""
+        with self.state.lock:
+            self.state.requests += 1
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if self.state.status != 200:
+            self.send_json(self.state.status, {"error": {"message": "mock error", "code": self.state.status}})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if not self.begin():
+            return
+
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path.endswith("/chat/completions"):
+            request = json.loads(body or b"{}")
+            if request.get("stream"):
+                self.send_stream(self.chat_completion(request))
+            else:
+                self.send_json(200, self.chat_completion(request))
+        elif path == "/v1/files":
+            file_id = self.state.new_id("file-")
+            self.state.files[file_id] = parse_multipart_file(body, self.headers.get("Content-Type", "")).decode()
+            self.send_json(200, {"id": file_id, "object": "file", "purpose": "batch"})
+        elif path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = self.state.new_id("batch_")
+            self.state.batches[batch_id] = {"kind": "openai", "input": self.state.files[request["input_file_id"]], "polls": 0}
+            self.send_json(200, {"id": batch_id, "object": "batch", "status": "validating"})
+        elif path == "/v1/messages/batches":
+            batch_id = self.state.new_id("msgbatch_")
+            self.state.batches[batch_id] = {"kind": "anthropic", "input": json.loads(body)["requests"], "polls": 0}
+            self.send_json(200, {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"})
+        elif re.fullmatch(r"/v1beta/models/[^/]+:batchGenerateContent", path):
+            batch_id = self.state.new_id("batches/")
+            requests = json.loads(body)["batch"]["input_config"]["requests"]["requests"]
+            self.state.batches[batch_id] = {"kind": "gemini", "input": requests, "polls": 0}
+            self.send_json(200, {"name": batch_id, "metadata": {"state": "BATCH_STATE_PENDING"}})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        if not self.begin():
+            return
+
+        path = self.path.split("?")[0].rstrip("/")
+        host, port = self.server.server_address[:2]
+
+        match = re.fullmatch(r"/v1/batches/([^/]+)", path)
+        if match and match.group(1) in self.state.batches:
+            batch_id = match.group(1)
+            if not self.poll(batch_id):
+                self.send_json(200, {"id": batch_id, "status": "in_progress"})
+                return
+            output_id = f"file-out-{batch_id}"
+            self.state.files[output_id] = self.openai_results(self.state.batches[batch_id]["input"])
+            self.send_json(200, {"id": batch_id, "status": "completed", "output_file_id": output_id, "error_file_id": None})
+            return
+
+        match = re.fullmatch(r"/v1/files/([^/]+)/content", path)
+        if match and match.group(1) in self.state.files:
+            self.send_body(200, self.state.files[match.group(1)].encode(), "application/jsonl")
+            return
+
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)(/results)?", path)
+        if match and match.group(1) in self.state.batches:
+            batch_id = match.group(1)
+            if match.group(2):
+                self.send_body(200, self.anthropic_results(self.state.batches[batch_id]["input"]).encode(), "application/jsonl")
+                return
+            if not self.poll(batch_id):
+                self.send_json(200, {"id": batch_id, "processing_status": "in_progress"})
+                return
+            self.send_json(200, {"id": batch_id, "processing_status": "ended", "results_url": f"http://{host}:{port}/v1/messages/batches/{batch_id}/results"})
+            return
+
+        match = re.fullmatch(r"/v1beta/(batches/[^/]+)", path)
+        if match and match.group(1) in self.state.batches:
+            batch_id = match.group(1)
+            if not self.poll(batch_id):
+                self.send_json(200, {"name": batch_id, "metadata": {"state": "BATCH_STATE_RUNNING"}, "done": False})
+                return
+            self.send_json(200, {
+                "name": batch_id,
+                "metadata": {"state": "BATCH_STATE_SUCCEEDED"},
+                "done": True,
+                "response": {"inlinedResponses": {"inlinedResponses": self.gemini_results(self.state.batches[batch_id]["input"])}},
+            })
+            return
+
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def poll(self, batch_id):
+        """Count a status check, True once the batch is finished"""
+        with self.state.lock:
+            batch = self.state.batches[batch_id]
+            batch["polls"] += 1
+            return batch["polls"] >= self.state.batch_polls
+
+    def chat_completion(self, request):
+        reply = self.state.reply_for(request.get("messages", []))
+        prompt_tokens, completion_tokens = self.state.usage(request.get("messages", []), reply)
+        return {
+            "id": self.state.new_id("mock-"),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": self.state.cache_usage(request.get("messages", [])),
+            },
+        }
+
+    def openai_results(self, jsonl):
+        lines = []
+        for line in reversed(jsonl.splitlines()):  # batch results aren't in request order
+            if line.strip():
+                item = json.loads(line)
+                lines.append(json.dumps({"custom_id": item["custom_id"], "response": {"status_code": 200, "body": self.chat_completion(item["body"])}, "error": None}))
+        return "\n".join(lines) + "\n"
+
+    def anthropic_results(self, requests):
+        lines = []
+        for item in reversed(requests):
+            reply = self.state.reply_for(item["params"]["messages"])
+            input_tokens, output_tokens = self.state.usage(item["params"], reply)
+            message = {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": reply}],
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+            lines.append(json.dumps({"custom_id": item["custom_id"], "result": {"type": "succeeded", "message": message}}))
+        return "\n".join(lines) + "\n"
+
+    def gemini_results(self, requests):
+        results = []
+        for item in reversed(requests):
+            reply = self.state.reply_for(item["request"]["contents"])
+            prompt_tokens, completion_tokens = self.state.usage(item["request"], reply)
+            results.append({
+                "metadata": item.get("metadata"),
+                "response": {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}}],
+                    "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens, "totalTokenCount": prompt_tokens + completion_tokens},
+                },
+            })
+        return results
+
+def start_mock_server(host="127.0.0.1", port=0, reply="1234", latency=0.0, status=200, batch_polls=1):
+    """Serve on a background thread (port 0 picks a free port), returns (server, state)"""
+    state = MockState(reply, latency, status, batch_polls)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, state
+
+def base_url(server, api="openrouter"):
+    """Base URL of the mock for "openrouter", "openai", "anthropic" or "gemini" """
+    host, port = server.server_address[:2]
+    prefix = {"openrouter": "/api/v1", "openai": "/v1", "anthropic": "/v1", "gemini": "/v1beta"}[api]
+    return f"http://{host}:{port}{prefix}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter and provider batch APIs.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--reply", type=str, default="1234", help="content returned for every request")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with (e.g. 429)")
+    parser.add_argument("--batch-polls", type=int, default=1, help="status checks before a batch reports finished")
+    args = parser.parse_args()
+
+    server, state = start_mock_server(args.host, args.port, args.reply, args.latency, args.status, args.batch_polls)
+    for api in ("openrouter", "openai", "anthropic", "gemini"):
+        print(f"Mock {api} at {base_url(server, api)}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"requests: {state.requests}, connections: {state.connections}, batches: {len(state.batches)}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
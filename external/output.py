@@ -0,0 +1,115 @@
+"""
+Constrained output for a request: a response schema, an output-token cap and deterministic decoding.
+
+Free-text answers need cleanup (stray words, markdown, "The coil ID is ...") and every extra word
+costs output tokens and generation time. An OutputFormat asks the provider to decode into a JSON
+schema (or a string enum) at temperature 0 and stop after max_output_tokens:
+
+    OUTPUT = OutputFormat(schema={"type": "object", "properties": {"coil_id": {"type": "string"}},
+                                  "required": ["coil_id"], "additionalProperties": False},
+                          max_output_tokens=32)
+    response = generate("gemini_2_0_flash", SYSTEM_INSTRUCTION, TEST_PROMPT, image_path, output=OUTPUT)
+    parse_json(response.text)["coil_id"]
+
+Schemas are written once in the JSON Schema subset both sides accept (object/string/number/
+boolean/array, enum, required, additionalProperties false) and translated per provider: Gemini
+response_schema, OpenRouter response_format json_schema (strict). Models that think before
+answering (ModelSpec.reasoning) spend output tokens on it, so the cap isn't applied to them.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Optional
+
+@dataclass(frozen=True)
+class OutputFormat:
+    schema: Optional[Any] = field(default=None, hash=False)  # JSON schema dict, None for free text
+    max_output_tokens: Optional[int] = None
+    temperature: Optional[float] = 0.0
+    name: str = "answer"  # schema name, OpenAI requires one
+
+    def is_noop(self):
+        return self.schema is None and self.max_output_tokens is None and self.temperature is None
+
+    def key(self):
+        """Stable description of the parameters, used in response cache keys"""
+        return json.dumps(asdict(self), sort_keys=True)
+
+    def for_model(self, spec):
+        """The format as sent to a model, without the token cap for reasoning models"""
+        if spec.reasoning and self.max_output_tokens is not None:
+            return replace(self, max_output_tokens=None)
+        return self
+
+def output_key(output):
+    """Cache-key params for an OutputFormat, None (the pre-structured-output key) when there's none"""
+    if output is None or output.is_noop():
+        return None
+    return {"output": output.key()}
+
+def is_enum(schema):
+    return isinstance(schema, dict) and schema.get("type") == "string" and "enum" in schema
+
+def gemini_schema(schema):
+    """Gemini response_schema: upper-case types, no additionalProperties"""
+    if isinstance(schema, list):
+        return [gemini_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    converted = {}
+    for key, value in schema.items():
+        if key == "additionalProperties":
+            continue
+        if key == "type" and isinstance(value, str):
+            converted[key] = value.upper()
+        elif key == "properties":
+            converted[key] = {name: gemini_schema(prop) for name, prop in value.items()}
+        else:
+            converted[key] = gemini_schema(value)
+    return converted
+
+def gemini_generation_config(output):
+    """generation_config kwargs for generate_content"""
+    if output is None:
+        return None
+
+    config = {}
+    if output.schema is not None:
+        config["response_mime_type"] = "text/x.enum" if is_enum(output.schema) else "application/json"
+        config["response_schema"] = gemini_schema(output.schema)
+    if output.max_output_tokens is not None:
+        config["max_output_tokens"] = output.max_output_tokens
+    if output.temperature is not None:
+        config["temperature"] = output.temperature
+    return config or None
+
+def openrouter_params(output):
+    """Chat completions body fields for the format"""
+    if output is None:
+        return {}
+
+    params = {}
+    if output.schema is not None:
+        schema = output.schema
+        if is_enum(schema):
+            # json_schema needs an object at the top level
+            schema = {"type": "object", "properties": {output.name: schema}, "required": [output.name], "additionalProperties": False}
+        params["response_format"] = {"type": "json_schema", "json_schema": {"name": output.name, "strict": True, "schema": schema}}
+    if output.max_output_tokens is not None:
+        params["max_tokens"] = output.max_output_tokens
+    if output.temperature is not None:
+        params["temperature"] = output.temperature
+    return params
+
+def parse_json(text):
+    """JSON value of a reply, tolerating a markdown fence around it; None if it isn't JSON"""
+    text = (text or "").strip()
+    fenced = re.fullmatch(r"```(?:json)?\s*(.*?)\s*```", text, re.S)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
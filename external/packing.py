@@ -0,0 +1,201 @@
+"""
+Multi-image packing for vision requests.
+
+Instead of one request per image, each carrying its own copy of the system instruction and
+prompt, K labelled images are sent in one request and the model answers with a JSON array keyed
+by image label. Labels that don't come back exactly once (missing, repeated, or a reply that
+isn't a JSON array) are re-run as ordinary single-image requests, so every image still gets an
+answer:
+
+    responses = run_packed([Request(model_id, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=p) for p in images], pack_size=4)
+    response = responses.result(model_id, images[0])  # text is that image's answer alone
+
+The pack size that keeps accuracy at the lowest cost per image is picked with
+ocr/inference/sweep.py --pack-size 1 2 4 8.
+"""
+
+import json
+import re
+from collections import Counter
+from dataclasses import replace
+
+from .client import ModelResponse
+from .scheduler import Request, ResultSet, run_requests
+
+PACK_INSTRUCTION = """Several images may be given in one request, each preceded by its label (e.g. "Image 1:"). Apply the instructions above to every image separately and answer in the JSON format requested."""
+
+PACK_PROMPT = """{prompt}
+
+You are given {count} images, each preceded by its label ({labels}). Answer for every image separately. Return ONLY a JSON array with exactly one object per image, in the same order, like [{{"label": "1", "answer": "..."}}], where "answer" is what you would return for that image on its own. No markdown, no explanations."""
+
+PACK_TOKENS_PER_IMAGE = 16  # label and JSON around each answer of a packed reply, on top of its own output cap
+
+class PackedResultSet(ResultSet):
+    """ResultSet of a packed run, with what it cost in total (failed packs and fallbacks included)"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+        self.fallbacks = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def count(self, response):
+        self.requests += 1
+        self.input_tokens += response.input_tokens or 0
+        self.output_tokens += response.output_tokens or 0
+
+def pack_labels(count):
+    return [str(i + 1) for i in range(count)]
+
+def packed_system_instruction(system_instruction):
+    return f"{system_instruction}\n\n{PACK_INSTRUCTION}" if system_instruction else PACK_INSTRUCTION
+
+def packed_prompt(prompt, labels):
+    return PACK_PROMPT.format(prompt=prompt, count=len(labels), labels=", ".join(labels))
+
+def normalize_label(label):
+    return re.sub(r"^image\s*", "", str(label).strip(), flags=re.IGNORECASE)
+
+def parse_packed(text, labels):
+    """Answers by label from a packed reply; labels that are missing, repeated or unknown are left out"""
+    match = re.search(r"\[.*\]", text or "", re.DOTALL)
+    if not match:
+        return {}
+
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return {}
+
+    answers, seen = {}, Counter()
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        label = normalize_label(item.get("label", ""))
+        if label not in labels:
+            continue
+        seen[label] += 1
+        answer = item.get("answer")
+        # structured answers stay JSON, as a single request would return them
+        answers[label] = "" if answer is None else json.dumps(answer) if isinstance(answer, (dict, list)) else str(answer)
+
+    return {label: answer for label, answer in answers.items() if seen[label] == 1}
+
+def share(value, count):
+    return round(value / count) if value is not None else None
+
+def unpack(response, answer, count):
+    """Per-image ModelResponse for one answer of a packed reply, usage split evenly over the pack"""
+    return ModelResponse(
+        model_id=response.model_id,
+        text=answer,
+        input_tokens=share(response.input_tokens, count),
+        output_tokens=share(response.output_tokens, count),
+        total_tokens=share(response.total_tokens, count),
+        cached_input_tokens=share(response.cached_input_tokens, count),
+        cache_write_tokens=share(response.cache_write_tokens, count),
+        timings=dict(response.timings),
+        raw=response.raw,
+        cached=response.cached
+    )
+
+def build_packs(requests, pack_size):
+    """Split single-image requests into packs of up to pack_size sharing model, prompts and settings"""
+    groups, singles = {}, []
+    for request in requests:
+        if not request.image_path or request.video_path:
+            singles.append(request)
+            continue
+        group_key = (request.model_id, request.system_instruction, request.prompt, request.preprocess, request.use_cache, request.cache_ttl,
+                     request.output.key() if request.output is not None else None)
+        groups.setdefault(group_key, []).append(request)
+
+    packs = []
+    for group in groups.values():
+        for i in range(0, len(group), pack_size):
+            chunk = group[i:i + pack_size]
+            if len(chunk) == 1:
+                singles.extend(chunk)
+            else:
+                packs.append(chunk)
+
+    return packs, singles
+
+def packed_output(output, count):
+    """OutputFormat of a pack: the array of labelled answers, each in the single-image schema, and count times the cap"""
+    if output is None:
+        return None
+
+    schema = None
+    if output.schema is not None:
+        item = {"type": "object", "properties": {"label": {"type": "string"}, "answer": output.schema}, "required": ["label", "answer"], "additionalProperties": False}
+        schema = {"type": "object", "properties": {"answers": {"type": "array", "items": item}}, "required": ["answers"], "additionalProperties": False}
+    max_output_tokens = (output.max_output_tokens + PACK_TOKENS_PER_IMAGE) * count if output.max_output_tokens else None
+    return replace(output, schema=schema, max_output_tokens=max_output_tokens, name=f"{output.name}_pack")
+
+def packed_request(chunk):
+    first, labels = chunk[0], pack_labels(len(chunk))
+    return Request(
+        first.model_id,
+        packed_system_instruction(first.system_instruction),
+        packed_prompt(first.prompt, labels),
+        preprocess=first.preprocess,
+        use_cache=first.use_cache,
+        cache_ttl=first.cache_ttl,
+        images=tuple(zip(labels, (request.image_path for request in chunk))),
+        output=packed_output(first.output, len(chunk))
+    )
+
+def run_packed(requests, pack_size, max_concurrency=32, limits=None, desc="Running packed requests", on_result=None):
+    """
+    Run single-image requests pack_size images at a time, falling back to single requests.
+
+    Args:
+        requests (list): Request objects with an image_path each
+        pack_size (int): Images per request, 1 runs them unpacked
+        max_concurrency (int), limits (dict), on_result (callable): See run_requests, on_result
+            gets the per-image responses
+
+    Returns:
+        PackedResultSet: Per-image responses keyed by (model_id, image path), like run_requests
+    """
+    results = PackedResultSet()
+    packs, singles = build_packs(requests, max(1, pack_size))
+    fallback = []
+
+    packed = [packed_request(chunk) for chunk in packs]
+    if packed:
+        responses = run_requests(packed, max_concurrency=max_concurrency, limits=limits, desc=desc)
+
+        for chunk, request in zip(packs, packed):
+            try:
+                response = responses.result(*request.key)
+            except Exception as e:
+                print(f"Packed request of {len(chunk)} images failed, retrying them one by one: {e}")
+                fallback.extend(chunk)
+                continue
+
+            results.count(response)
+            labels = [label for label, _ in request.images]
+            answers = parse_packed(response.text, labels)
+            for label, single in zip(labels, chunk):
+                if label in answers:
+                    results.results[single.key] = unpack(response, answers[label], len(chunk))
+                    if on_result is not None:
+                        on_result(single.key, results.results[single.key])
+                else:
+                    fallback.append(single)
+
+    results.fallbacks = len(fallback)
+    if fallback:
+        print(f"{len(fallback)} images fell back to single-image requests")
+
+    if singles or fallback:
+        responses = run_requests(singles + fallback, max_concurrency=max_concurrency, limits=limits, desc="Single-image requests", on_result=on_result)
+        for key, result in responses.results.items():
+            results.results[key] = result
+            if not isinstance(result, Exception):
+                results.count(result)
+
+    return results
@@ -0,0 +1,163 @@
+"""
+Image payloads for the vision requests.
+
+JPEG files are sent as-is (no decode, no re-encode); anything else, or any image that goes
+through a transform, is encoded to JPEG once and memoized by (file content hash, transform key)
+in an on-disk cache, so the next run reuses it. Either way the payload and its base64 are kept
+in memory by (path, size, mtime, transform key), and concurrent requests for an image wait for
+the first one to load it, so when every model gets the same image at once (the scheduler sends
+requests image-major) it is read, encoded and base64'd a single time.
+"""
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+PAYLOAD_CACHE_DIR = os.environ.get("PAYLOAD_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "payloads"))
+MEMORY_CACHE_BYTES = 256 * 1024 * 1024  # payloads (and their base64) kept in memory
+JPEG_QUALITY = 95
+
+_hashes = {}
+_payloads = OrderedDict()  # memo key -> [mime type, bytes, base64 or None]
+_payload_bytes = 0
+_loading = {}              # memo key -> lock held while the payload is loaded
+_lock = threading.Lock()
+
+def file_hash(image_path):
+    """sha256 of the file content, memoized by path, size and mtime"""
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+
+    digest = _hashes.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = _hashes[key] = sha.hexdigest()
+
+    return digest
+
+def is_jpeg(data):
+    return data[:3] == b"\xff\xd8\xff"
+
+def encode_jpeg(image_path, transform=None):
+    """Decode, apply transform (PIL image -> PIL image), convert to RGB and encode to JPEG"""
+    with Image.open(image_path) as img:
+        if transform is not None:
+            img = transform(img)
+
+        # Convert to RGB if necessary (grayscale is kept, JPEG supports it)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=JPEG_QUALITY)
+        return buffered.getvalue()
+
+def load_payload(image_path, transform):
+    """(mime type, bytes) from the file, the on-disk cache or a fresh encode"""
+    if transform is None:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        if is_jpeg(data):
+            return "image/jpeg", data
+
+    transform_key = transform.key() if transform is not None else ""
+    key = f"{file_hash(image_path)}_{hashlib.sha256(transform_key.encode()).hexdigest()[:16]}"
+
+    cache_path = os.path.join(PAYLOAD_CACHE_DIR, f"{key}.jpg")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return "image/jpeg", f.read()
+
+    data = encode_jpeg(image_path, transform)
+    os.makedirs(PAYLOAD_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, cache_path)
+    return "image/jpeg", data
+
+def remember(memo_key, entry, added_bytes):
+    """Store or grow a memory cache entry and evict the least recently used ones over MEMORY_CACHE_BYTES"""
+    global _payload_bytes
+    _payloads[memo_key] = entry
+    _payloads.move_to_end(memo_key)
+    _payload_bytes += added_bytes
+    while _payload_bytes > MEMORY_CACHE_BYTES and len(_payloads) > 1:
+        _, (_, data, encoded) = _payloads.popitem(last=False)
+        _payload_bytes -= len(data) + len(encoded or "")
+
+def payload_entry(image_path, transform=None):
+    """Memory cache entry [mime type, bytes, base64 or None] of an image, loaded once however many threads ask"""
+    if transform is not None and transform.is_noop():
+        transform = None
+
+    stat = os.stat(image_path)
+    memo_key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns, transform.key() if transform is not None else "")
+
+    with _lock:
+        entry = _payloads.get(memo_key)
+        if entry is not None:
+            _payloads.move_to_end(memo_key)
+            return memo_key, entry
+        key_lock = _loading.setdefault(memo_key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            entry = _payloads.get(memo_key)
+        if entry is None:
+            mime_type, data = load_payload(image_path, transform)
+            entry = [mime_type, data, None]
+            with _lock:
+                remember(memo_key, entry, len(data))
+                _loading.pop(memo_key, None)
+
+    return memo_key, entry
+
+def image_bytes(image_path, transform=None):
+    """
+    Return (mime_type, bytes) for an image.
+
+    Args:
+        image_path (str): Image file
+        transform (Preprocess): Optional PIL image -> PIL image transform; its key() is part
+            of the cache key
+
+    Returns:
+        tuple: ("image/jpeg", JPEG bytes)
+    """
+    _, (mime_type, data, _) = payload_entry(image_path, transform)
+    return mime_type, data
+
+def image_base64(image_path, transform=None):
+    """(mime_type, base64 string) of the payload, encoded once per image"""
+    memo_key, entry = payload_entry(image_path, transform)
+    if entry[2] is None:
+        encoded = base64.b64encode(entry[1]).decode("utf-8")
+        with _lock:
+            if entry[2] is None:
+                entry[2] = encoded
+                if memo_key in _payloads:
+                    remember(memo_key, entry, len(encoded))
+    return entry[0], entry[2]
+
+def encode_image_to_base64(image_path, transform=None):
+    """Base64 string of the (passthrough or cached) JPEG payload"""
+    return image_base64(image_path, transform)[1]
+
+def image_data_url(image_path, transform=None):
+    """data: URL for OpenAI-style image_url content"""
+    mime_type, encoded = image_base64(image_path, transform)
+    return f"data:{mime_type};base64,{encoded}"
+
+def image_blob(image_path, transform=None):
+    """Inline blob for Gemini content, sent without going through PIL again"""
+    mime_type, data = image_bytes(image_path, transform)
+    return {"mime_type": mime_type, "data": data}
@@ -0,0 +1,66 @@
+"""
+Image preprocessing applied before an image is sent to a vision model.
+
+Input tokens (and upload time) scale with the pixels we send, and most of a production frame is
+background. A Preprocess crops to the region of interest (helper/clip.py's center crop, with a
+preset per use case or explicit geometry), optionally converts to grayscale and caps the long
+side. The encoded result is cached by external/payload.py under Preprocess.key().
+
+    generate("gemini_2_0_flash", SYSTEM_INSTRUCTION, TEST_PROMPT, image_path,
+             preprocess=Preprocess(max_side=1024, crop="coil_id"))
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# (crop_width, crop_height, x_offset, y_offset) for helper/clip.py center_crop_box
+CROP_PRESETS = {
+    "coil_id": (600, 500, -100, 150),
+}
+
+def parse_crop(crop):
+    """Preset name or "WxH+X+Y" geometry (offsets from the image center, may be negative) -> (w, h, x_offset, y_offset)"""
+    if crop in CROP_PRESETS:
+        return CROP_PRESETS[crop]
+
+    match = re.fullmatch(r"(\d+)x(\d+)([+-]\d+)?([+-]\d+)?", crop)
+    if not match:
+        raise ValueError(f"Unknown crop '{crop}'. Use a preset ({', '.join(CROP_PRESETS)}) or WxH+X+Y")
+
+    w, h, x_offset, y_offset = match.groups()
+    return int(w), int(h), int(x_offset or 0), int(y_offset or 0)
+
+@dataclass(frozen=True)
+class Preprocess:
+    max_side: Optional[int] = None  # downscale so the long side is at most this many pixels
+    crop: Optional[str] = None      # CROP_PRESETS name or "WxH+X+Y"
+    grayscale: bool = False
+
+    def is_noop(self):
+        return self.max_side is None and self.crop is None and not self.grayscale
+
+    def key(self):
+        """Stable description of the parameters, used in payload cache keys and reports"""
+        # The crop geometry, not the preset name, so editing a preset doesn't reuse stale cached payloads and answers
+        crop = "{}x{}{:+d}{:+d}".format(*parse_crop(self.crop)) if self.crop else None
+        return f"max_side={self.max_side},crop={crop},grayscale={self.grayscale}"
+
+    def __call__(self, img):
+        """Apply to a PIL image and return the new image"""
+        from PIL import Image
+        from helper.clip import center_crop_box
+
+        if self.crop:
+            crop_width, crop_height, x_offset, y_offset = parse_crop(self.crop)
+            w, h = img.size
+            img = img.crop(center_crop_box(w, h, crop_width, crop_height, x_offset, y_offset))
+
+        if self.grayscale:
+            img = img.convert("L")
+
+        if self.max_side and max(img.size) > self.max_side:
+            scale = self.max_side / max(img.size)
+            img = img.resize((max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))), Image.LANCZOS)
+
+        return img
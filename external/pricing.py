@@ -0,0 +1,58 @@
+"""
+List prices of the registered models, for cost accounting across providers.
+
+Prices are USD per 1M tokens, as published by the providers (OpenRouter passes them through).
+"cached_input" is the price of prompt tokens read from the provider's prompt cache and
+"cache_write" of prompt tokens written to it (Anthropic charges a premium for writes, the others
+nothing extra); models without them pay the plain input price. "cache_storage" is per 1M tokens
+per hour a Gemini context cache is kept (see external/prompt_cache.py).
+"""
+
+MODEL_PRICING = {
+    # Gemini
+    "gemini_2_5_pro_preview": {"input": 1.25, "cached_input": 0.31, "output": 10.00, "cache_storage": 4.50},
+    "gemini_2_5_flash_preview": {"input": 0.15, "cached_input": 0.0375, "output": 0.60, "cache_storage": 1.00},
+    "gemini_2_0_flash": {"input": 0.10, "cached_input": 0.025, "output": 0.40, "cache_storage": 1.00},
+    "gemini_1_5_flash": {"input": 0.075, "cached_input": 0.01875, "output": 0.30, "cache_storage": 1.00},
+    "gemini_1_5_pro": {"input": 1.25, "cached_input": 0.3125, "output": 5.00, "cache_storage": 4.50},
+    # Claude
+    "claude_sonnet_4": {"input": 3.00, "cached_input": 0.30, "cache_write": 3.75, "output": 15.00},
+    "claude_3_7_sonnet": {"input": 3.00, "cached_input": 0.30, "cache_write": 3.75, "output": 15.00},
+    "claude_3_5_haiku": {"input": 0.80, "cached_input": 0.08, "cache_write": 1.00, "output": 4.00},
+    "claude_3_5_sonnet": {"input": 3.00, "cached_input": 0.30, "cache_write": 3.75, "output": 15.00},
+    # OpenAI
+    "o4_mini": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
+    "gpt_4_1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt_4_1_mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt_4o": {"input": 5.00, "output": 15.00},  # chatgpt-4o-latest has no cached-input discount
+}
+
+def calculate_cost(model_id, input_tokens, output_tokens, cached_input_tokens=None, cache_write_tokens=None):
+    """USD cost of a call from its token usage, input_tokens including the cached and cache-write ones"""
+    if model_id not in MODEL_PRICING:
+        raise ValueError(f"No pricing for model '{model_id}'")
+
+    pricing = MODEL_PRICING[model_id]
+    cached, written = cached_input_tokens or 0, cache_write_tokens or 0
+    uncached = max((input_tokens or 0) - cached - written, 0)
+    return (
+        uncached * pricing["input"]
+        + cached * pricing.get("cached_input", pricing["input"])
+        + written * pricing.get("cache_write", pricing["input"])
+        + (output_tokens or 0) * pricing["output"]
+    ) / 1_000_000
+
+def response_cost(response):
+    """USD cost of a ModelResponse"""
+    return calculate_cost(response.model_id, response.input_tokens, response.output_tokens,
+                          response.cached_input_tokens, response.cache_write_tokens)
+
+def response_savings(response):
+    """USD saved by prompt caching on a ModelResponse, negative when cache writes cost more than reads saved"""
+    return calculate_cost(response.model_id, response.input_tokens, response.output_tokens) - response_cost(response)
+
+def cache_storage_cost(model_id, tokens, seconds):
+    """USD cost of keeping a Gemini context cache of `tokens` for `seconds`"""
+    if model_id not in MODEL_PRICING:
+        raise ValueError(f"No pricing for model '{model_id}'")
+    return tokens / 1_000_000 * MODEL_PRICING[model_id].get("cache_storage", 0.0) * seconds / 3600
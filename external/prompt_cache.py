@@ -0,0 +1,172 @@
+"""
+Provider-side prompt caching for the prefix every request of a sweep shares.
+
+Requests of a sweep repeat the same system instruction and prompt and only the image changes, so
+the prefix is kept processed on the provider side and billed at the cached-input price
+(external/pricing.py):
+
+- Gemini: the system instruction and prompt are stored once per (model, prefix) as a context cache
+  (CachedContent) and requests only send the image. Caches are created on first use, extended
+  while they are being used and deleted at exit, since Gemini bills their storage per hour.
+  Prefixes under the model's minimum cacheable size (MIN_CACHE_TOKENS) are rejected by the API,
+  so they aren't sent for caching at all and those requests send the full prompt as before.
+- Claude via OpenRouter: the prompt is marked with Anthropic cache_control. Anthropic keeps the
+  cache for 5 minutes and every hit refreshes it, so nothing needs managing.
+- OpenAI via OpenRouter caches prompts of 1024+ tokens automatically.
+
+PROMPT_CACHE=0 turns it off.
+"""
+
+import atexit
+import datetime
+import os
+import threading
+import time
+
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE", "1") != "0"
+CONTEXT_CACHE_TTL = float(os.environ.get("CONTEXT_CACHE_TTL", 3600))  # seconds, counted from the last extension
+REFRESH_MARGIN = 10 * 60  # extend a Gemini cache once it has less than this left
+CHARS_PER_TOKEN = 4       # rough size of a Gemini text token
+
+# Smallest prefix (tokens) each Gemini model will cache, by model name prefix; others get the largest
+MIN_CACHE_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+    "gemini-2.0-flash": 32768,
+    "gemini-1.5-flash": 32768,
+    "gemini-1.5-pro": 32768,
+}
+
+def min_cache_tokens(model_name):
+    name = model_name.split("/")[-1]
+    for prefix, tokens in MIN_CACHE_TOKENS.items():
+        if name.startswith(prefix):
+            return tokens
+    return max(MIN_CACHE_TOKENS.values())
+
+def estimate_tokens(*texts):
+    """Rough token count of the text parts of a prefix"""
+    return sum(len(text) for text in texts if isinstance(text, str)) // CHARS_PER_TOKEN
+
+def anthropic_cache_control(model_name):
+    """cache_control marking the end of the shared prefix, None for models that don't take it"""
+    if PROMPT_CACHE_ENABLED and model_name.startswith("anthropic/"):
+        return {"type": "ephemeral"}
+    return None
+
+class ContextCache:
+    """Gemini context caches keyed by (model, system instruction, prompt)"""
+
+    def __init__(self, ttl=CONTEXT_CACHE_TTL, refresh_margin=REFRESH_MARGIN):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.entries = {}      # key -> {"cache", "model", "model_id", "tokens", "created_at", "expires_at"}
+        self.unsupported = set()
+        self.key_locks = {}    # key -> lock held while that cache is created or extended
+        self.lock = threading.Lock()
+        self.storage_seconds = {}  # model_id -> token-seconds of deleted caches
+        self.created = 0
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def model(self, model_id, model_name, system_instruction, prompt):
+        """GenerativeModel over the cached (system instruction, prompt) prefix, None if it can't be cached"""
+        key = (model_name, system_instruction, prompt)
+        if key in self.unsupported:
+            return None
+
+        with self.key_lock(key):
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires_at"] - self.refresh_margin <= time.time():
+                entry = self.extend(key, entry)
+            if entry is None:
+                entry = self.create(key, model_id)
+            return entry["model"] if entry is not None else None
+
+    def create(self, key, model_id):
+        from .providers import gemini
+
+        model_name, system_instruction, prompt = key
+        if estimate_tokens(system_instruction, prompt) < min_cache_tokens(model_name):
+            # Below the model's minimum the create call always fails, don't spend a round trip on it
+            self.unsupported.add(key)
+            return None
+
+        gemini.configure()
+        try:
+            cache = gemini.genai.caching.CachedContent.create(
+                model=model_name,
+                system_instruction=system_instruction,
+                contents=[prompt],
+                ttl=datetime.timedelta(seconds=self.ttl)
+            )
+        except Exception as e:
+            print(f"Prompt caching not available for {model_id}, sending the full prompt: {e}")
+            self.unsupported.add(key)
+            return None
+
+        usage = getattr(cache, "usage_metadata", None)
+        now = time.time()
+        entry = {
+            "cache": cache,
+            "model": gemini.genai.GenerativeModel.from_cached_content(cached_content=cache),
+            "model_id": model_id,
+            "tokens": getattr(usage, "total_token_count", 0) or 0,
+            "created_at": now,
+            "expires_at": now + self.ttl,
+        }
+        self.entries[key] = entry
+        self.created += 1
+        return entry
+
+    def extend(self, key, entry):
+        """Push the expiry back by ttl, None (and forgotten) if the cache is already gone"""
+        try:
+            entry["cache"].update(ttl=datetime.timedelta(seconds=self.ttl))
+        except Exception:
+            self.forget(key, min(entry["expires_at"], time.time()))
+            return None
+        entry["expires_at"] = time.time() + self.ttl
+        return entry
+
+    def forget(self, key, ended_at):
+        entry = self.entries.pop(key)
+        with self.lock:
+            seconds = entry["tokens"] * max(ended_at - entry["created_at"], 0.0)
+            self.storage_seconds[entry["model_id"]] = self.storage_seconds.get(entry["model_id"], 0.0) + seconds
+
+    def storage_cost(self):
+        """USD storage cost of the caches so far, live ones counted up to now"""
+        from .pricing import cache_storage_cost
+
+        now = time.time()
+        token_seconds = dict(self.storage_seconds)
+        for entry in list(self.entries.values()):
+            token_seconds[entry["model_id"]] = token_seconds.get(entry["model_id"], 0.0) + entry["tokens"] * (min(now, entry["expires_at"]) - entry["created_at"])
+        return sum(cache_storage_cost(model_id, tokens=seconds, seconds=1) for model_id, seconds in token_seconds.items())
+
+    def close(self):
+        """Delete every cache so storage stops being billed"""
+        for key, entry in list(self.entries.items()):
+            try:
+                entry["cache"].delete()
+            except Exception as e:
+                print(f"Could not delete context cache for {entry['model_id']}: {e}")
+            self.forget(key, min(entry["expires_at"], time.time()))
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+def get_context_cache():
+    """Shared ContextCache, None when prompt caching is disabled"""
+    global _context_cache
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = ContextCache()
+                atexit.register(_context_cache.close)
+    return _context_cache
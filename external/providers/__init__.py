@@ -0,0 +1 @@
+# Provider backends used by external.client
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+import google.generativeai as genai
+
+from ..client import ModelResponse
+from ..output import gemini_generation_config
+from ..payload import image_blob
+
+_configured = False
+
+# GenerativeModel handles keyed by (model name, system instruction)
+_models = {}
+
+def configure():
+    """Configure the API key once, on first use"""
+    global _configured
+    if not _configured:
+        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+        _configured = True
+
+def get_model(model_name, system_instruction):
+    """Return a cached GenerativeModel for this model and system instruction"""
+    key = (model_name, system_instruction)
+    if key not in _models:
+        configure()
+        _models[key] = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=system_instruction
+        )
+    return _models[key]
+
+def prefix_cached(model_id, model_name, system_instruction, content):
+    """(model, content) using a context cache for the system instruction and prompt (content[0]) when possible"""
+    from ..prompt_cache import get_context_cache
+
+    context_cache = get_context_cache()
+    if context_cache is None or len(content) < 2:
+        return get_model(model_name, system_instruction), content
+
+    model = context_cache.model(model_id, model_name, system_instruction, content[0])
+    if model is None:
+        return get_model(model_name, system_instruction), content
+    return model, content[1:]
+
+def to_response(model_id, response, timings):
+    usage = getattr(response, "usage_metadata", None)
+
+    return ModelResponse(
+        model_id=model_id,
+        text=response.text,
+        input_tokens=usage.prompt_token_count if usage else None,
+        output_tokens=usage.candidates_token_count if usage else None,
+        total_tokens=usage.total_token_count if usage else None,
+        cached_input_tokens=getattr(usage, "cached_content_token_count", None) if usage else None,
+        timings=timings,
+        raw=response
+    )
+
+def upload_video_with_retry(video_path, max_retries=3):
+    """Uploaded video ready for generation, uploaded once per content (see external/uploads.py)"""
+    from ..uploads import get_upload_manager
+    return get_upload_manager().upload(video_path, max_retries)
+
+def labelled_images(images, preprocess=None):
+    """Content parts for packed (label, image path) pairs, each image preceded by its label"""
+    parts = []
+    for label, image_path in images:
+        parts += [f"Image {label}:", image_blob(image_path, preprocess)]
+    return parts
+
+def generate(model_id, model_name, system_instruction, prompt, image_path=None, video_path=None, count_tokens=False, preprocess=None, images=None, stream=False, output=None):
+    """Run one Gemini request and normalize the response, streamed when stream=True to record time to first token"""
+    timings = {}
+
+    content = [prompt]
+    if images:
+        content = [prompt] + labelled_images(images, preprocess)
+    elif image_path:
+        content = [prompt, image_blob(image_path, preprocess)]
+    elif video_path:
+        upload_start = time.perf_counter()
+        video = upload_video_with_retry(video_path)
+        timings["upload"] = time.perf_counter() - upload_start
+        content = [prompt, video]
+
+    model, content = prefix_cached(model_id, model_name, system_instruction, content)
+
+    if count_tokens:
+        total_tokens = model.count_tokens(content)
+        print("total_tokens: ", total_tokens)
+
+    generation_config = gemini_generation_config(output)
+
+    start = time.perf_counter()
+    if stream:
+        response = model.generate_content(content, generation_config=generation_config, stream=True)
+        for _ in response:
+            # the first chunk carries the first tokens
+            timings.setdefault("ttft", time.perf_counter() - start)
+    else:
+        response = model.generate_content(content, generation_config=generation_config)
+    timings["total"] = time.perf_counter() - start
+
+    return to_response(model_id, response, timings)
+
+async def agenerate(model_id, model_name, system_instruction, prompt, image_path=None, video_path=None, preprocess=None, images=None, output=None):
+    """Async variant of generate using the SDK's generate_content_async"""
+    timings = {}
+
+    content = [prompt]
+    if images:
+        content = [prompt] + labelled_images(images, preprocess)
+    elif image_path:
+        content = [prompt, image_blob(image_path, preprocess)]
+    elif video_path:
+        upload_start = time.perf_counter()
+        video = await asyncio.to_thread(upload_video_with_retry, video_path)
+        timings["upload"] = time.perf_counter() - upload_start
+        content = [prompt, video]
+
+    model, content = await asyncio.to_thread(prefix_cached, model_id, model_name, system_instruction, content)
+
+    start = time.perf_counter()
+    response = await model.generate_content_async(content, generation_config=gemini_generation_config(output))
+    timings["total"] = time.perf_counter() - start
+
+    return to_response(model_id, response, timings)
@@ -0,0 +1,158 @@
+import os
+import time
+import requests
+from dotenv import load_dotenv
+
+from .. import transport
+from ..client import ModelResponse
+from ..output import openrouter_params
+from ..payload import image_data_url
+from ..prompt_cache import anthropic_cache_control
+from ..transport import AsyncTransport
+
+# Load environment variables from .env file
+load_dotenv()
+
+def openrouter_headers():
+    return {
+        "Authorization": f"Bearer {os.environ.get('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+def build_payload(model_name, system_instruction, prompt, image_path=None, preprocess=None, images=None, output=None):
+    """Build the chat completions request body"""
+    messages = []
+    
+    # Add system message if provided
+    if system_instruction:
+        messages.append({
+            "role": "system",
+            "content": system_instruction
+        })
+    
+    # Prepare user message content, the prompt ending the prefix shared by every request
+    content = [{"type": "text", "text": prompt}]
+    cache_control = anthropic_cache_control(model_name)
+    if cache_control:
+        content[0]["cache_control"] = cache_control
+    
+    # Add image if provided
+    if image_path:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_data_url(image_path, preprocess)
+            }
+        })
+    
+    # Add packed images, each preceded by its label
+    for label, packed_path in images or []:
+        content.append({"type": "text", "text": f"Image {label}:"})
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_data_url(packed_path, preprocess)
+            }
+        })
+    
+    messages.append({
+        "role": "user",
+        "content": content
+    })
+    
+    return {
+        "model": model_name,
+        "messages": messages,
+        **openrouter_params(output)
+    }
+
+def make_openrouter_request(model_name, system_instruction, prompt, image_path=None, preprocess=None, images=None, output=None):
+    """Make a request to OpenRouter API on the shared keep-alive session"""
+    data = build_payload(model_name, system_instruction, prompt, image_path, preprocess, images, output)
+    
+    try:
+        return transport.post_json("chat/completions", data, headers=openrouter_headers())
+        
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+        if hasattr(e, 'response') and e.response is not None:
+            print(f"Response: {e.response.text}")
+        raise
+
+def to_response(model_id, result, timings):
+    usage = result.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+
+    return ModelResponse(
+        model_id=model_id,
+        text=result["choices"][0]["message"]["content"] or "",
+        input_tokens=usage.get("prompt_tokens"),
+        output_tokens=usage.get("completion_tokens"),
+        total_tokens=usage.get("total_tokens"),
+        cached_input_tokens=details.get("cached_tokens"),
+        cache_write_tokens=details.get("cache_write_tokens"),
+        timings=timings,
+        raw=result
+    )
+
+def generate(model_id, model_name, system_instruction, prompt, image_path=None, preprocess=None, images=None, stream=False, output=None):
+    """Run one OpenRouter request and normalize the response"""
+    if stream:
+        return generate_stream(model_id, model_name, system_instruction, prompt, image_path, preprocess, images, output)
+
+    transport.reset_connect_time()
+    start = time.perf_counter()
+    result = make_openrouter_request(model_name, system_instruction, prompt, image_path, preprocess, images, output)
+    total = time.perf_counter() - start
+
+    return to_response(model_id, result, {"connect": transport.connect_time(), "total": total})
+
+def generate_stream(model_id, model_name, system_instruction, prompt, image_path=None, preprocess=None, images=None, output=None):
+    """Streaming variant of generate that also records time to first token"""
+    data = build_payload(model_name, system_instruction, prompt, image_path, preprocess, images, output)
+    data["stream"] = True
+    data["stream_options"] = {"include_usage": True}
+
+    result, parts, usage, ttft = {}, [], None, None
+
+    transport.reset_connect_time()
+    start = time.perf_counter()
+    try:
+        for event in transport.post_stream("chat/completions", data, headers=openrouter_headers()):
+            if event.get("error"):
+                raise RuntimeError(f"Stream failed: {event['error']}")
+
+            for choice in event.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta)
+
+            usage = event.get("usage") or usage
+            result.update({k: event[k] for k in ("id", "model") if k in event})
+
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+        if hasattr(e, 'response') and e.response is not None:
+            print(f"Response: {e.response.text}")
+        raise
+
+    total = time.perf_counter() - start
+    result["choices"] = [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}}]
+    result["usage"] = usage
+
+    return to_response(model_id, result, {"connect": transport.connect_time(), "ttft": ttft if ttft is not None else total, "total": total})
+
+async def agenerate(model_id, model_name, system_instruction, prompt, image_path=None, async_transport=None, preprocess=None, images=None, output=None):
+    """Async variant of generate on an AsyncTransport (a temporary one if none is given)"""
+    data = build_payload(model_name, system_instruction, prompt, image_path, preprocess, images, output)
+
+    start = time.perf_counter()
+    if async_transport is None:
+        async with AsyncTransport() as t:
+            result = await t.post_json("chat/completions", data, headers=openrouter_headers())
+    else:
+        result = await async_transport.post_json("chat/completions", data, headers=openrouter_headers())
+
+    return to_response(model_id, result, {"total": time.perf_counter() - start})
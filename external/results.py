@@ -0,0 +1,122 @@
+"""
+Append-only results files with resume, for runners that save a result per image.
+
+Rewriting the whole results array after every image is quadratic in the number of images and a
+crash halfway loses the run. A ResultWriter appends one JSONL line per result next to the final
+file (gpt_4o_coil_id.json -> gpt_4o_coil_id.jsonl), fsyncs every SYNC_EVERY lines or
+SYNC_INTERVAL seconds, and on close writes the usual JSON array and removes the JSONL:
+
+    with ResultWriter(f"{model_name}_coil_id.json") as writer:
+        for image_path in image_files:
+            if image_id(image_path) in writer.done:
+                continue  # finished by an earlier run
+            writer.write({"id": image_id(image_path), "ocr_predicted": ...})
+
+Concurrent runs write from the on_result callback of run_requests/run_packed/run_batch, so
+results are saved as requests finish rather than when the whole run is done.
+
+Opening a writer picks up the results of an interrupted run from its JSONL (a torn last line is
+dropped), so a rerun only does what's missing; a finished run has no JSONL left and a rerun
+starts over, as does resume=False.
+"""
+
+import json
+import os
+import threading
+import time
+
+SYNC_EVERY = 50        # results between fsyncs
+SYNC_INTERVAL = 5.0    # seconds between fsyncs
+
+def checkpoint_path(path):
+    return os.path.splitext(path)[0] + ".jsonl"
+
+def read_checkpoint(path):
+    """Results of a JSONL checkpoint, stopping at the first line that doesn't parse"""
+    results = []
+    with open(path) as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                break
+    return results
+
+class ResultWriter:
+
+    def __init__(self, path, key="id", resume=True, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.checkpoint = checkpoint_path(path)
+        self.key = key
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.results = []
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(self.checkpoint):
+            self.results = read_checkpoint(self.checkpoint)
+
+        self.done = {result[key] for result in self.results if key in result}
+        self.resumed = len(self.results)
+
+        # Rewrite the checkpoint from what was read, dropping a torn last line
+        self.file = open(self.checkpoint, "w")
+        self.file.writelines(json.dumps(result) + "\n" for result in self.results)
+        self.unsynced = 0
+        self.synced_at = time.time()
+        self.sync()
+
+        if self.resumed:
+            print(f"Resuming {path}: {self.resumed} results already done")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.interrupt()
+
+    def write(self, result):
+        """Append a result; it reaches the OS right away and the disk at the next sync. Thread-safe"""
+        line = json.dumps(result) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.results.append(result)
+            if self.key in result:
+                self.done.add(result[self.key])
+
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or time.time() - self.synced_at >= self.sync_interval:
+                self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.time()
+
+    def interrupt(self):
+        """Sync and close the checkpoint, keeping it for the next run to resume from"""
+        with self.lock:
+            if self.file is None:
+                return
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        """Write the JSON array and remove the checkpoint"""
+        if self.file is None:
+            return
+        self.interrupt()
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.results, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        os.remove(self.checkpoint)
@@ -0,0 +1,326 @@
+"""
+Concurrent request scheduler for evaluation runs.
+
+Runs many generate() calls at once while staying inside each provider's quota:
+- a requests/min and a tokens/min token bucket per provider (tokens are estimated from the
+  previous responses of the same model and settled once the real usage is known)
+- adaptive concurrency (AIMD): one more worker after a streak of successes, halved on a 429
+- exponential backoff with full jitter on 429s and transient errors, honouring Retry-After
+- image-major fan-out: requests are dispatched image by image (every model's request for an
+  image, then the next image) from one worker pool per provider, so each image is loaded and
+  encoded once while all models use it (external/payload.py) and a slow or rate-limited
+  provider only holds up its own requests while the others keep their quota busy
+
+    responses = run_requests([Request(model_id, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=p) for p in images])
+    response = responses.result(model_id, images[0])  # raises the request's exception if it failed
+"""
+
+import datetime
+import email.utils
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from tqdm import tqdm
+
+from .client import cached_response, call_provider, get_spec, store_response
+
+# Per-provider quotas, lower these to the limits of the account in use
+PROVIDER_LIMITS = {
+    "gemini": {"rpm": 2000, "tpm": 4_000_000},
+    "openrouter": {"rpm": 500, "tpm": 2_000_000},
+}
+
+DEFAULT_TOKEN_ESTIMATE = 1500  # tokens assumed for a model's first request
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0   # seconds
+BACKOFF_CAP = 60.0   # seconds
+
+@dataclass
+class Request:
+    model_id: str
+    system_instruction: str
+    prompt: str
+    image_path: Optional[str] = None
+    video_path: Optional[str] = None
+    preprocess: Any = None
+    use_cache: bool = True
+    cache_ttl: Optional[float] = None
+    images: Optional[tuple] = None  # packed ((label, image path), ...), see external/packing.py
+    stream: bool = False  # stream the response to record time to first token
+    output: Any = None  # OutputFormat, see external/output.py
+
+    @property
+    def media(self):
+        return self.image_path or self.video_path or self.images
+
+    @property
+    def key(self):
+        return (self.model_id, self.media)
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth; acquire blocks until available"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount=1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        """Settle an estimate: positive takes more units (may go negative), negative gives some back"""
+        with self.lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: +1 after `increase_after` successes, halved on a rate limit"""
+
+    def __init__(self, initial, maximum, increase_after=10):
+        self.limit = initial
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.increase_after and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_rate_limit(self):
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, given as seconds or as an HTTP date; None if absent or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:  # RFC 7231 dates are GMT
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+def classify_error(e):
+    """(is_rate_limit, is_transient, retry_after seconds or None) for an exception from a provider"""
+    response = getattr(e, "response", None)
+    status = getattr(response, "status_code", None) or getattr(e, "status", None) or getattr(e, "code", None)
+    if type(e).__name__ == "ResourceExhausted":
+        status = 429
+
+    headers = getattr(response, "headers", None) or getattr(e, "headers", None)
+    retry_after = parse_retry_after(headers.get("Retry-After")) if headers else None
+
+    if status == 429:
+        return True, True, retry_after
+
+    transient = (isinstance(status, int) and status >= 500) or type(e).__name__ in (
+        "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError"
+    )
+    return False, transient, retry_after
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, at least Retry-After when the provider sent one"""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    return max(delay, retry_after) if retry_after else delay
+
+def image_major(requests):
+    """Requests reordered image by image, keeping the model order within an image"""
+    order = {}
+    for request in requests:
+        order.setdefault(request.media, len(order))
+    return sorted(requests, key=lambda request: order[request.media])
+
+class ResultSet:
+    """Responses (or exceptions) keyed by (model_id, image/video path)"""
+
+    def __init__(self):
+        self.results = {}
+
+    def result(self, model_id, path):
+        result = self.results[(model_id, path)]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def __len__(self):
+        return len(self.results)
+
+class Scheduler:
+
+    def __init__(self, max_concurrency=32, initial_concurrency=4, limits=None):
+        self.max_concurrency = max_concurrency
+        self.limits = limits or PROVIDER_LIMITS
+        self.limiters = {}
+        self.request_buckets = {}
+        self.token_buckets = {}
+        self.initial_concurrency = initial_concurrency
+        self.estimates = {}
+        self.lock = threading.Lock()
+
+        self.completed = 0
+        self.tokens_used = 0
+        self.rate_limited = 0
+        self.cache_hits = 0
+        self.started_at = None
+
+    def _provider_state(self, provider):
+        with self.lock:
+            if provider not in self.limiters:
+                limits = self.limits.get(provider, {"rpm": 60, "tpm": 100_000})
+                self.limiters[provider] = AdaptiveLimiter(self.initial_concurrency, self.max_concurrency)
+                self.request_buckets[provider] = TokenBucket(limits["rpm"])
+                self.token_buckets[provider] = TokenBucket(limits["tpm"])
+            return self.limiters[provider], self.request_buckets[provider], self.token_buckets[provider]
+
+    def execute(self, request):
+        """Run one request with rate limiting and retries, returns a ModelResponse or raises"""
+        key = None
+        if request.use_cache:
+            # cache hits don't count against the provider limits
+            response, key = cached_response(request.model_id, request.system_instruction, request.prompt, request.image_path, request.video_path, request.preprocess, request.cache_ttl, request.images, request.output)
+            if response is not None:
+                with self.lock:
+                    self.cache_hits += 1
+                return response
+
+        provider = get_spec(request.model_id).provider
+        limiter, request_bucket, token_bucket = self._provider_state(provider)
+
+        attempt = 0
+        while True:
+            estimate = self.estimates.get(request.model_id, DEFAULT_TOKEN_ESTIMATE)
+
+            with limiter:
+                request_bucket.acquire(1)
+                token_bucket.acquire(estimate)
+                try:
+                    response = call_provider(
+                        request.model_id,
+                        request.system_instruction,
+                        request.prompt,
+                        image_path=request.image_path,
+                        video_path=request.video_path,
+                        preprocess=request.preprocess,
+                        images=request.images,
+                        stream=request.stream,
+                        output=request.output
+                    )
+                except Exception as e:
+                    token_bucket.adjust(-estimate)
+                    rate_limited, transient, retry_after = classify_error(e)
+                    if rate_limited:
+                        limiter.on_rate_limit()
+                        with self.lock:
+                            self.rate_limited += 1
+                    if not transient or attempt >= MAX_RETRIES:
+                        raise
+                    delay = backoff_delay(attempt, retry_after)
+                    attempt += 1
+                else:
+                    limiter.on_success()
+                    used = response.total_tokens or estimate
+                    token_bucket.adjust(used - estimate)
+                    with self.lock:
+                        # moving average of what this model's requests cost
+                        self.estimates[request.model_id] = 0.8 * estimate + 0.2 * used
+                        self.tokens_used += used
+                    store_response(key, response)
+                    return response
+
+            time.sleep(delay)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        concurrency = {provider: limiter.limit for provider, limiter in self.limiters.items()}
+        return {
+            "req/min": f"{self.completed / elapsed * 60:.0f}",
+            "tok/min": f"{self.tokens_used / elapsed * 60:.0f}",
+            "429s": self.rate_limited,
+            "cached": self.cache_hits,
+            "concurrency": ",".join(f"{p}={c}" for p, c in concurrency.items()),
+        }
+
+    def run(self, requests, desc="Running requests", on_result=None):
+        """Run all requests concurrently, returns a ResultSet; on_result(key, response or exception) is called as each finishes"""
+        results = ResultSet()
+        self.started_at = time.monotonic()
+
+        by_provider = defaultdict(list)
+        for request in image_major(requests):
+            by_provider[get_spec(request.model_id).provider].append(request)
+
+        executors = {provider: ThreadPoolExecutor(max_workers=self.max_concurrency) for provider in by_provider}
+        try:
+            with tqdm(total=len(requests), desc=desc) as progress:
+
+                def run_one(request):
+                    try:
+                        result = self.execute(request)
+                    except Exception as e:
+                        result = e
+                    with self.lock:
+                        results.results[request.key] = result
+                        self.completed += 1
+                    if on_result is not None:
+                        on_result(request.key, result)
+                    progress.update(1)
+                    progress.set_postfix(self.stats(), refresh=False)
+
+                futures = [executors[provider].submit(run_one, request) for provider, provider_requests in by_provider.items() for request in provider_requests]
+                for future in futures:
+                    future.result()
+        finally:
+            for executor in executors.values():
+                executor.shutdown()
+
+        return results
+
+def run_requests(requests, max_concurrency=32, limits=None, desc="Running requests", on_result=None):
+    """Run requests concurrently under the provider rate limits, returns a ResultSet"""
+    return Scheduler(max_concurrency=max_concurrency, limits=limits).run(requests, desc, on_result)
@@ -0,0 +1,80 @@
+"""
+Tests for external/batch.py against the local stand-in batch APIs (external/mock_server.py):
+results of the OpenAI, Anthropic and Gemini batches map back to their (model, image) requests,
+and a run interrupted while its batches were in flight re-attaches to them on the rerun.
+
+    python -m pytest external/test_batch.py
+"""
+
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import Request, batch, run_batch, transport
+from external.mock_server import base_url, start_mock_server
+
+MODELS = ["gpt_4_1_mini", "claude_3_5_haiku", "gemini_2_0_flash"]  # one per batch API
+IMAGES = 3
+POLL_INTERVAL = 0.01
+
+class Interrupted(Exception):
+    pass
+
+@pytest.fixture
+def mock():
+    """Mock whose replies echo the prompt, with the batch APIs pointed at it, settings restored afterwards"""
+    settings, base_urls = transport.get_settings(), dict(batch.BASE_URLS)
+    server, state = start_mock_server(reply=lambda prompt: prompt, batch_polls=2)
+    batch.configure(openai=base_url(server, "openai"), anthropic=base_url(server, "anthropic"), gemini=base_url(server, "gemini"))
+
+    yield state
+
+    server.shutdown()
+    server.server_close()
+    batch.BASE_URLS.update(base_urls)
+    transport.configure(**settings)
+
+def make_requests(folder):
+    """One request per (model, image), each with a prompt naming its model and image"""
+    image_files = []
+    for i in range(IMAGES):
+        path = os.path.join(folder, f"{i}.png")
+        Image.new("RGB", (32, 24), (10 * i, 40, 40)).save(path)
+        image_files.append(path)
+    return [Request(model_id, "system", f"{model_id} {os.path.basename(path)}", image_path=path) for model_id in MODELS for path in image_files]
+
+def test_results_map_back_to_their_requests(mock, tmp_path):
+    requests = make_requests(str(tmp_path))
+    results = run_batch(requests, batch_dir=str(tmp_path / "batches" / "run"), use_cache=False, poll_interval=POLL_INTERVAL)
+
+    assert len(mock.batches) == len(MODELS)
+    for request in requests:
+        response = results.results[(request.model_id, request.image_path)]
+        assert response.model_id == request.model_id
+        assert response.text == request.prompt  # the mock echoes the prompt, so this is the request's own answer
+
+def test_rerun_reattaches_to_submitted_batches(mock, tmp_path):
+    requests = make_requests(str(tmp_path))
+    batch_root = tmp_path / "batches"
+
+    def crash(key, response):
+        raise Interrupted()
+
+    # Dies on the first result, before any batch is marked collected
+    with pytest.raises(Interrupted):
+        run_batch(requests, batch_dir=str(batch_root / "first"), use_cache=False, poll_interval=POLL_INTERVAL, on_result=crash)
+    assert len(mock.batches) == len(MODELS)
+
+    results = run_batch(requests, batch_dir=str(batch_root / "rerun"), use_cache=False, poll_interval=POLL_INTERVAL)
+    assert len(mock.batches) == len(MODELS)  # nothing submitted again
+    assert all(results.results[(request.model_id, request.image_path)].text == request.prompt for request in requests)
+
+    # Once collected, the same requests are a new sweep
+    run_batch(requests, batch_dir=str(batch_root / "again"), use_cache=False, poll_interval=POLL_INTERVAL)
+    assert len(mock.batches) == 2 * len(MODELS)
@@ -0,0 +1,75 @@
+"""
+Tests for external/transport.py against the local stand-in API (external/mock_server.py): one
+keep-alive connection for many requests, time to first token when streaming, and read timeouts.
+
+    python -m pytest external/test_transport.py
+"""
+
+import os
+import sys
+
+import pytest
+import requests
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import generate, transport
+from external.mock_server import base_url, start_mock_server
+
+MODEL = "gpt_4_1_mini"  # any OpenRouter model, the mock answers them all
+REQUESTS = 5
+
+@pytest.fixture
+def mock():
+    """Mock server on a free port with the transport pointed at it, settings restored afterwards"""
+    settings = transport.get_settings()
+    servers = []
+
+    def start(**kwargs):
+        server, state = start_mock_server(reply="1234", **kwargs)
+        servers.append(server)
+        transport.configure(base_url=base_url(server))
+        return state
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    transport.configure(**settings)
+
+def ask(stream=False):
+    return generate(MODEL, "system", "prompt", use_cache=False, stream=stream)
+
+def test_requests_share_one_connection(mock):
+    state = mock()
+    responses = [ask() for _ in range(REQUESTS)]
+
+    assert [response.text for response in responses] == ["1234"] * REQUESTS
+    assert state.requests == REQUESTS
+    assert state.connections == 1
+    # Only the first request pays for opening the connection
+    assert responses[0].timings["connect"] > 0
+    assert all(response.timings["connect"] == 0 for response in responses[1:])
+
+def test_streaming_records_time_to_first_token(mock):
+    state = mock(latency=0.05)
+    responses = [ask(stream=True) for _ in range(REQUESTS)]
+
+    for response in responses:
+        assert response.text == "1234"
+        assert response.output_tokens is not None
+        assert 0 < response.timings["ttft"] <= response.timings["total"]
+    assert state.connections == 1
+
+def test_read_timeout(mock):
+    mock(latency=1.0)
+    transport.configure(read_timeout=0.2)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        ask()
+
+    transport.configure(read_timeout=5)
+    assert ask().text == "1234"  # a slow server is still answered once the timeout allows it
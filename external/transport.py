@@ -0,0 +1,176 @@
+"""
+HTTP transport for the OpenRouter models.
+
+One pooled `requests.Session` (keep-alive, so only the first request to a host pays the TCP/TLS
+handshake) shared by every thread, plus an asyncio variant on aiohttp for running many requests
+in flight from a single event loop. Connections time their own connect (TCP + TLS), so a request
+can tell how much of its latency was spent opening one (connect_time()). Base URL and timeouts are configurable so the whole client
+can be pointed at `external/mock_server.py`:
+
+    from external import transport
+    transport.configure(base_url="http://127.0.0.1:8600/api/v1")
+"""
+
+import json
+import os
+import threading
+import time
+
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+CONNECT_TIMEOUT = 10   # seconds to establish a connection
+READ_TIMEOUT = 120     # seconds to wait for the response
+POOL_SIZE = 32         # keep-alive connections kept per host
+
+_settings = {
+    "base_url": OPENROUTER_BASE_URL,
+    "connect_timeout": CONNECT_TIMEOUT,
+    "read_timeout": READ_TIMEOUT,
+    "pool_size": POOL_SIZE,
+}
+
+_session = None
+_session_lock = threading.Lock()
+_local = threading.local()
+
+def configure(base_url=None, connect_timeout=None, read_timeout=None, pool_size=None):
+    """Override transport settings, the shared session is rebuilt on next use"""
+    global _session
+    updates = {
+        "base_url": base_url,
+        "connect_timeout": connect_timeout,
+        "read_timeout": read_timeout,
+        "pool_size": pool_size,
+    }
+    with _session_lock:
+        _settings.update({k: v for k, v in updates.items() if v is not None})
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def get_settings():
+    return dict(_settings)
+
+def url_for(path):
+    return f"{_settings['base_url'].rstrip('/')}/{path.lstrip('/')}"
+
+def reset_connect_time():
+    _local.connect_time = 0.0
+
+def connect_time():
+    """Seconds this thread spent opening connections since reset_connect_time(), 0.0 on a reused one"""
+    return getattr(_local, "connect_time", 0.0)
+
+def timed_adapter(pool_size):
+    """HTTPAdapter whose connections add the time spent in connect() to the thread's connect_time()"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_cls):
+        class TimedConnection(connection_cls):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    super().connect()
+                finally:
+                    _local.connect_time = connect_time() + time.perf_counter() - start
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+    return TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+
+                session = requests.Session()
+                adapter = timed_adapter(_settings["pool_size"])
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def post_json(path, payload, headers=None, timeout=None):
+    """POST a JSON payload on the shared session and return the decoded JSON response"""
+    if timeout is None:
+        timeout = (_settings["connect_timeout"], _settings["read_timeout"])
+
+    response = get_session().post(url_for(path), json=payload, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def post_stream(path, payload, headers=None, timeout=None):
+    """POST a JSON payload and yield the decoded JSON events of the server-sent event stream"""
+    if timeout is None:
+        timeout = (_settings["connect_timeout"], _settings["read_timeout"])
+
+    with get_session().post(url_for(path), json=payload, headers=headers, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank separators
+            if not line or not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                return
+            yield json.loads(data)
+
+class AsyncTransport:
+    """
+    aiohttp-based transport for running many requests concurrently from one event loop.
+
+    `limit` caps open connections (requests beyond it queue on the connector), so thousands of
+    coroutines can be in flight without opening thousands of sockets.
+
+        async with AsyncTransport(limit=200) as t:
+            results = await asyncio.gather(*(t.post_json("chat/completions", p, headers) for p in payloads))
+    """
+
+    def __init__(self, limit=100, connect_timeout=None, read_timeout=None, base_url=None):
+        self.limit = limit
+        self.connect_timeout = connect_timeout or _settings["connect_timeout"]
+        self.read_timeout = read_timeout or _settings["read_timeout"]
+        self.base_url = base_url or _settings["base_url"]
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        import aiohttp
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def post_json(self, path, payload, headers=None):
+        """POST a JSON payload and return the decoded JSON response"""
+        await self.open()
+        url = f"{self.base_url.rstrip('/')}/{path.lstrip('/')}"
+        async with self.session.post(url, json=payload, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json()
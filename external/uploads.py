@@ -0,0 +1,175 @@
+"""
+Upload manager for Gemini video files.
+
+Each video is uploaded once per content hash and its remote file handle is reused by every model
+and request until shortly before the file expires (Gemini keeps uploads for 48 hours). Handles
+are remembered in external/.cache/uploads.json so the next run reuses them too. Concurrent
+requests for the same video wait on a single upload, upload_videos() uploads a whole folder in
+parallel, and the processing state is polled with a growing interval instead of a fixed sleep:
+
+    upload_videos(video_files)  # optional, warms the cache concurrently before the requests
+    video = get_upload_manager().upload(video_path)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from .payload import file_hash
+
+UPLOAD_INDEX_PATH = os.environ.get("UPLOAD_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "uploads.json"))
+UPLOAD_TTL = 47 * 3600       # seconds, used when a file doesn't report its expiration_time
+EXPIRY_MARGIN = 15 * 60      # stop reusing a file this long before it expires
+UPLOAD_WORKERS = 8
+POLL_INTERVAL = 0.5          # first processing-state poll, seconds
+POLL_INTERVAL_MAX = 10.0     # polls back off up to this
+MAX_RETRIES = 3
+
+def expiry_time(video):
+    """Unix time the remote file expires"""
+    expiration = getattr(video, "expiration_time", None)
+    if expiration is not None and hasattr(expiration, "timestamp"):
+        return expiration.timestamp()
+    return time.time() + UPLOAD_TTL
+
+class UploadManager:
+
+    def __init__(self, index_path=UPLOAD_INDEX_PATH):
+        self.index_path = index_path
+        self.files = {}       # content hash -> (remote file, expires at)
+        self.key_locks = {}   # content hash -> lock held while that video is being uploaded
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+        self.uploaded = 0
+        self.reused = 0
+
+    def load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        with self.lock:
+            now = time.time()
+            self.index = {digest: entry for digest, entry in self.index.items() if entry["expires_at"] > now}
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.index, f, indent=2)
+            os.replace(tmp_path, self.index_path)
+
+    def key_lock(self, digest):
+        with self.lock:
+            return self.key_locks.setdefault(digest, threading.Lock())
+
+    def upload(self, video_path, max_retries=MAX_RETRIES):
+        """Remote file for the video, uploading and waiting for processing only if no live upload exists"""
+        digest = file_hash(video_path)
+
+        with self.key_lock(digest):
+            cached = self.files.get(digest)
+            if cached is not None and cached[1] - EXPIRY_MARGIN > time.time():
+                self.reused += 1
+                return cached[0]
+
+            video = self.from_index(digest)
+            if video is None:
+                video = self.upload_with_retry(video_path, max_retries)
+                self.uploaded += 1
+            else:
+                self.reused += 1
+
+            expires_at = expiry_time(video)
+            self.files[digest] = (video, expires_at)
+            with self.lock:
+                self.index[digest] = {"name": video.name, "expires_at": expires_at, "file": os.path.basename(video_path)}
+            self.save_index()
+            return video
+
+    def from_index(self, digest):
+        """File uploaded by an earlier run if it's still live and ACTIVE, else None"""
+        from .providers import gemini
+
+        entry = self.index.get(digest)
+        if entry is None or entry["expires_at"] - EXPIRY_MARGIN <= time.time():
+            return None
+
+        try:
+            gemini.configure()
+            video = gemini.genai.get_file(entry["name"])
+            video = self.wait_until_processed(video)
+        except Exception as e:
+            print(f"Cached upload {entry['name']} not usable, uploading again: {e}")
+            return None
+
+        return video if video.state.name == "ACTIVE" else None
+
+    def wait_until_processed(self, video):
+        """Poll the processing state, the interval growing from POLL_INTERVAL to POLL_INTERVAL_MAX"""
+        from .providers import gemini
+
+        interval = POLL_INTERVAL
+        while video.state.name == "PROCESSING":
+            time.sleep(interval * random.uniform(0.8, 1.2))
+            interval = min(interval * 1.5, POLL_INTERVAL_MAX)
+            video = gemini.genai.get_file(video.name)
+        return video
+
+    def upload_with_retry(self, video_path, max_retries=MAX_RETRIES):
+        """Upload video with retry logic and wait for processing"""
+        from .providers import gemini
+
+        gemini.configure()
+        for attempt in range(max_retries):
+            try:
+                print(f"Uploading {os.path.basename(video_path)}... (attempt {attempt + 1})")
+                video = self.wait_until_processed(gemini.genai.upload_file(video_path))
+
+                if video.state.name == "ACTIVE":
+                    return video
+                print(f"Video {os.path.basename(video_path)} failed to process, state: {video.state.name}")
+
+            except Exception as e:
+                print(f"Upload attempt {attempt + 1} failed: {e}")
+
+            if attempt < max_retries - 1:
+                time.sleep(5 * (attempt + 1))
+
+        raise Exception(f"Failed to upload video after {max_retries} attempts")
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_upload_manager():
+    """Shared UploadManager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = UploadManager()
+    return _manager
+
+def upload_videos(video_paths, max_workers=UPLOAD_WORKERS):
+    """Upload (or reuse) all videos concurrently, returns {path: remote file or Exception}"""
+    manager = get_upload_manager()
+    results = {}
+
+    def upload_one(video_path):
+        try:
+            results[video_path] = manager.upload(video_path)
+        except Exception as e:
+            print(f"ERROR uploading {os.path.basename(video_path)}: {e}")
+            results[video_path] = e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(tqdm(executor.map(upload_one, video_paths), total=len(video_paths), desc="Uploading videos"))
+
+    print(f"Videos ready: {manager.uploaded} uploaded, {manager.reused} reused")
+    return results
@@ -10,14 +10,19 @@ CROP_HEIGHT = 500
 X_OFFSET = -100
 Y_OFFSET = +150
 
-def center_crop(image, w, h):
-    cx = w // 2 + X_OFFSET
-    cy = h // 2 + Y_OFFSET
-
-    x1 = max(cx - CROP_WIDTH // 2, 0)
-    y1 = max(cy - CROP_HEIGHT // 2, 0)
-    x2 = min(cx + CROP_WIDTH // 2, w)
-    y2 = min(cy + CROP_HEIGHT // 2, h)
+def center_crop_box(w, h, crop_width=CROP_WIDTH, crop_height=CROP_HEIGHT, x_offset=X_OFFSET, y_offset=Y_OFFSET):
+    cx = w // 2 + x_offset
+    cy = h // 2 + y_offset
+
+    x1 = max(cx - crop_width // 2, 0)
+    y1 = max(cy - crop_height // 2, 0)
+    x2 = min(cx + crop_width // 2, w)
+    y2 = min(cy + crop_height // 2, h)
+
+    return x1, y1, x2, y2
+
+def center_crop(image, w, h, crop_width=CROP_WIDTH, crop_height=CROP_HEIGHT, x_offset=X_OFFSET, y_offset=Y_OFFSET):
+    x1, y1, x2, y2 = center_crop_box(w, h, crop_width, crop_height, x_offset, y_offset)
 
     return image[y1:y2, x1:x2]
 
@@ -0,0 +1,204 @@
+"""
+Entity-level deduplication of the OCR datasets.
+
+The cameras save several frames of the same coil, truck or meter reading seconds apart, all with
+the same answer, and every frame used to be a request of its own. group_frames clusters the
+frames of one entity; ocr/inference/engine.py --dedup then sends only a few representatives of
+each group and gives every frame of the group their majority answer, so results and scoring stay
+per frame while the requests drop by the duplication factor.
+
+Frames are first grouped by the entity key of their dataset records where there is a reliable
+one: coil_id's entityId (joined through duplicateIds) and the capture event of a meter image (its
+loader and record timestamp). Number plate records only carry a bay session entityId that spans
+several trucks, so they have none. Neighbouring groups of the same camera are then merged when
+they are at most MAX_GAP seconds apart and the difference hashes (dHash) of their facing frames,
+computed on the preprocessed image, are within HASH_DISTANCE bits. Frames without metadata stay
+on their own.
+
+Meter frames are never merged across capture events: a whole-frame 8x8 hash can't see a digit
+change, and the reading does change within seconds (the cycle goes from 2 to 3 between the
+events at 1748500876 and 1748500881), so they are marked "merge": False.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from PIL import Image
+
+OCR_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(OCR_DIR, "data")
+MAX_GAP = 30.0       # seconds between neighbouring frames of one entity
+HASH_SIZE = 8        # dHash of HASH_SIZE x HASH_SIZE bits
+HASH_DISTANCE = 6    # differing bits allowed between frames of one entity
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def ids_by_url(clean_path):
+    """Original image URL -> image ids of a dataset's clean.json (a URL can be downloaded more than once)"""
+    ids = {}
+    for entry in read_json(clean_path):
+        if entry.get("original_image"):
+            ids.setdefault(entry["original_image"], []).append(entry["id"])
+    return ids
+
+def find(parent, item):
+    while parent.get(item, item) != item:
+        item = parent[item]
+    return item
+
+def coil_id_frames():
+    """{image id: {"entity", "source", "timestamp"}} of the coil_id images"""
+    records = read_json(os.path.join(DATA_DIR, "coil_id", "raw.json"))
+    ids = ids_by_url(os.path.join(DATA_DIR, "coil_id", "clean.json"))
+
+    # Records of one entityId, and records listing each other in duplicateIds, are the same coil
+    parent, first_of_entity = {}, {}
+    for record in records:
+        oid = record["_id"]["$oid"]
+        first = first_of_entity.setdefault(record["entityId"], oid)
+        for other in [first] + record.get("duplicateIds", []):
+            root, other_root = find(parent, oid), find(parent, other)
+            if root != other_root:
+                parent[other_root] = root
+
+    frames = {}
+    for record in records:
+        for image_id in ids.get(record.get("originalImage"), []):
+            frames[image_id] = {
+                "entity": f"coil:{find(parent, record['_id']['$oid'])}",
+                "source": record.get("cameraId"),
+                "timestamp": datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp(),
+            }
+    return frames
+
+def meter_frames():
+    """{image id: {"entity", "source", "timestamp"}} of the birla_copper meter images"""
+    folder = os.path.join(DATA_DIR, "digital_meter_readings", "birla_copper")
+    ids = ids_by_url(os.path.join(folder, "clean.json"))
+    frames = {}
+    for record in read_json(os.path.join(folder, "raw.json")):
+        for image_id in ids.get(record.get("original_image"), []):
+            frames[image_id] = {
+                "entity": f"{record['loader_id']}@{record['timestamp']}",  # the frames saved for one capture event
+                "source": record.get("camera_id"),
+                "timestamp": float(record["timestamp"]),
+                "merge": False,  # readings change between events a few seconds apart
+            }
+    return frames
+
+def number_plate_frames():
+    """{image id: {"entity", "source", "timestamp"}} of the number plate images (no entity, see above)"""
+    folder = os.path.join(DATA_DIR, "number_plate_recognition")
+    ids = ids_by_url(os.path.join(folder, "clean.json"))
+
+    frames = {}
+    for record in read_json(os.path.join(folder, "raw.json")):
+        # The bay front camera image, as download.py picks it
+        urls = [url for camera, url in record.get("originalImage", {}).items() if camera.startswith("cam_bay") and "_front" in camera]
+        for image_id in ids.get(urls[0], []) if urls else []:
+            frames[image_id] = {"entity": None, "source": record.get("cameraGpId"), "timestamp": float(record["createdAt"])}
+    return frames
+
+def dhash(image_path, preprocess=None):
+    """Difference hash of an image (after preprocess) as an int of HASH_SIZE * HASH_SIZE bits"""
+    with Image.open(image_path) as img:
+        if preprocess is not None and not preprocess.is_noop():
+            img = preprocess(img)
+        small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+
+    pixels = small.tobytes()  # one byte per pixel in "L" mode
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            bits = bits << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return bits
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def group_frames(image_files, image_id, frames=None, preprocess=None, max_gap=MAX_GAP, hash_distance=HASH_DISTANCE):
+    """
+    Cluster the images into groups showing the same entity.
+
+    Args:
+        image_files (list): Images to group
+        image_id (callable): Image path -> id of the frames metadata, e.g. TASKS[task]["image_id"]
+        frames (dict): {image id: {"entity", "source", "timestamp", "merge"}}, e.g. TASKS[task]["frames"]();
+            frames with "merge": False are only grouped by their entity
+        preprocess (Preprocess): Applied before hashing, e.g. a crop to the region that's read
+        max_gap (float): Seconds allowed between neighbouring frames of one group
+        hash_distance (int): dHash bits allowed to differ between neighbouring frames of one group
+
+    Returns:
+        list: Groups (lists of image paths in time order), in the order of their first image
+    """
+    frames = frames or {}
+
+    def frame(image_path):
+        return frames.get(image_id(image_path)) or {}
+
+    by_entity = {}
+    for image_path in image_files:
+        entity = frame(image_path).get("entity")
+        by_entity.setdefault(("entity", entity) if entity is not None else ("image", image_path), []).append(image_path)
+
+    timed, untimed = [], []
+    for group in by_entity.values():
+        if all(frame(image_path).get("timestamp") is not None for image_path in group):
+            timed.append(sorted(group, key=lambda image_path: frame(image_path)["timestamp"]))
+        else:
+            untimed.append(group)
+    timed.sort(key=lambda group: (str(frame(group[0]).get("source")), frame(group[0])["timestamp"]))
+
+    hashes = {}
+    def hash_of(image_path):
+        if image_path not in hashes:
+            try:
+                hashes[image_path] = dhash(image_path, preprocess)
+            except OSError as e:
+                print(f"Could not hash {os.path.basename(image_path)}, keeping it apart: {e}")
+                hashes[image_path] = None
+        return hashes[image_path]
+
+    # Merge a group into the previous one of the same camera when they're close in time and look alike
+    merged = []
+    for group in timed:
+        previous = merged[-1] if merged else None
+        if (previous is not None
+                and frame(previous[-1]).get("merge", True) and frame(group[0]).get("merge", True)
+                and frame(previous[-1]).get("source") == frame(group[0]).get("source")
+                and frame(group[0])["timestamp"] - frame(previous[-1])["timestamp"] <= max_gap
+                and hash_of(previous[-1]) is not None and hash_of(group[0]) is not None
+                and hamming(hash_of(previous[-1]), hash_of(group[0])) <= hash_distance):
+            previous.extend(group)
+        else:
+            merged.append(group)
+
+    order = {image_path: i for i, image_path in enumerate(image_files)}
+    return sorted(merged + untimed, key=lambda group: min(order[image_path] for image_path in group))
+
+def representatives(group, count):
+    """Up to count frames spread evenly over a group (the middle one for a single frame)"""
+    if count >= len(group):
+        return list(group)
+    if count <= 1:
+        return [group[len(group) // 2]]
+    step = (len(group) - 1) / (count - 1)
+    return [group[round(i * step)] for i in range(count)]
+
+def majority(answers, validate=None):
+    """Most common answer, counting only the valid ones if there are any; ties go to the earliest"""
+    candidates = [answer for answer in answers if validate is None or validate(answer)] or answers
+    votes = []  # [answer, count]; answers can be dicts, so no Counter
+    for answer in candidates:
+        for vote in votes:
+            if vote[0] == answer:
+                vote[1] += 1
+                break
+        else:
+            votes.append([answer, 1])
+    return max(votes, key=lambda vote: vote[1])[0] if votes else ""
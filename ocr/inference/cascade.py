@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Cheap-first model cascade for the OCR use cases
+Every image goes to the first (fast, cheap) tier; an answer is accepted when it passes the task's
+validator (ocr/tasks.py) and, for a tier of several models, all of them agree. Everything else is
+escalated to the next, stronger tier, and the last tier's answer is taken as is. Reports accuracy,
+escalation rate, cost and per-image latency of the cascade against each model run on its own
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+from collections import defaultdict
+
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import Preprocess, Request, response_cost, run_requests
+from external.latency import percentile
+from ocr.inference.sweep import get_annotated_images, image_id
+from ocr.tasks import TASKS, is_correct, load_annotations
+
+DEFAULT_TIERS = [["gemini_2_0_flash"], ["gemini_2_5_pro_preview"]]
+
+def pick_answer(answers, validate):
+    """First valid answer of a tier, else the first answer at all"""
+    for answer in answers:
+        if answer is not None and validate(answer):
+            return answer
+    return next((answer for answer in answers if answer is not None), "")
+
+def run_tier(task, models, image_files, preprocess, output=None):
+    """Answers and responses of every model of a tier for the images: {path: [(model, answer, response)]}"""
+    spec = TASKS[task]
+    responses = run_requests(
+        [Request(model_id, spec["system_instruction"], spec["prompt"], image_path=image_path, preprocess=preprocess, output=output) for model_id in models for image_path in image_files],
+        desc="+".join(models)
+    )
+
+    results = defaultdict(list)
+    for image_path in image_files:
+        for model_id in models:
+            try:
+                response = responses.result(model_id, image_path)
+                results[image_path].append((model_id, spec["parse"](response.text), response))
+            except Exception as e:
+                print(f"ERROR with {model_id} on {os.path.basename(image_path)}: {e}")
+                results[image_path].append((model_id, None, None))
+    return results
+
+def run_cascade(task, tiers, image_files, preprocess=None, output=None):
+    """
+    Run the images through the tiers, escalating invalid or disputed answers.
+
+    Args:
+        task (str): Key of TASKS
+        tiers (list): Lists of model IDs, cheapest tier first
+        image_files (list): Images to read
+        preprocess (Preprocess): Optional image preprocessing for every request
+        output (OutputFormat): Optional structured output for every request, e.g. TASKS[task]["output"]
+
+    Returns:
+        dict: image path -> {"answer", "tier", "accepted", "cost", "latency"}
+    """
+    validate = TASKS[task]["validate"]
+    final = {}
+    cost = defaultdict(float)
+    latency = defaultdict(float)
+    pending = list(image_files)
+
+    for level, models in enumerate(tiers):
+        if not pending:
+            break
+
+        tier_results = run_tier(task, models, pending, preprocess, output)
+        escalated = []
+        for image_path in pending:
+            answers = [answer for _, answer, _ in tier_results[image_path]]
+            responses = [response for _, _, response in tier_results[image_path] if response is not None]
+
+            # a tier's models run in parallel, tiers run one after the other
+            cost[image_path] += sum(response_cost(response) for response in responses)
+            latency[image_path] += max((response.timings["total"] for response in responses), default=0.0)
+
+            accepted = all(answer is not None and validate(answer) for answer in answers) and all(answer == answers[0] for answer in answers)
+            if accepted or level == len(tiers) - 1:
+                final[image_path] = {
+                    "answer": pick_answer(answers, validate),
+                    "tier": level,
+                    "accepted": accepted,
+                    "cost": cost[image_path],
+                    "latency": latency[image_path],
+                }
+            else:
+                escalated.append(image_path)
+
+        print(f"Tier {level} ({'+'.join(models)}): {len(pending) - len(escalated)} answered, {len(escalated)} escalated")
+        pending = escalated
+
+    return final
+
+def summarize(name, outcomes, annotations, tiers=None):
+    """Accuracy, cost and latency of a run ({path: {"answer", "cost", "latency", ...}})"""
+    paths = list(outcomes)
+    correct = [is_correct(outcomes[p]["answer"], annotations[image_id(p)]) for p in paths]
+    costs = [outcomes[p]["cost"] for p in paths]
+    latencies = [outcomes[p]["latency"] for p in paths]
+
+    summary = {
+        "run": name,
+        "images": len(paths),
+        "accuracy": sum(correct) / len(paths) if paths else 0.0,
+        "cost_per_image": statistics.mean(costs) if costs else 0.0,
+        "total_cost": sum(costs),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+    }
+    if tiers is not None:
+        escalated = sum(1 for p in paths if outcomes[p]["tier"] > 0)
+        summary["escalation_rate"] = escalated / len(paths) if paths else 0.0
+        summary["answered_by_tier"] = [sum(1 for p in paths if outcomes[p]["tier"] == level) for level in range(len(tiers))]
+        summary["predictions"] = [
+            {"id": image_id(p), "ocr_predicted": outcomes[p]["answer"], "ocr_annotated": annotations[image_id(p)], "tier": outcomes[p]["tier"]}
+            for p in paths
+        ]
+    return summary
+
+def run_single(task, model_id, image_files, preprocess, output=None):
+    """Baseline: one model on every image"""
+    results = run_tier(task, [model_id], image_files, preprocess, output)
+    return {
+        image_path: {
+            "answer": answer or "",
+            "cost": response_cost(response) if response is not None else 0.0,
+            "latency": response.timings["total"] if response is not None else 0.0,
+        }
+        for image_path, [(_, answer, response)] in results.items()
+    }
+
+def print_report(summaries):
+    print("=" * 104)
+    print(f"{'RUN':<44}{'ACCURACY':>10}{'ESCALATED':>11}{'$/IMAGE':>12}{'P50 (s)':>9}{'P95 (s)':>9}{'P99 (s)':>9}")
+    print("-" * 104)
+    for s in summaries:
+        escalated = f"{s['escalation_rate']:.1%}" if "escalation_rate" in s else "-"
+        print(f"{s['run']:<44}{s['accuracy']:>10.2%}{escalated:>11}{s['cost_per_image']:>12.6f}{s['latency_p50']:>9.2f}{s['latency_p95']:>9.2f}{s['latency_p99']:>9.2f}")
+    print("=" * 104)
+
+def parse_tier(value):
+    return [model_id.strip() for model_id in value.split(",") if model_id.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Cheap-first model cascade with validated escalation for an OCR task.")
+    parser.add_argument("--task", type=str, choices=list(TASKS), required=True)
+    parser.add_argument("--tiers", type=parse_tier, nargs="+", default=DEFAULT_TIERS,
+                        help="model IDs per tier, cheapest first; a tier of several models (a,b) must agree")
+    parser.add_argument("--folder", type=str, default=None, help="image folder (default: the task's folder)")
+    parser.add_argument("--max-side", type=int, default=None, help="preprocessing: long side cap")
+    parser.add_argument("--crop", type=str, default=None, help="preprocessing: crop preset or WxH+X+Y")
+    parser.add_argument("--grayscale", action="store_true", help="preprocessing: convert to grayscale")
+    parser.add_argument("--structured", action="store_true", help="JSON schema output with the task's output-token cap")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N annotated images")
+    parser.add_argument("--no-baselines", action="store_true", help="skip running every model on its own")
+    parser.add_argument("--output", type=str, default=None, help="report path (default: cascade_<task>.json)")
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.task)
+    image_files = get_annotated_images(args.folder or TASKS[args.task]["folder"], annotations, args.limit)
+    if not image_files:
+        print(f"No annotated images found for {args.task}")
+        return
+
+    preprocess = Preprocess(args.max_side, args.crop, args.grayscale)
+    output = TASKS[args.task]["output"] if args.structured else None
+    name = " > ".join("+".join(models) for models in args.tiers)
+
+    # Baselines first: the cascade then reads the same responses from the response cache
+    summaries = []
+    if not args.no_baselines:
+        for model_id in dict.fromkeys(m for models in args.tiers for m in models):
+            summaries.append(summarize(model_id, run_single(args.task, model_id, image_files, preprocess, output), annotations))
+
+    outcomes = run_cascade(args.task, args.tiers, image_files, preprocess, output)
+    summaries.insert(0, summarize(f"cascade {name}", outcomes, annotations, args.tiers))
+
+    print_report(summaries)
+
+    output_path = args.output or f"cascade_{args.task}.json"
+    with open(output_path, 'w') as f:
+        json.dump({"task": args.task, "tiers": args.tiers, "images": len(image_files), "results": summaries}, f, indent=2)
+    print(f"Saved cascade report to {output_path}")
+
+if __name__ == "__main__":
+    main()
+
+# python ocr/inference/cascade.py --task number_plate_recognition --tiers gemini_2_0_flash gemini_2_5_pro_preview --limit 50
+# python ocr/inference/cascade.py --task coil_id --tiers gemini_2_0_flash,gpt_4_1_mini gpt_4o
@@ -2,64 +2,57 @@
 """
 Test script for Gemini models with coil ID recognition functionality on folder of images
 Specifically extracts coil ID text written on coils in images
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
-import json
 import sys
-from pathlib import Path
 from tqdm import tqdm
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/openai"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gpt_4o, gpt_4_1_mini, gpt_4_1, o4_mini
+from external import Preprocess, Request, ResultWriter, generate, run_batch, run_packed, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, parse_coil_id
 # Configuration
-MODEL_TO_USE = gpt_4o 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/coil_id/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "coil_id"
+MODEL_TO_USE = "gpt_4o"
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, crop="coil_id", grayscale=True), see ocr/inference/sweep.py
+BATCH_MODE = False  # run test_all_models_on_folder through the provider batch APIs (cheaper, not interactive; gpt_4o has no batch equivalent)
+PACK_SIZE = 1  # images per request in test_all_models_on_folder, pick it with ocr/inference/sweep.py --pack-size
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
 
-# System instruction for coil ID recognition
-SYSTEM_INSTRUCTION = """You are a coil ID recognition assistant. Your ONLY task is to read and extract the coil ID text that is written on coils in images. You must ONLY return the exact text/numbers written on the coil and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Just the coil ID text as it appears on the coil."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the coil ID text written on the coil. Extract ONLY the exact text/numbers that are written on the coil surface. Return ONLY that text with no other explanations, formatting, or additional words. If you cannot find any text written on the coil clearly, return an empty string."""
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
 
 def test_single_image(image_path):
     """Test coil ID recognition on a single image"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT
         )
         
-        # Clean the response to get the coil ID text
-        clean_response = response.strip()
-        
-        # Return empty string if no valid coil ID found
-        if not clean_response or clean_response.lower() in ['none', 'n/a', 'not found', 'no text', 'unclear']:
-            coil_id = ""
-        else:
-            coil_id = clean_response
+        # Coil ID from the structured or free-text reply, empty if none was found
+        coil_id = parse_coil_id(response.text)
         
         # Create result
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": coil_id
         }
         
@@ -78,30 +71,25 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize empty JSON array
-    all_results = []
-    result_count = 0
-    
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting coil ID text from images"):
-        result = test_single_image(image_path)
-        if result:
-            all_results.append(result)
-            result_count += 1
-            
-            # Save updated results to JSON file after each image
-            with open('coil_id_results.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Append each result as it comes in, skipping images an interrupted run already did
+    with ResultWriter('coil_id_results.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting coil ID text from images"):
+            result = test_single_image(image_path)
+            if result:
+                writer.write(result)
     
-    print(f"Saved {result_count} coil ID recognition results to coil_id_results.json")
+    print(f"Saved {len(writer.results)} coil ID recognition results to coil_id_results.json")
 
 def test_all_models_on_folder():
     """Test all available models with coil ID recognition on the folder"""
     models = [
-        ("gpt_4o", gpt_4o),
-        ("gpt_4_1_mini", gpt_4_1_mini),
-        ("gpt_4_1", gpt_4_1),
-        ("o4_mini", o4_mini),
+        "gpt_4o",
+        "gpt_4_1_mini",
+        "gpt_4_1",
+        "o4_mini",
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -110,48 +98,39 @@ def test_all_models_on_folder():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    for model_name, model_func in models:
-        # Initialize empty JSON array for each model
-        model_results = []
-        result_count = 0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again
+    writers = {model_name: ResultWriter(f'{model_name}_coil_id.json') for model_name in models}
+    requests = [
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ]
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
         
-        for image_path in tqdm(image_files, desc=f"Coil ID recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Clean the response to get the coil ID text
-                # clean_response = response.strip()
-                
-                # Return empty string if no valid coil ID found
-                # if not clean_response or clean_response.lower() in ['none', 'n/a', 'not found', 'no text', 'unclear']:
-                #     coil_id = ""
-                # else:
-                #     coil_id = clean_response
-                
-                # Create result
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": response['choices'][0]['message']['content'].strip()
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}_coil_id.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Coil ID from the structured or free-text reply, empty if none was found
+        coil_id = parse_coil_id(response.text)
         
-        print(f"Saved {result_count} results to {model_name}_coil_id.json")
+        # Append to the results file named after the model
+        writers[model_name].write({
+            "id": get_image_id(image_path),
+            "ocr_predicted": coil_id
+        })
+    
+    # Run every (model, image) request concurrently within the provider rate limits, PACK_SIZE
+    # images per request, or as batch jobs
+    if PACK_SIZE > 1:
+        run_packed(requests, PACK_SIZE, on_result=save_result)
+    else:
+        (run_batch if BATCH_MODE else run_requests)(requests, on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
+        print(f"Saved {len(writer.results)} results to {model_name}_coil_id.json")
 
 if __name__ == "__main__":
     # Test single model on folder
@@ -2,138 +2,76 @@
 """
 Test script for Gemini models with tonnage recognition functionality on folder of images
 Specifically extracts tonnage values from digital meter readings
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
-import json
 import sys
-from pathlib import Path
 from tqdm import tqdm
-from PIL import Image
-import math
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/gemini"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gemini_1_5_flash, gemini_1_5_pro, gemini_2_0_flash, gemini_2_5_pro_preview
+from external import Preprocess, Request, ResultWriter, generate, response_cost, response_savings, run_batch, run_packed, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, parse_tonnage
 
 # Configuration
-MODEL_TO_USE = gemini_1_5_flash 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/digital_meter_readings/birla_copper/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "digital_meter_reading"
+MODEL_TO_USE = "gemini_1_5_flash"
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, grayscale=True), see ocr/inference/sweep.py
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
+BATCH_MODE = False  # run test_all_models_on_folder through the provider batch APIs (cheaper, not interactive)
+PACK_SIZE = 1  # images per request in test_all_models_on_folder, pick it with ocr/inference/sweep.py --pack-size
 
-# Pricing constants for Gemini models (per 1M tokens)
-GEMINI_PRICING = {
-    'gemini_1_5_flash': {'input': 0.075, 'output': 0.30},
-    'gemini_1_5_pro': {'input': 1.25, 'output': 5.00},
-    'gemini_2_0_flash': {'input': 0.10, 'output': 0.40},
-    'gemini_2_5_pro_preview': {'input': 1.25, 'output': 10.00}
-}
-
-# System instruction for tonnage recognition
-SYSTEM_INSTRUCTION = """You are a tonnage reading assistant. Your ONLY task is to extract tonnage values from digital meter images. You must ONLY return the tonnage number as a string float/int value without the 't' suffix and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Convert comma-separated values to decimal format (e.g., "15,720" becomes "15.72")."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the tonnage value. The tonnage is usually present as XXXXXXt (with 't' indicating tonnage) and is typically next to the text "Total". Extract ONLY the tonnage number without the 't' suffix and convert it to decimal format. For example, if you see "15,720t", return only "15.72" as a string. Remove trailing zeros after decimal point. Return only the string float/int value. If you cannot find a tonnage value clearly, return an empty string."""
-
-def calculate_cost(model_name, input_tokens, output_tokens):
-    """Calculate the cost of API call based on token usage"""
-    if model_name not in GEMINI_PRICING:
-        print(f"Warning: Unknown model {model_name}, using default pricing")
-        model_name = 'gemini_1_5_flash'
-    
-    pricing = GEMINI_PRICING[model_name]
-    input_cost = (input_tokens / 1_000_000) * pricing['input']
-    output_cost = (output_tokens / 1_000_000) * pricing['output']
-    total_cost = input_cost + output_cost
-    
-    return total_cost
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
-
-def convert_tonnage_to_decimal(tonnage_str):
-    """Convert comma-separated tonnage to decimal format (xx,xxx -> xx.xx)"""
-    if not tonnage_str or tonnage_str == "":
-        return ""
-    
-    try:
-        # Remove any 't' suffix if present
-        clean_tonnage = tonnage_str.lower().replace('t', '').strip()
-        
-        # Handle comma-separated format (e.g., "15,720" -> "15.72")
-        if ',' in clean_tonnage:
-            parts = clean_tonnage.split(',')
-            if len(parts) == 2:
-                # Convert xx,xxx to xx.xx format
-                integer_part = parts[0]
-                decimal_part = parts[1][:2]  # Take only first 2 digits after comma
-                converted = f"{integer_part}.{decimal_part}"
-                
-                # Convert to float to remove trailing zeros, then back to string
-                float_val = float(converted)
-                if float_val == int(float_val):
-                    return str(int(float_val))
-                else:
-                    return str(float_val).rstrip('0').rstrip('.')
-        
-        # If no comma, try to convert directly
-        float_val = float(clean_tonnage)
-        if float_val == int(float_val):
-            return str(int(float_val))
-        else:
-            return str(float_val).rstrip('0').rstrip('.')
-            
-    except (ValueError, IndexError):
-        return tonnage_str  # Return original if conversion fails
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
 
 def test_single_image(image_path, model_name='gemini_1_5_flash'):
     """Test tonnage recognition on a single image"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT
         )
         
         # Get actual token counts from response usage metadata
-        if hasattr(response, 'usage_metadata'):
-            input_tokens = response.usage_metadata.prompt_token_count
-            output_tokens = response.usage_metadata.candidates_token_count
-            total_tokens = response.usage_metadata.total_token_count
+        if response.input_tokens is not None:
+            input_tokens = response.input_tokens
+            output_tokens = response.output_tokens
+            total_tokens = response.total_tokens
         else:
             print("Warning: No usage metadata available from response")
             return None
         
-        cost_usd = calculate_cost(model_name, input_tokens, output_tokens)
-        
-        # Clean the response and extract tonnage value
-        clean_response = response.text.strip()
-        
-        # Convert tonnage value to decimal format
-        tonnage_value = convert_tonnage_to_decimal(clean_response)
+        # Priced with external/pricing.py, cached prompt tokens at the cached-input price
+        cost_usd = response_cost(response)
+        savings_usd = response_savings(response)
         
-        # Return empty string if no valid tonnage found
-        if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-            tonnage_value = ""
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
         
         # Create result
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": tonnage_value,
             "cost_usd": cost_usd,
+            "cache_savings_usd": savings_usd,
             "input_tokens": input_tokens,
+            "cached_input_tokens": response.cached_input_tokens or 0,
             "output_tokens": output_tokens,
             "total_tokens": total_tokens
         }
@@ -153,38 +91,36 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize empty JSON array
-    all_results = []
-    result_count = 0
-    total_cost = 0.0
-    total_input_tokens = 0
-    total_output_tokens = 0
+    # Append each result as it comes in, skipping images an interrupted run already did
+    with ResultWriter('tonnage_readings.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting tonnage values from digital meters"):
+            result = test_single_image(image_path)
+            if result:
+                writer.write(result)
     
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting tonnage values from digital meters"):
-        result = test_single_image(image_path)
-        if result:
-            all_results.append(result)
-            result_count += 1
-            total_cost += result['cost_usd']
-            total_input_tokens += result['input_tokens']
-            total_output_tokens += result['output_tokens']
-            
-            # Save updated results to JSON file after each image
-            with open('tonnage_readings.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Totals over every result, including those of an interrupted run
+    result_count = len(writer.results)
+    total_cost = sum(result['cost_usd'] for result in writer.results)
+    total_savings = sum(result['cache_savings_usd'] for result in writer.results)
+    total_input_tokens = sum(result['input_tokens'] for result in writer.results)
+    total_cached_tokens = sum(result['cached_input_tokens'] for result in writer.results)
+    total_output_tokens = sum(result['output_tokens'] for result in writer.results)
     
     print(f"Saved {result_count} tonnage recognition results to tonnage_readings.json")
     print(f"Total cost: ${total_cost:.6f}")
     print(f"Average cost per image: ${total_cost/result_count:.6f}")
     print(f"Total input tokens: {total_input_tokens:,}")
+    print(f"Cached input tokens: {total_cached_tokens:,} (prompt caching saved ${total_savings:.6f})")
     print(f"Total output tokens: {total_output_tokens:,}")
     print(f"Total tokens: {total_input_tokens + total_output_tokens:,}")
 
 def test_all_models_on_folder():
     """Test all available models with tonnage recognition on the folder"""
     models = [
-        ("gemini_2_5_pro_preview", gemini_2_5_pro_preview),
+        "gemini_2_5_pro_preview",
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -193,71 +129,74 @@ def test_all_models_on_folder():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    for model_name, model_func in models:
-        # Initialize empty JSON array for each model
-        model_results = []
-        result_count = 0
-        total_cost = 0.0
-        total_input_tokens = 0
-        total_output_tokens = 0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again
+    writers = {model_name: ResultWriter(f'{model_name}_tonnage.json') for model_name in models}
+    requests = [
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ]
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
+        
+        # Get actual token counts from response usage metadata
+        if response.input_tokens is not None:
+            input_tokens = response.input_tokens
+            output_tokens = response.output_tokens
+            total_tokens = response.total_tokens
+        else:
+            print(f"Warning: No usage metadata available for {os.path.basename(image_path)}")
+            return
+        
+        # Priced with external/pricing.py, cached prompt tokens at the cached-input price
+        cost_usd = response_cost(response)
+        savings_usd = response_savings(response)
+        
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
+        
+        # Create result
+        ocr_result = {
+            "id": get_image_id(image_path),
+            "ocr_predicted": tonnage_value,
+            "cost_usd": cost_usd,
+            "cache_savings_usd": savings_usd,
+            "input_tokens": input_tokens,
+            "cached_input_tokens": response.cached_input_tokens or 0,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens
+        }
+        
+        # Append to the results file named after the model
+        writers[model_name].write(ocr_result)
+    
+    # Run every (model, image) request concurrently within the provider rate limits, PACK_SIZE
+    # images per request, or as batch jobs
+    if PACK_SIZE > 1:
+        run_packed(requests, PACK_SIZE, on_result=save_result)
+    else:
+        (run_batch if BATCH_MODE else run_requests)(requests, on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
         
-        for image_path in tqdm(image_files, desc=f"Tonnage recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Get actual token counts from response usage metadata
-                if hasattr(response, 'usage_metadata'):
-                    input_tokens = response.usage_metadata.prompt_token_count
-                    output_tokens = response.usage_metadata.candidates_token_count
-                    total_tokens = response.usage_metadata.total_token_count
-                else:
-                    print(f"Warning: No usage metadata available for {os.path.basename(image_path)}")
-                    continue
-                
-                cost_usd = calculate_cost(model_name, input_tokens, output_tokens)
-                
-                # Clean the response and convert tonnage value to decimal format
-                clean_response = response.text.strip()
-                tonnage_value = convert_tonnage_to_decimal(clean_response)
-                
-                # Return empty string if no valid tonnage found
-                if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-                    tonnage_value = ""
-                
-                # Create result
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": tonnage_value,
-                    "cost_usd": cost_usd,
-                    "input_tokens": input_tokens,
-                    "output_tokens": output_tokens,
-                    "total_tokens": total_tokens
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                total_cost += cost_usd
-                total_input_tokens += input_tokens
-                total_output_tokens += output_tokens
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}_tonnage.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Totals over every result, including those of an interrupted run
+        result_count = len(writer.results)
+        total_cost = sum(result['cost_usd'] for result in writer.results)
+        total_savings = sum(result['cache_savings_usd'] for result in writer.results)
+        total_input_tokens = sum(result['input_tokens'] for result in writer.results)
+        total_cached_tokens = sum(result['cached_input_tokens'] for result in writer.results)
+        total_output_tokens = sum(result['output_tokens'] for result in writer.results)
         
         print(f"Saved {result_count} results to {model_name}_tonnage.json")
         print(f"{model_name} - Total cost: ${total_cost:.6f}")
         print(f"{model_name} - Average cost per image: ${total_cost/result_count:.6f}")
         print(f"{model_name} - Total input tokens: {total_input_tokens:,}")
+        print(f"{model_name} - Cached input tokens: {total_cached_tokens:,} (prompt caching saved ${total_savings:.6f})")
         print(f"{model_name} - Total output tokens: {total_output_tokens:,}")
         print(f"{model_name} - Total tokens: {total_input_tokens + total_output_tokens:,}")
         print()
@@ -2,102 +2,63 @@
 """
 Test script for Gemini models with tonnage recognition functionality on folder of images
 Specifically extracts tonnage values from digital meter readings
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
 import json
 import sys
 import time
-from pathlib import Path
 from tqdm import tqdm
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/gemini"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gemini_1_5_flash, gemini_1_5_pro, gemini_2_0_flash, gemini_2_5_pro_preview
+from external import Hedger, Preprocess, Request, ResultWriter, generate, latency_report, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, answer_validator, parse_tonnage
 
 # Configuration
-MODEL_TO_USE = gemini_2_5_pro_preview 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/digital_meter_readings/birla_copper/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "digital_meter_reading"
+MODEL_TO_USE = "gemini_2_5_pro_preview"
+HEDGE_BACKUP = "gpt_4_1_mini"  # other provider, for test_hedging_on_folder
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, grayscale=True), see ocr/inference/sweep.py
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
 
-# System instruction for tonnage recognition
-SYSTEM_INSTRUCTION = """You are a tonnage reading assistant. Your ONLY task is to extract tonnage values from digital meter images. You must ONLY return the tonnage number as a string float/int value without the 't' suffix and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Convert comma-separated values to decimal format (e.g., "15,720" becomes "15.72")."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the tonnage value. The tonnage is usually present as XXXXXXt (with 't' indicating tonnage) and is typically next to the text "Total". Extract ONLY the tonnage number without the 't' suffix and convert it to decimal format. For example, if you see "15,720t", return only "15.72" as a string. Remove trailing zeros after decimal point. Return only the string float/int value. If you cannot find a tonnage value clearly, return an empty string."""
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
-
-def convert_tonnage_to_decimal(tonnage_str):
-    """Convert comma-separated tonnage to decimal format (xx,xxx -> xx.xx)"""
-    if not tonnage_str or tonnage_str == "":
-        return ""
-    
-    try:
-        # Remove any 't' suffix if present
-        clean_tonnage = tonnage_str.lower().replace('t', '').strip()
-        
-        # Handle comma-separated format (e.g., "15,720" -> "15.72")
-        if ',' in clean_tonnage:
-            parts = clean_tonnage.split(',')
-            if len(parts) == 2:
-                # Convert xx,xxx to xx.xx format
-                integer_part = parts[0]
-                decimal_part = parts[1][:2]  # Take only first 2 digits after comma
-                converted = f"{integer_part}.{decimal_part}"
-                
-                # Convert to float to remove trailing zeros, then back to string
-                float_val = float(converted)
-                if float_val == int(float_val):
-                    return str(int(float_val))
-                else:
-                    return str(float_val).rstrip('0').rstrip('.')
-        
-        # If no comma, try to convert directly
-        float_val = float(clean_tonnage)
-        if float_val == int(float_val):
-            return str(int(float_val))
-        else:
-            return str(float_val).rstrip('0').rstrip('.')
-            
-    except (ValueError, IndexError):
-        return tonnage_str  # Return original if conversion fails
-
-def test_single_image(image_path):
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
+
+def test_single_image(image_path, timed=None):
     """Test tonnage recognition on a single image"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT,
+            use_cache=False,  # time the model, not the response cache
+            stream=True       # record time to first token
         )
+        if timed is not None:
+            timed.append((image_path, response))
         
-        # Clean the response and extract tonnage value
-        clean_response = response.strip()
-        
-        # Convert tonnage value to decimal format
-        tonnage_value = convert_tonnage_to_decimal(clean_response)
-        
-        # Return empty string if no valid tonnage found
-        if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-            tonnage_value = ""
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
         
         # Create result
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": tonnage_value
         }
         
@@ -119,27 +80,29 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize empty JSON array
-    all_results = []
-    result_count = 0
-    
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting tonnage values from digital meters"):
-        result = test_single_image(image_path)
-        if result:
-            all_results.append(result)
-            result_count += 1
-            
-            # Save updated results to JSON file after each image
-            with open('tonnage_readings.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Append each result as it comes in, skipping images an interrupted run already did
+    timed = []
+    with ResultWriter('tonnage_readings.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting tonnage values from digital meters"):
+            result = test_single_image(image_path, timed)
+            if result:
+                writer.write(result)
     
     end_time = time.time()
     total_time = end_time - start_time
     print(f"\nProcessing completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Total time taken: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
-    print(f"Average time per image: {total_time/len(image_files):.2f} seconds")
-    print(f"Saved {result_count} tonnage recognition results to tonnage_readings.json")
+    print(f"Average time per image: {total_time/max(len(pending), 1):.2f} seconds")
+    print(f"Saved {len(writer.results)} tonnage recognition results to tonnage_readings.json")
+
+    # Per-request latency percentiles (the total above also includes progress bar and JSON writes)
+    report = latency_report({MODEL_TO_USE: timed})
+    with open('tonnage_latency.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Saved latency report to tonnage_latency.json")
 
 def test_all_models_on_folder():
     """Test all available models with tonnage recognition on the folder"""
@@ -147,7 +110,7 @@ def test_all_models_on_folder():
     print(f"Starting tonnage recognition processing at {time.strftime('%Y-%m-%d %H:%M:%S')}")
     
     models = [
-        ("gemini_2_5_pro_preview", gemini_2_5_pro_preview),
+        "gemini_2_5_pro_preview",
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -156,47 +119,40 @@ def test_all_models_on_folder():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    for model_name, model_func in models:
-        # Initialize empty JSON array for each model
-        model_results = []
-        result_count = 0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again, so the latency report only covers this run
+    writers = {model_name: ResultWriter(f'{model_name}_tonnage.json') for model_name in models}
+    timed = {model_name: [] for model_name in models}
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
+        timed[model_name].append((image_path, response))
         
-        for image_path in tqdm(image_files, desc=f"Tonnage recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Clean the response and convert tonnage value to decimal format
-                clean_response = response.strip()
-                tonnage_value = convert_tonnage_to_decimal(clean_response)
-                
-                # Return empty string if no valid tonnage found
-                if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-                    tonnage_value = ""
-                
-                # Create result
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": tonnage_value
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}_tonnage.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
         
-        print(f"Saved {result_count} results to {model_name}_tonnage.json")
+        # Create result
+        ocr_result = {
+            "id": get_image_id(image_path),
+            "ocr_predicted": tonnage_value
+        }
+        
+        # Append to the results file named after the model
+        writers[model_name].write(ocr_result)
+    
+    # Run every (model, image) request concurrently within the provider rate limits, bypassing the
+    # response cache and streaming so every request records its own connect/TTFT/total time
+    run_requests([
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT, use_cache=False, stream=True)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ], on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
+        print(f"Saved {len(writer.results)} results to {model_name}_tonnage.json")
     
     end_time = time.time()
     total_time = end_time - start_time
@@ -204,9 +160,54 @@ def test_all_models_on_folder():
     print(f"Total time taken: {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
     print(f"Average time per image: {total_time/len(image_files):.2f} seconds")
 
+    # Per-request latency percentiles (the total above also includes progress bar and JSON writes)
+    report = latency_report(timed)
+    with open('tonnage_latency.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Saved latency report to tonnage_latency.json")
+
+def test_hedging_on_folder():
+    """Compare tail latency of MODEL_TO_USE with and without a hedged backup request to HEDGE_BACKUP"""
+    image_files = get_image_files(FOLDER_PATH)
+
+    if not image_files:
+        print(f"No image files found in {FOLDER_PATH}")
+        return
+
+    validate = answer_validator(TASK)
+    timed = {"off": [], "on": []}
+
+    # Sequential on purpose: hedging targets the latency of a single request, not throughput.
+    # The hedging-off pass also gives the Hedger MODEL_TO_USE's latency distribution.
+    with Hedger({MODEL_TO_USE: HEDGE_BACKUP}) as hedger:
+        for mode in ["off", "on"]:
+            for image_path in tqdm(image_files, desc=f"Hedging {mode}"):
+                try:
+                    response = hedger.generate(
+                        MODEL_TO_USE, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS,
+                        output=OUTPUT, use_cache=False, validate=validate, hedge=mode == "on"
+                    )
+                    timed[mode].append((image_path, response))
+                except Exception as e:
+                    print(f"ERROR with hedging {mode} on {os.path.basename(image_path)}: {e}")
+
+        stats = hedger.summary()
+
+    report = latency_report({f"{MODEL_TO_USE} (hedging {mode})": timed[mode] for mode in timed})
+    report["hedging"] = stats
+    print(f"Hedge rate: {stats['hedge_rate']:.1%}, backup wins: {stats['backup_wins']}, cancelled: {stats['cancelled']}, "
+          f"cost overhead: ${stats['overhead_cost']:.6f} ({stats['overhead']:.1%})")
+
+    with open('tonnage_hedging.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Saved hedging report to tonnage_hedging.json")
+
 if __name__ == "__main__":
     # Test single model on folder
     # test_folder_ocr()
     
     # Uncomment to test all models on folder
-    test_all_models_on_folder()
\ No newline at end of file
+    test_all_models_on_folder()
+
+    # Uncomment to compare p99 latency with hedging off and on
+    # test_hedging_on_folder()
\ No newline at end of file
@@ -2,101 +2,58 @@
 """
 Test script for Gemini models with tonnage recognition functionality on folder of images
 Specifically extracts tonnage values from digital meter readings
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
-import json
 import sys
-from pathlib import Path
 from tqdm import tqdm
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/openai"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gpt_4o, gpt_4_1_mini, gpt_4_1, o4_mini
+from external import Preprocess, Request, ResultWriter, generate, run_batch, run_packed, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, parse_tonnage
 
 # Configuration
-MODEL_TO_USE = gpt_4o 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/digital_meter_readings/birla_copper/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "digital_meter_reading"
+MODEL_TO_USE = "gpt_4o"
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, grayscale=True), see ocr/inference/sweep.py
+BATCH_MODE = False  # run test_all_models_on_folder through the provider batch APIs (cheaper, not interactive; gpt_4o has no batch equivalent)
+PACK_SIZE = 1  # images per request in test_all_models_on_folder, pick it with ocr/inference/sweep.py --pack-size
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
 
-# System instruction for tonnage recognition
-SYSTEM_INSTRUCTION = """You are a tonnage reading assistant. Your ONLY task is to extract tonnage values from digital meter images. You must ONLY return the tonnage number as a string float/int value without the 't' suffix and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Convert comma-separated values to decimal format (e.g., "15,720" becomes "15.72")."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the tonnage value. The tonnage is usually present as XXXXXXt (with 't' indicating tonnage) and is typically next to the text "Total". Extract ONLY the tonnage number without the 't' suffix and convert it to decimal format. For example, if you see "15,720t", return only "15.72" as a string. Remove trailing zeros after decimal point. Return only the string float/int value. If you cannot find a tonnage value clearly, return an empty string."""
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
-
-def convert_tonnage_to_decimal(tonnage_str):
-    """Convert comma-separated tonnage to decimal format (xx,xxx -> xx.xx)"""
-    if not tonnage_str or tonnage_str == "":
-        return ""
-    
-    try:
-        # Remove any 't' suffix if present
-        clean_tonnage = tonnage_str.lower().replace('t', '').strip()
-        
-        # Handle comma-separated format (e.g., "15,720" -> "15.72")
-        if ',' in clean_tonnage:
-            parts = clean_tonnage.split(',')
-            if len(parts) == 2:
-                # Convert xx,xxx to xx.xx format
-                integer_part = parts[0]
-                decimal_part = parts[1][:2]  # Take only first 2 digits after comma
-                converted = f"{integer_part}.{decimal_part}"
-                
-                # Convert to float to remove trailing zeros, then back to string
-                float_val = float(converted)
-                if float_val == int(float_val):
-                    return str(int(float_val))
-                else:
-                    return str(float_val).rstrip('0').rstrip('.')
-        
-        # If no comma, try to convert directly
-        float_val = float(clean_tonnage)
-        if float_val == int(float_val):
-            return str(int(float_val))
-        else:
-            return str(float_val).rstrip('0').rstrip('.')
-            
-    except (ValueError, IndexError):
-        return tonnage_str  # Return original if conversion fails
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
 
 def test_single_image(image_path):
     """Test tonnage recognition on a single image"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT
         )
         
-        # Clean the response and extract tonnage value
-        clean_response = response.strip()
-        
-        # Convert tonnage value to decimal format
-        tonnage_value = convert_tonnage_to_decimal(clean_response)
-        
-        # Return empty string if no valid tonnage found
-        if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-            tonnage_value = ""
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
         
         # Create result
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": tonnage_value
         }
         
@@ -115,30 +72,25 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize empty JSON array
-    all_results = []
-    result_count = 0
-    
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting tonnage values from digital meters"):
-        result = test_single_image(image_path)
-        if result:
-            all_results.append(result)
-            result_count += 1
-            
-            # Save updated results to JSON file after each image
-            with open('tonnage_readings.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Append each result as it comes in, skipping images an interrupted run already did
+    with ResultWriter('tonnage_readings.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting tonnage values from digital meters"):
+            result = test_single_image(image_path)
+            if result:
+                writer.write(result)
     
-    print(f"Saved {result_count} tonnage recognition results to tonnage_readings.json")
+    print(f"Saved {len(writer.results)} tonnage recognition results to tonnage_readings.json")
 
 def test_all_models_on_folder():
     """Test all available models with tonnage recognition on the folder"""
     models = [
-        ("gpt_4o", gpt_4o),
-        ("gpt_4_1_mini", gpt_4_1_mini),
-        ("gpt_4_1", gpt_4_1),
-        ("o4_mini", o4_mini)
+        "gpt_4o",
+        "gpt_4_1_mini",
+        "gpt_4_1",
+        "o4_mini"
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -147,47 +99,39 @@ def test_all_models_on_folder():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    for model_name, model_func in models:
-        # Initialize empty JSON array for each model
-        model_results = []
-        result_count = 0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again
+    writers = {model_name: ResultWriter(f'{model_name}_tonnage.json') for model_name in models}
+    requests = [
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ]
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
         
-        for image_path in tqdm(image_files, desc=f"Tonnage recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Clean the response and convert tonnage value to decimal format
-                clean_response = response.strip()
-                tonnage_value = convert_tonnage_to_decimal(clean_response)
-                
-                # Return empty string if no valid tonnage found
-                if not tonnage_value or tonnage_value.lower() in ['none', 'n/a', 'not found']:
-                    tonnage_value = ""
-                
-                # Create result
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": tonnage_value
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}_tonnage.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Tonnage in decimal format from the structured or free-text reply, empty if none was found
+        tonnage_value = parse_tonnage(response.text)
         
-        print(f"Saved {result_count} results to {model_name}.json")
+        # Append to the results file named after the model
+        writers[model_name].write({
+            "id": get_image_id(image_path),
+            "ocr_predicted": tonnage_value
+        })
+    
+    # Run every (model, image) request concurrently within the provider rate limits, PACK_SIZE
+    # images per request, or as batch jobs
+    if PACK_SIZE > 1:
+        run_packed(requests, PACK_SIZE, on_result=save_result)
+    else:
+        (run_batch if BATCH_MODE else run_requests)(requests, on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
+        print(f"Saved {len(writer.results)} results to {model_name}_tonnage.json")
 
 if __name__ == "__main__":
     # Test single model on folder
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Evaluation engine for the OCR use cases
+Runs any set of models over a task's images in one pass: every (model, image) request goes out
+concurrently under the provider rate limits, and each response is parsed with the task's parser
+and saved to the model's results file as it arrives, together with its cost, token usage and
+timings. The same pass then gives the per-model accuracy (against the task's annotations),
+latency percentiles and cost, which used to take a main, a latency and a cost run over the same
+images. A multi-field task (digital_meter_fields) is scored per field from that one pass too.
+With --dedup, frames of the same coil, truck or meter reading are grouped (ocr/grouping.py) and
+only --per-group representatives of each group are sent; every frame gets their majority answer.
+Everything about the task (prompts, parser, validator, image folder, id scheme, results
+file names) comes from ocr/tasks.py
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import Preprocess, Request, ResultWriter, response_cost, response_savings, run_batch, run_packed, run_requests
+from external.latency import TIMING_KEYS, describe
+from ocr.grouping import group_frames, representatives
+from ocr.tasks import TASKS, answer_cer, consensus, field_scores, is_correct, load_annotations
+
+SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+DEFAULT_MODELS = ["gemini_2_0_flash", "gpt_4_1_mini"]
+PER_GROUP = 3  # representatives sent per group of duplicate frames with --dedup
+
+def get_image_files(task, folder_path=None, annotations=None, limit=None):
+    """Images of the task's folder, only the annotated ones when annotations are given"""
+    image_id = TASKS[task]["image_id"]
+    image_files = []
+    for ext in SUPPORTED_EXTENSIONS:
+        image_files.extend(glob.glob(os.path.join(folder_path or TASKS[task]["folder"], f"*{ext}")))
+
+    if annotations is not None:
+        image_files = [f for f in image_files if image_id(f) in annotations]
+    image_files.sort(key=lambda f: (isinstance(image_id(f), str), image_id(f)))
+    return image_files[:limit] if limit else image_files
+
+def results_path(task, model_id, results_dir="."):
+    return os.path.join(results_dir, f"{model_id}{TASKS[task]['output_suffix']}.json")
+
+def result_record(task, image_path, response):
+    """One line of a results file: the answer plus what it cost and how long it took"""
+    spec = TASKS[task]
+    return {
+        "id": spec["image_id"](image_path),
+        "ocr_predicted": spec["parse"](response.text),
+        "cost_usd": response_cost(response),
+        "cache_savings_usd": response_savings(response),
+        "input_tokens": response.input_tokens,
+        "cached_input_tokens": response.cached_input_tokens or 0,
+        "output_tokens": response.output_tokens,
+        "total_tokens": response.total_tokens,
+        "cached": response.cached,  # served from the response cache, so its timings aren't this run's
+        "timings": {key: response.timings[key] for key in TIMING_KEYS if key in response.timings},
+    }
+
+def deduplicated_record(task, image_path, answer):
+    """Result of a frame that wasn't sent, answered by its group: nothing spent, nothing to time"""
+    return {
+        "id": TASKS[task]["image_id"](image_path),
+        "ocr_predicted": answer,
+        "cost_usd": 0.0,
+        "cache_savings_usd": 0.0,
+        "input_tokens": 0,
+        "cached_input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "cached": False,
+        "deduplicated": True,
+        "timings": {},
+    }
+
+def run_engine(task, models, image_files, preprocess=None, output=None, pack_size=1, batch=False, use_cache=True, stream=False, results_dir=".", resume=True,
+               groups=None, per_group=PER_GROUP):
+    """
+    Run every model over the images in one concurrent pass, writing the results files as it goes.
+
+    Args:
+        task (str): Key of TASKS
+        models (list): Model IDs, run side by side
+        image_files (list): Images to read
+        preprocess (Preprocess): Optional image preprocessing for every request
+        output (OutputFormat): Optional structured output, e.g. TASKS[task]["output"]
+        pack_size (int): Images per request (external/packing.py), 1 for one image per request
+        batch (bool): Go through the provider batch APIs instead (cheaper, not interactive)
+        use_cache (bool): Serve repeated requests from the response cache; False to time every request
+        stream (bool): Stream replies to record time to first token
+        results_dir (str): Where the <model><suffix>.json results files go
+        resume (bool): Skip images an interrupted run already saved (external/results.py)
+        groups (list): Groups of duplicate frames (ocr/grouping.py group_frames) covering the images;
+            per_group representatives of each are sent and every frame gets their majority answer
+        per_group (int): Representatives sent per group
+
+    Returns:
+        tuple: ({model_id: list of result records}, {model_id: error count}, wall time in seconds)
+    """
+    spec = TASKS[task]
+    image_id = spec["image_id"]
+    writers = {model_id: ResultWriter(results_path(task, model_id, results_dir), resume=resume) for model_id in models}
+    errors = Counter()
+    lock = threading.Lock()
+
+    # Without grouping every image is a group of its own, sent as is
+    if groups is None:
+        groups, per_group = [[image_path] for image_path in image_files], 1
+    group_of = {image_path: index for index, group in enumerate(groups) for image_path in group}
+
+    # A group is sent to a model while any of its frames is missing from the model's results
+    outstanding, replies, requests = {}, {}, []
+    for model_id in models:
+        for index, group in enumerate(groups):
+            if all(image_id(image_path) in writers[model_id].done for image_path in group):
+                continue
+            sent = representatives(group, per_group)
+            outstanding[(model_id, index)] = len(sent)
+            replies[(model_id, index)] = {}
+            requests.extend(
+                Request(model_id, spec["system_instruction"], spec["prompt"], image_path=image_path, preprocess=preprocess,
+                        use_cache=use_cache, stream=stream, output=output)
+                for image_path in sent
+            )
+
+    def save_group(model_id, group, responses):
+        answer = consensus(task, [spec["parse"](responses[image_path].text) for image_path in group if image_path in responses])
+        for image_path in group:
+            if image_id(image_path) in writers[model_id].done:
+                continue
+            if image_path in responses:
+                record = result_record(task, image_path, responses[image_path])
+                record["ocr_predicted"] = answer
+            else:
+                record = deduplicated_record(task, image_path, answer)
+            if len(group) > 1:
+                record["group"] = image_id(group[0])
+            writers[model_id].write(record)
+
+    def save_result(key, response):
+        model_id, image_path = key
+        index = group_of[image_path]
+        with lock:
+            if isinstance(response, Exception):
+                print(f"ERROR with {model_id} on {os.path.basename(image_path)}: {response}")
+                errors[model_id] += 1
+            else:
+                replies[(model_id, index)][image_path] = response
+
+            # Save the group once all its representatives are back, if any of them answered
+            outstanding[(model_id, index)] -= 1
+            if outstanding[(model_id, index)] > 0:
+                return
+            responses = replies.pop((model_id, index))
+        if responses:
+            save_group(model_id, groups[index], responses)
+
+    start = time.perf_counter()
+    if batch:
+        run_batch(requests, use_cache=use_cache, on_result=save_result)
+    elif pack_size > 1:
+        run_packed(requests, pack_size, on_result=save_result)
+    else:
+        run_requests(requests, desc=f"{task} x {len(models)} models", on_result=save_result)
+    wall_time = time.perf_counter() - start
+
+    for writer in writers.values():
+        writer.close()
+    return {model_id: writer.results for model_id, writer in writers.items()}, dict(errors), wall_time
+
+def mean_or_none(values):
+    values = [v for v in values if v is not None]
+    return statistics.mean(values) if values else None
+
+def summarize_model(task, model_id, records, errors, annotations, results_dir="."):
+    """Accuracy, cost and latency of one model's results (resumed ones included)"""
+    validate = TASKS[task]["validate"]
+    annotated = [r for r in records if r["id"] in annotations]
+    timed = [r for r in records if not r.get("cached") and not r.get("deduplicated")]
+    costs = [r["cost_usd"] for r in records]
+
+    summary = {
+        "model": model_id,
+        "results_file": results_path(task, model_id, results_dir),
+        "images": len(records),
+        "errors": errors,
+        "deduplicated": sum(1 for r in records if r.get("deduplicated")),
+        "valid_rate": sum(validate(r["ocr_predicted"]) for r in records) / len(records) if records else 0.0,
+        "evaluated": len(annotated),
+        "accuracy": sum(is_correct(r["ocr_predicted"], annotations[r["id"]]) for r in annotated) / len(annotated) if annotated else None,
+        "average_cer": mean_or_none(answer_cer(annotations[r["id"]], r["ocr_predicted"]) for r in annotated),
+        "total_cost": sum(costs),
+        "cost_per_image": mean_or_none(costs) or 0.0,
+        "cache_savings": sum(r["cache_savings_usd"] for r in records),
+        "average_input_tokens": mean_or_none(r["input_tokens"] for r in records),
+        "average_output_tokens": mean_or_none(r["output_tokens"] for r in records),
+        "latency": {},
+        "timed_requests": len(timed),
+    }
+    if "fields" in TASKS[task]:
+        summary["fields"] = field_scores(task, [(r["ocr_predicted"], annotations.get(r["id"])) for r in records])
+
+    # Latency over the requests that really went to the model, not the cached ones
+    for key in TIMING_KEYS:
+        values = [r["timings"][key] for r in timed if r["timings"].get(key) is not None]
+        if values:
+            summary["latency"][key] = describe(values)
+    return summary
+
+def print_report(summaries):
+    print("=" * 120)
+    print(f"{'MODEL':<28}{'IMAGES':>8}{'ERRORS':>8}{'ACCURACY':>10}{'VALID':>8}{'$/IMAGE':>12}{'IN TOKENS':>11}{'OUT TOKENS':>12}{'P50 (s)':>8}{'P95 (s)':>8}{'P99 (s)':>8}")
+    print("-" * 120)
+    for s in summaries:
+        accuracy = f"{s['accuracy']:.2%}" if s["accuracy"] is not None else "-"
+        in_tokens = f"{s['average_input_tokens']:.0f}" if s["average_input_tokens"] is not None else "-"
+        out_tokens = f"{s['average_output_tokens']:.1f}" if s["average_output_tokens"] is not None else "-"
+        total = s["latency"].get("total", {})
+        latency = "".join(f"{total[f'p{q}']:>8.2f}" if total else f"{'-':>8}" for q in (50, 95, 99))
+        print(f"{s['model']:<28}{s['images']:>8}{s['errors']:>8}{accuracy:>10}{s['valid_rate']:>8.1%}{s['cost_per_image']:>12.6f}{in_tokens:>11}{out_tokens:>12}{latency}")
+    print("=" * 120)
+    for s in summaries:
+        if s["deduplicated"]:
+            print(f"{s['model']:<28}{s['deduplicated']} of {s['images']} images answered by their group without a request")
+        for name, field in s.get("fields", {}).items():
+            accuracy = f"{field['accuracy']:.2%}" if field["accuracy"] is not None else "-"
+            print(f"{s['model']:<28}{name:<12} accuracy {accuracy} over {field['evaluated']} annotated, valid {field['valid_rate']:.1%}")
+    print("Latency covers requests sent in this run; use --no-cache to time every image")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run models over an OCR task in one pass and report accuracy, latency and cost.")
+    parser.add_argument("--task", type=str, choices=list(TASKS), required=True)
+    parser.add_argument("--models", type=str, nargs="+", default=DEFAULT_MODELS, help="model IDs (see external/client.py MODELS)")
+    parser.add_argument("--folder", type=str, default=None, help="image folder (default: the task's folder)")
+    parser.add_argument("--annotated-only", action="store_true", help="only run the images that have an annotation")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N images")
+    parser.add_argument("--max-side", type=int, default=None, help="preprocessing: long side cap")
+    parser.add_argument("--crop", type=str, default=None, help="preprocessing: crop preset or WxH+X+Y")
+    parser.add_argument("--grayscale", action="store_true", help="preprocessing: convert to grayscale")
+    parser.add_argument("--structured", action="store_true", help="JSON schema output with the task's output-token cap")
+    parser.add_argument("--pack-size", type=int, default=1, help="images per request (see ocr/inference/sweep.py --pack-size)")
+    parser.add_argument("--batch", action="store_true", help="use the provider batch APIs (no latency numbers)")
+    parser.add_argument("--no-cache", action="store_true", help="send every request instead of reusing cached responses")
+    parser.add_argument("--no-stream", action="store_true", help="don't stream replies (no time to first token)")
+    parser.add_argument("--dedup", action="store_true", help="group duplicate frames of one entity and send a few of each (ocr/grouping.py)")
+    parser.add_argument("--per-group", type=int, default=PER_GROUP, help="representatives sent per group with --dedup")
+    parser.add_argument("--fresh", action="store_true", help="ignore results of an interrupted run")
+    parser.add_argument("--results-dir", type=str, default=".", help="where the per-model results files go")
+    parser.add_argument("--output", type=str, default=None, help="report path (default: engine_<task>.json)")
+    args = parser.parse_args()
+
+    try:
+        annotations = load_annotations(args.task)
+    except FileNotFoundError:
+        print(f"No annotations for {args.task}, reporting without accuracy")
+        annotations = {}
+
+    image_files = get_image_files(args.task, args.folder, annotations if args.annotated_only else None, args.limit)
+    if not image_files:
+        print(f"No images found for {args.task}")
+        return
+
+    preprocess = Preprocess(args.max_side, args.crop, args.grayscale)
+    output = TASKS[args.task]["output"] if args.structured else None
+    print(f"Running {len(args.models)} models over {len(image_files)} images for {args.task}")
+
+    groups = None
+    if args.dedup:
+        groups = group_frames(image_files, TASKS[args.task]["image_id"], TASKS[args.task]["frames"](), preprocess)
+        sent = sum(len(representatives(group, args.per_group)) for group in groups)
+        print(f"Grouped {len(image_files)} images into {len(groups)} entities, sending {sent} of them per model")
+
+    results, errors, wall_time = run_engine(
+        args.task, args.models, image_files, preprocess=preprocess, output=output, pack_size=args.pack_size,
+        batch=args.batch, use_cache=not args.no_cache, stream=not (args.no_stream or args.batch),
+        results_dir=args.results_dir, resume=not args.fresh, groups=groups, per_group=args.per_group
+    )
+    summaries = [summarize_model(args.task, model_id, results[model_id], errors.get(model_id, 0), annotations, args.results_dir) for model_id in args.models]
+    print_report(summaries)
+    print(f"Wall time: {wall_time:.1f}s for {len(image_files)} images x {len(args.models)} models")
+
+    output_path = args.output or f"engine_{args.task}.json"
+    with open(output_path, 'w') as f:
+        json.dump({
+            "task": args.task,
+            "models": args.models,
+            "images": len(image_files),
+            "preprocess": preprocess.key(),
+            "structured": args.structured,
+            "pack_size": args.pack_size,
+            "groups": len(groups) if groups is not None else None,
+            "per_group": args.per_group if groups is not None else None,
+            "wall_time": wall_time,
+            "results": summaries,
+        }, f, indent=2)
+    print(f"Saved report to {output_path}")
+
+if __name__ == "__main__":
+    main()
+
+# python ocr/inference/engine.py --task coil_id --models gemini_2_0_flash gpt_4_1_mini gpt_4o --annotated-only
+# python ocr/inference/engine.py --task number_plate_recognition --models gemini_2_0_flash claude_3_5_haiku --no-cache --limit 100
+# python ocr/inference/engine.py --task digital_meter_reading --models gemini_2_0_flash gemini_2_5_flash_preview --structured --batch
+# python ocr/inference/engine.py --task digital_meter_fields --models gemini_2_0_flash gpt_4_1_mini --structured --annotated-only
+# python ocr/inference/engine.py --task coil_id --models gemini_2_0_flash gpt_4_1_mini --dedup --per-group 2
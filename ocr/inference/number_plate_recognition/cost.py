@@ -2,108 +2,76 @@
 """
 Test script for Gemini models with number plate recognition functionality on folder of images
 Specifically extracts the LAST 4 digits of number plates
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
-import json
 import sys
-from pathlib import Path
 from tqdm import tqdm
-from PIL import Image
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/gemini"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import gemini_2_0_flash, gemini_1_5_pro
+from external import Preprocess, Request, ResultWriter, generate, response_cost, response_savings, run_batch, run_packed, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, parse_last_4_digits
 
 # Configuration
-MODEL_TO_USE = gemini_2_0_flash 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/number_plate_recognition/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "number_plate_recognition"
+MODEL_TO_USE = "gemini_2_0_flash"
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, grayscale=True), see ocr/inference/sweep.py
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
+BATCH_MODE = False  # run test_all_models_on_folder through the provider batch APIs (cheaper, not interactive)
+PACK_SIZE = 1  # images per request in test_all_models_on_folder, pick it with ocr/inference/sweep.py --pack-size
 
-# Gemini API Pricing (per 1M tokens) - as of June 2025
-GEMINI_PRICING = {
-    "gemini_2_0_flash": {
-        "input": 0.10,  # $0.075 per 1M input tokens
-        "output": 0.40   # $0.30 per 1M output tokens
-    },
-    "gemini_1_5_pro": {
-        "input": 1.25,   # $1.25 per 1M input tokens  
-        "output": 5.00   # $5.00 per 1M output tokens
-    }
-}
-
-# System instruction for number plate recognition
-SYSTEM_INSTRUCTION = """You are a number plate recognition assistant. Your ONLY task is to extract the LAST 4 digits from number plates in images. You must ONLY return those 4 digits and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Just the last 4 digits of the number plate."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the number plate. Extract ONLY the last 4 digits from the number plate. Return ONLY those 4 digits with no other text, explanations, or formatting. If you cannot find a number plate or cannot read the last 4 digits clearly, return "XXXX"."""
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
 
 def test_single_image(image_path, model_name="gemini_2_0_flash"):
     """Test number plate recognition on a single image and calculate cost"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT
         )
         
         # Get actual token counts from response usage metadata
-        if hasattr(response, 'usage_metadata'):
-            input_tokens = response.usage_metadata.prompt_token_count
-            output_tokens = response.usage_metadata.candidates_token_count
-            total_tokens = response.usage_metadata.total_token_count
+        if response.input_tokens is not None:
+            input_tokens = response.input_tokens
+            output_tokens = response.output_tokens
+            total_tokens = response.total_tokens
         else:
             print("Warning: No usage metadata available from response")
             return None, 0.0
         
-        # Calculate cost
-        pricing = GEMINI_PRICING.get(model_name, GEMINI_PRICING["gemini_2_0_flash"])
-        input_cost = (input_tokens / 1_000_000) * pricing["input"]
-        output_cost = (output_tokens / 1_000_000) * pricing["output"]
-        total_cost = input_cost + output_cost
-        
-        # Clean the response to ensure we only get 4 digits
-        clean_response = response.text.strip()
+        # Calculate cost (external/pricing.py, cached prompt tokens at the cached-input price)
+        total_cost = response_cost(response)
+        savings = response_savings(response)
         
-        # Validate and extract exactly 4 digits
-        if len(clean_response) == 4 and clean_response.isdigit():
-            last_4_digits = clean_response
-        elif len(clean_response) > 4:
-            # If response is longer, try to extract last 4 digits
-            digits_only = ''.join(filter(str.isdigit, clean_response))
-            if len(digits_only) >= 4:
-                last_4_digits = digits_only[-4:]
-            else:
-                last_4_digits = "XXXX"
-        else:
-            # If less than 4 characters or contains non-digits
-            digits_only = ''.join(filter(str.isdigit, clean_response))
-            if len(digits_only) == 4:
-                last_4_digits = digits_only
-            else:
-                last_4_digits = "XXXX"
+        # Last 4 digits from the structured or free-text reply, XXXX if unreadable
+        last_4_digits = parse_last_4_digits(response.text)
         
         # Wrap the number plate digits in JSON format
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": last_4_digits,
             "cost_usd": round(total_cost, 6),
+            "cache_savings_usd": round(savings, 6),
             "input_tokens": input_tokens,
+            "cached_input_tokens": response.cached_input_tokens or 0,
             "output_tokens": output_tokens,
             "total_tokens": total_tokens
         }
@@ -125,22 +93,20 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize tracking variables
-    all_results = []
-    result_count = 0
-    total_cost = 0.0
+    # Append each result as it comes in, skipping images an interrupted run already did
+    with ResultWriter('number_plate_last_4_digits.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting last 4 digits from number plates"):
+            result, cost = test_single_image(image_path, "gemini_2_0_flash")
+            if result:
+                writer.write(result)
     
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting last 4 digits from number plates"):
-        result, cost = test_single_image(image_path, "gemini_2_0_flash")
-        if result:
-            all_results.append(result)
-            result_count += 1
-            total_cost += cost
-            
-            # Save updated results to JSON file after each image
-            with open('number_plate_last_4_digits.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Totals over every result, including those of an interrupted run
+    result_count = len(writer.results)
+    total_cost = sum(result['cost_usd'] for result in writer.results)
+    total_savings = sum(result['cache_savings_usd'] for result in writer.results)
     
     # Calculate and display cost statistics
     avg_cost_per_image = total_cost / result_count if result_count > 0 else 0
@@ -148,6 +114,7 @@ def test_folder_ocr():
     print(f"Total images processed: {result_count}")
     print(f"Total cost: ${total_cost:.6f}")
     print(f"Average cost per image: ${avg_cost_per_image:.6f}")
+    print(f"Saved by prompt caching: ${total_savings:.6f}")
     print(f"Saved {result_count} number plate recognition results to number_plate_last_4_digits.json")
 
 def test_all_models_on_folder():
@@ -155,7 +122,7 @@ def test_all_models_on_folder():
     print(f"Starting number plate recognition cost analysis for multiple models...")
     
     models = [
-        ("gemini_2_0_flash", gemini_2_0_flash),
+        "gemini_2_0_flash",
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -166,81 +133,65 @@ def test_all_models_on_folder():
     
     total_cost_all_models = 0.0
     
-    for model_name, model_func in models:
-        # Initialize tracking variables for each model
-        model_results = []
-        result_count = 0
-        model_total_cost = 0.0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again
+    writers = {model_name: ResultWriter(f'{model_name}.json') for model_name in models}
+    requests = [
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ]
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
+        
+        # Get actual token counts from response usage metadata
+        if response.input_tokens is not None:
+            input_tokens = response.input_tokens
+            output_tokens = response.output_tokens
+            total_tokens = response.total_tokens
+        else:
+            print(f"Warning: No usage metadata available for {os.path.basename(image_path)}")
+            return
+        
+        # Calculate cost (external/pricing.py, cached prompt tokens at the cached-input price)
+        total_cost = response_cost(response)
+        savings = response_savings(response)
         
-        print(f"\nProcessing with {model_name}...")
+        # Last 4 digits from the structured or free-text reply, XXXX if unreadable
+        last_4_digits = parse_last_4_digits(response.text)
+        
+        # Wrap the number plate digits in JSON format with cost information
+        ocr_result = {
+            "id": get_image_id(image_path),
+            "ocr_predicted": last_4_digits,
+            "cost_usd": round(total_cost, 6),
+            "cache_savings_usd": round(savings, 6),
+            "input_tokens": input_tokens,
+            "cached_input_tokens": response.cached_input_tokens or 0,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens
+        }
+        
+        # Append to the results file named after the model
+        writers[model_name].write(ocr_result)
+    
+    # Run every (model, image) request concurrently within the provider rate limits, PACK_SIZE
+    # images per request, or as batch jobs
+    if PACK_SIZE > 1:
+        run_packed(requests, PACK_SIZE, on_result=save_result)
+    else:
+        (run_batch if BATCH_MODE else run_requests)(requests, on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
         
-        for image_path in tqdm(image_files, desc=f"Number plate recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Get actual token counts from response usage metadata
-                if hasattr(response, 'usage_metadata'):
-                    input_tokens = response.usage_metadata.prompt_token_count
-                    output_tokens = response.usage_metadata.candidates_token_count
-                    total_tokens = response.usage_metadata.total_token_count
-                else:
-                    print(f"Warning: No usage metadata available for {os.path.basename(image_path)}")
-                    continue
-                
-                # Calculate output tokens and cost
-                pricing = GEMINI_PRICING.get(model_name, GEMINI_PRICING["gemini_2_0_flash"])
-                input_cost = (input_tokens / 1_000_000) * pricing["input"]
-                output_cost = (output_tokens / 1_000_000) * pricing["output"]
-                total_cost = input_cost + output_cost
-                
-                # Clean the response to ensure we only get 4 digits
-                clean_response = response.text.strip()
-                
-                # Validate and extract exactly 4 digits
-                if len(clean_response) == 4 and clean_response.isdigit():
-                    last_4_digits = clean_response
-                elif len(clean_response) > 4:
-                    # If response is longer, try to extract last 4 digits
-                    digits_only = ''.join(filter(str.isdigit, clean_response))
-                    if len(digits_only) >= 4:
-                        last_4_digits = digits_only[-4:]
-                    else:
-                        last_4_digits = "XXXX"
-                else:
-                    # If less than 4 characters or contains non-digits
-                    digits_only = ''.join(filter(str.isdigit, clean_response))
-                    if len(digits_only) == 4:
-                        last_4_digits = digits_only
-                    else:
-                        last_4_digits = "XXXX"
-                
-                # Wrap the number plate digits in JSON format with cost information
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": last_4_digits,
-                    "cost_usd": round(total_cost, 6),
-                    "input_tokens": input_tokens,
-                    "output_tokens": output_tokens,
-                    "total_tokens": total_tokens
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                model_total_cost += total_cost
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Totals over every result, including those of an interrupted run
+        result_count = len(writer.results)
+        model_total_cost = sum(result['cost_usd'] for result in writer.results)
+        model_total_savings = sum(result['cache_savings_usd'] for result in writer.results)
         
         # Calculate and display cost statistics for this model
         avg_cost_per_image = model_total_cost / result_count if result_count > 0 else 0
@@ -250,6 +201,7 @@ def test_all_models_on_folder():
         print(f"Images processed: {result_count}")
         print(f"Total cost: ${model_total_cost:.6f}")
         print(f"Average cost per image: ${avg_cost_per_image:.6f}")
+        print(f"Saved by prompt caching: ${model_total_savings:.6f}")
         print(f"Saved {result_count} results to {model_name}.json")
     
     # Display overall cost summary
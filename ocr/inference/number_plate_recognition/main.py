@@ -2,77 +2,58 @@
 """
 Test script for Gemini models with number plate recognition functionality on folder of images
 Specifically extracts the LAST 4 digits of number plates
+Prompts, image discovery and ids come from ocr/tasks.py, as in ocr/inference/engine.py, which
+runs accuracy, latency and cost for several models in one pass
 """
 
 import os
-import glob
-import json
 import sys
-from pathlib import Path
 from tqdm import tqdm
 
-# Add the external/gemini directory to the Python path
-models_dir = "/Users/hanoon/Documents/eval/external/claude"
-if models_dir not in sys.path:
-    sys.path.insert(0, models_dir)
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
-from models import claude_sonnet_4, claude_3_7_sonnet, claude_3_5_haiku, claude_3_5_sonnet
+from external import Preprocess, Request, ResultWriter, generate, run_batch, run_packed, run_requests
+from ocr.inference import engine
+from ocr.tasks import TASKS, parse_last_4_digits
 
 # Configuration
-MODEL_TO_USE = claude_sonnet_4 
-FOLDER_PATH = "/Users/hanoon/Documents/eval/ocr/data/number_plate_recognition/downloads"  # Change this to your folder path
-SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+TASK = "number_plate_recognition"
+MODEL_TO_USE = "claude_sonnet_4"
+FOLDER_PATH = TASKS[TASK]["folder"]  # Change this to run on another folder of the task's images
+PREPROCESS = Preprocess()  # e.g. Preprocess(max_side=1024, grayscale=True), see ocr/inference/sweep.py
+BATCH_MODE = False  # run test_all_models_on_folder through the provider batch APIs (cheaper, not interactive)
+PACK_SIZE = 1  # images per request in test_all_models_on_folder, pick it with ocr/inference/sweep.py --pack-size
+OUTPUT = TASKS[TASK]["output"]  # JSON schema, output-token cap and temperature 0 (external/output.py), None for free text
 
-# System instruction for number plate recognition
-SYSTEM_INSTRUCTION = """You are a number plate recognition assistant. Your ONLY task is to extract the LAST 4 digits from number plates in images. You must ONLY return those 4 digits and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Just the last 4 digits of the number plate."""
-
-# Test prompt
-TEST_PROMPT = """Look at this image and find the number plate. Extract ONLY the last 4 digits from the number plate. Return ONLY those 4 digits with no other text, explanations, or formatting. If you cannot find a number plate or cannot read the last 4 digits clearly, return "XXXX"."""
+SYSTEM_INSTRUCTION = TASKS[TASK]["system_instruction"]
+TEST_PROMPT = TASKS[TASK]["prompt"]
+get_image_id = TASKS[TASK]["image_id"]
 
 def get_image_files(folder_path):
-    """Get all image files from the specified folder"""
-    image_files = []
-    for ext in SUPPORTED_EXTENSIONS:
-        pattern = os.path.join(folder_path, f"*{ext}")
-        image_files.extend(glob.glob(pattern))
-    return image_files
+    """Images of the task in folder_path, found and ordered as the engine does"""
+    return engine.get_image_files(TASK, folder_path)
 
 def test_single_image(image_path):
     """Test number plate recognition on a single image"""
     try:
-        response = MODEL_TO_USE(
+        response = generate(
+            MODEL_TO_USE,
             system_instruction=SYSTEM_INSTRUCTION,
             prompt=TEST_PROMPT,
-            image_path=image_path
+            image_path=image_path,
+            preprocess=PREPROCESS,
+            output=OUTPUT
         )
         
-        # Clean the response to ensure we only get 4 digits
-        clean_response = response.strip()
-        
-        # Validate and extract exactly 4 digits
-        if len(clean_response) == 4 and clean_response.isdigit():
-            last_4_digits = clean_response
-        elif len(clean_response) > 4:
-            # If response is longer, try to extract last 4 digits
-            digits_only = ''.join(filter(str.isdigit, clean_response))
-            if len(digits_only) >= 4:
-                last_4_digits = digits_only[-4:]
-            else:
-                last_4_digits = "XXXX"
-        else:
-            # If less than 4 characters or contains non-digits
-            digits_only = ''.join(filter(str.isdigit, clean_response))
-            if len(digits_only) == 4:
-                last_4_digits = digits_only
-            else:
-                last_4_digits = "XXXX"
+        # Last 4 digits from the structured or free-text reply, XXXX if unreadable
+        last_4_digits = parse_last_4_digits(response.text)
         
         # Wrap the number plate digits in JSON format
-        filename = os.path.basename(image_path)
-        image_id = int(os.path.splitext(filename)[0])
-                
         ocr_result = {
-            "id": image_id,
+            "id": get_image_id(image_path),
             "ocr_predicted": last_4_digits
         }
         
@@ -91,30 +72,25 @@ def test_folder_ocr():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    # Initialize empty JSON array
-    all_results = []
-    result_count = 0
-    
-    # Process each image with progress bar
-    for image_path in tqdm(image_files, desc="Extracting last 4 digits from number plates"):
-        result = test_single_image(image_path)
-        if result:
-            all_results.append(result)
-            result_count += 1
-            
-            # Save updated results to JSON file after each image
-            with open('number_plate_last_4_digits.json', 'w') as f:
-                json.dump(all_results, f, indent=2)
+    # Append each result as it comes in, skipping images an interrupted run already did
+    with ResultWriter('number_plate_last_4_digits.json') as writer:
+        pending = [image_path for image_path in image_files if get_image_id(image_path) not in writer.done]
+        
+        # Process each image with progress bar
+        for image_path in tqdm(pending, desc="Extracting last 4 digits from number plates"):
+            result = test_single_image(image_path)
+            if result:
+                writer.write(result)
     
-    print(f"Saved {result_count} number plate recognition results to number_plate_last_4_digits.json")
+    print(f"Saved {len(writer.results)} number plate recognition results to number_plate_last_4_digits.json")
 
 def test_all_models_on_folder():
     """Test all available models with number plate recognition on the folder"""
     models = [
-        ("claude_sonnet_4", claude_sonnet_4),
-        ("claude_3_7_sonnet", claude_3_7_sonnet),
-        ("claude_3_5_haiku", claude_3_5_haiku),
-        ("claude_3_5_sonnet", claude_3_5_sonnet)
+        "claude_sonnet_4",
+        "claude_3_7_sonnet",
+        "claude_3_5_haiku",
+        "claude_3_5_sonnet"
     ]
     
     image_files = get_image_files(FOLDER_PATH)
@@ -123,61 +99,39 @@ def test_all_models_on_folder():
         print(f"No image files found in {FOLDER_PATH}")
         return
     
-    for model_name, model_func in models:
-        # Initialize empty JSON array for each model
-        model_results = []
-        result_count = 0
+    # Results files are appended to as requests finish; images already in them (from an
+    # interrupted run) aren't requested again
+    writers = {model_name: ResultWriter(f'{model_name}.json') for model_name in models}
+    requests = [
+        Request(model_name, SYSTEM_INSTRUCTION, TEST_PROMPT, image_path=image_path, preprocess=PREPROCESS, output=OUTPUT)
+        for model_name in models for image_path in image_files if get_image_id(image_path) not in writers[model_name].done
+    ]
+    
+    def save_result(key, response):
+        model_name, image_path = key
+        if isinstance(response, Exception):
+            print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {response}")
+            return
         
-        for image_path in tqdm(image_files, desc=f"Number plate recognition with {model_name}"):
-            try:
-                response = model_func(
-                    system_instruction=SYSTEM_INSTRUCTION,
-                    prompt=TEST_PROMPT,
-                    image_path=image_path
-                )
-                
-                # Clean the response to ensure we only get 4 digits
-                clean_response = response.strip()
-                
-                # Validate and extract exactly 4 digits
-                if len(clean_response) == 4 and clean_response.isdigit():
-                    last_4_digits = clean_response
-                elif len(clean_response) > 4:
-                    # If response is longer, try to extract last 4 digits
-                    digits_only = ''.join(filter(str.isdigit, clean_response))
-                    if len(digits_only) >= 4:
-                        last_4_digits = digits_only[-4:]
-                    else:
-                        last_4_digits = "XXXX"
-                else:
-                    # If less than 4 characters or contains non-digits
-                    digits_only = ''.join(filter(str.isdigit, clean_response))
-                    if len(digits_only) == 4:
-                        last_4_digits = digits_only
-                    else:
-                        last_4_digits = "XXXX"
-                
-                # Wrap the number plate digits in JSON format without model field
-                filename = os.path.basename(image_path)
-                image_id = int(os.path.splitext(filename)[0])
-                
-                # Wrap the number plate digits in JSON format without model field
-                ocr_result = {
-                    "id": image_id,
-                    "ocr_predicted": last_4_digits
-                }
-                
-                model_results.append(ocr_result)
-                result_count += 1
-                
-                # Save updated results to JSON file named after the model
-                with open(f'{model_name}.json', 'w') as f:
-                    json.dump(model_results, f, indent=2)
-                
-            except Exception as e:
-                print(f"ERROR with {model_name} on {os.path.basename(image_path)}: {e}")
+        # Last 4 digits from the structured or free-text reply, XXXX if unreadable
+        last_4_digits = parse_last_4_digits(response.text)
         
-        print(f"Saved {result_count} results to {model_name}.json")
+        # Wrap the number plate digits in JSON format without model field
+        writers[model_name].write({
+            "id": get_image_id(image_path),
+            "ocr_predicted": last_4_digits
+        })
+    
+    # Run every (model, image) request concurrently within the provider rate limits, PACK_SIZE
+    # images per request, or as batch jobs
+    if PACK_SIZE > 1:
+        run_packed(requests, PACK_SIZE, on_result=save_result)
+    else:
+        (run_batch if BATCH_MODE else run_requests)(requests, on_result=save_result)
+    
+    for model_name, writer in writers.items():
+        writer.close()
+        print(f"Saved {len(writer.results)} results to {model_name}.json")
 
 if __name__ == "__main__":
     # Test single model on folder
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Preprocessing sweep for the OCR use cases
+Runs one model over the annotated images with every combination of max long side, crop and
+grayscale (and optionally images packed per request and structured output), and reports accuracy
+against input/output tokens and latency, so the cheapest setting that keeps accuracy can be
+picked for PREPROCESS, PACK_SIZE and OUTPUT in the runners
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add the repository root to the Python path for the shared model client
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from external import Preprocess, Request, run_packed, run_requests
+from external.latency import percentile
+from ocr.tasks import TASKS, answer_cer, is_correct, load_annotations
+
+SUPPORTED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+
+def image_id(image_path):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return int(stem) if stem.isdigit() else None
+
+def get_annotated_images(folder_path, annotations, limit=None):
+    """Images in the folder whose id has an annotation"""
+    image_files = []
+    for ext in SUPPORTED_EXTENSIONS:
+        image_files.extend(glob.glob(os.path.join(folder_path, f"*{ext}")))
+
+    image_files = sorted((f for f in image_files if image_id(f) in annotations), key=image_id)
+    return image_files[:limit] if limit else image_files
+
+def setting_name(preprocess, pack_size, structured=False):
+    name = f"{preprocess.key()} pack={pack_size}" if pack_size > 1 else preprocess.key()
+    return f"{name} structured" if structured else name
+
+def run_setting(task, model_id, preprocess, image_files, annotations, pack_size=1, structured=False, use_cache=False):
+    """
+    Run one preprocessing setting (pack size, structured output) over the images and summarize it.
+    The response cache is bypassed unless use_cache, since cached responses carry the timings of
+    the run that cached them; any that are served anyway are counted and left out of the latencies
+    """
+    spec = TASKS[task]
+    name = setting_name(preprocess, pack_size, structured)
+    output = spec["output"] if structured else None
+    exact_matches, cers, input_tokens, output_tokens, latencies, errors, cached = 0, [], [], [], [], 0, 0
+    predictions = []
+
+    requests = [Request(model_id, spec["system_instruction"], spec["prompt"], image_path=image_path, preprocess=preprocess, output=output, use_cache=use_cache) for image_path in image_files]
+    start = time.perf_counter()
+    if pack_size > 1:
+        responses = run_packed(requests, pack_size, desc=name)
+    else:
+        responses = run_requests(requests, desc=name)
+    wall_time = time.perf_counter() - start
+
+    for image_path in image_files:
+        try:
+            response = responses.result(model_id, image_path)
+        except Exception as e:
+            print(f"ERROR with {name} on {os.path.basename(image_path)}: {e}")
+            errors += 1
+            continue
+
+        if response.cached:
+            cached += 1
+        else:
+            latencies.append(response.timings["total"])
+        predicted = spec["parse"](response.text)
+        annotated = annotations[image_id(image_path)]
+
+        exact_matches += is_correct(predicted, annotated)
+        cers.append(answer_cer(annotated, predicted))
+        if response.input_tokens is not None:
+            input_tokens.append(response.input_tokens)
+        if response.output_tokens is not None:
+            output_tokens.append(response.output_tokens)
+        predictions.append({"id": image_id(image_path), "ocr_predicted": predicted, "ocr_annotated": annotated})
+
+    # Packed runs pay for failed packs and fallbacks too, so count everything that was sent
+    average_input_tokens = statistics.mean(input_tokens) if input_tokens else None
+    average_output_tokens = statistics.mean(output_tokens) if output_tokens else None
+    if pack_size > 1 and responses.input_tokens:
+        average_input_tokens = responses.input_tokens / len(image_files)
+        average_output_tokens = responses.output_tokens / len(image_files)
+
+    evaluated = len(predictions)
+    return {
+        "setting": name,
+        "max_side": preprocess.max_side,
+        "crop": preprocess.crop,
+        "grayscale": preprocess.grayscale,
+        "pack_size": pack_size,
+        "structured": structured,
+        "evaluated": evaluated,
+        "errors": errors,
+        "fallbacks": getattr(responses, "fallbacks", 0),
+        "cached": cached,
+        "accuracy": exact_matches / evaluated if evaluated else 0.0,
+        "average_cer": statistics.mean(cers) if cers else 1.0,
+        "average_input_tokens": average_input_tokens,
+        "average_output_tokens": average_output_tokens,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "seconds_per_image": wall_time / len(image_files) if not cached else None,  # not this setting's time if some were cached
+        "predictions": predictions,
+    }
+
+def pick_cheapest(results, tolerance):
+    """Cheapest setting (input tokens per image, then wall time per image) whose accuracy is within tolerance of the best"""
+    best_accuracy = max(r["accuracy"] for r in results)
+    candidates = [r for r in results if r["accuracy"] >= best_accuracy - tolerance]
+    return min(candidates, key=lambda r: (r["average_input_tokens"] if r["average_input_tokens"] is not None else float("inf"),
+                                          r["seconds_per_image"] if r["seconds_per_image"] is not None else float("inf")))
+
+def print_report(results, choice, task):
+    print("=" * 132)
+    print(f"{'SETTING':<50}{'ACCURACY':>10}{'CER':>8}{'IN TOKENS':>11}{'OUT TOKENS':>12}{'P50 (s)':>10}{'P95 (s)':>10}{'S/IMAGE':>10}{'FALLBACKS':>11}")
+    print("-" * 132)
+    for r in results:
+        tokens = f"{r['average_input_tokens']:.0f}" if r["average_input_tokens"] is not None else "-"
+        out_tokens = f"{r['average_output_tokens']:.1f}" if r["average_output_tokens"] is not None else "-"
+        seconds = f"{r['seconds_per_image']:.3f}" if r["seconds_per_image"] is not None else "-"
+        marker = (" *" if r["cached"] else "") + (" <" if r is choice else "")
+        print(f"{r['setting']:<50}{r['accuracy']:>10.2%}{r['average_cer']:>8.3f}{tokens:>11}{out_tokens:>12}{r['latency_p50']:>10.2f}{r['latency_p95']:>10.2f}{seconds:>10}{r['fallbacks']:>11}{marker}")
+    print("=" * 132)
+    if any(r["cached"] for r in results):
+        print("* some responses came from the response cache: latencies cover the others only, no time per image")
+    output = f"TASKS[{task!r}]['output']" if choice["structured"] else "None"
+    print(f"Cheapest setting within tolerance: Preprocess(max_side={choice['max_side']}, crop={choice['crop']!r}, grayscale={choice['grayscale']}), PACK_SIZE = {choice['pack_size']}, OUTPUT = {output}")
+
+def parse_max_side(value):
+    return None if value.lower() in ("none", "0") else int(value)
+
+def parse_crop_option(value):
+    return None if value.lower() == "none" else value
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep image preprocessing settings for an OCR task.")
+    parser.add_argument("--task", type=str, choices=list(TASKS), required=True)
+    parser.add_argument("--model", type=str, default="gemini_2_0_flash", help="model ID (see external/client.py MODELS)")
+    parser.add_argument("--folder", type=str, default=None, help="image folder (default: the task's folder)")
+    parser.add_argument("--max-side", type=parse_max_side, nargs="+", default=[None, 1536, 1024, 768, 512], help="long side caps to try ('none' = full resolution)")
+    parser.add_argument("--crop", type=parse_crop_option, nargs="+", default=[None], help="crops to try: 'none', a preset (e.g. coil_id) or WxH+X+Y")
+    parser.add_argument("--grayscale", type=str, choices=["off", "on", "both"], default="both")
+    parser.add_argument("--pack-size", type=int, nargs="+", default=[1], help="images per request to try (1 = unpacked)")
+    parser.add_argument("--structured", type=str, choices=["off", "on", "both"], default="off", help="JSON schema output with the task's output-token cap")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N annotated images")
+    parser.add_argument("--cache", action="store_true", help="reuse cached responses (accuracy only; cached rows get no time per image)")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="accuracy drop allowed when picking the cheapest setting")
+    parser.add_argument("--output", type=str, default=None, help="report path (default: sweep_<task>_<model>.json)")
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.task)
+    image_files = get_annotated_images(args.folder or TASKS[args.task]["folder"], annotations, args.limit)
+    if not image_files:
+        print(f"No annotated images found for {args.task}")
+        return
+
+    options = {"off": [False], "on": [True], "both": [False, True]}
+    settings = [
+        (Preprocess(max_side, crop, grayscale), pack_size, structured)
+        for crop, grayscale, max_side, pack_size, structured in itertools.product(args.crop, options[args.grayscale], args.max_side, args.pack_size, options[args.structured])
+    ]
+
+    print(f"Sweeping {len(settings)} settings over {len(image_files)} images with {args.model}")
+    results = [
+        run_setting(args.task, args.model, preprocess, image_files, annotations, pack_size, structured, use_cache=args.cache)
+        for preprocess, pack_size, structured in settings
+    ]
+
+    choice = pick_cheapest(results, args.tolerance)
+    print_report(results, choice, args.task)
+
+    output_path = args.output or f"sweep_{args.task}_{args.model}.json"
+    with open(output_path, 'w') as f:
+        json.dump({"task": args.task, "model": args.model, "images": len(image_files), "choice": choice["setting"], "results": results}, f, indent=2)
+    print(f"Saved sweep report to {output_path}")
+
+if __name__ == "__main__":
+    main()
+
+# python ocr/inference/sweep.py --task coil_id --model gemini_2_0_flash --crop none coil_id --max-side none 1024 512 --limit 50
+# python ocr/inference/sweep.py --task number_plate_recognition --model gpt_4_1_mini --max-side 1024 --grayscale off --pack-size 1 2 4 8
+# python ocr/inference/sweep.py --task digital_meter_reading --model gemini_2_0_flash --max-side 1024 --grayscale off --structured both
@@ -0,0 +1,277 @@
+"""
+OCR use cases shared by the tools that run more than one of them (ocr/inference/engine.py,
+sweep.py and cascade.py).
+
+Each task holds the prompts, the structured output format (response schema and output-token cap,
+see external/output.py), the typed parser that turns a reply into the answer, a validator for
+the strict shape a parsed answer must have, where the images and annotations live, how an image
+maps to the id results and annotations use, and how per-model results are named. Parsers accept
+both structured (JSON) and free-text replies.
+
+A multi-field task reads several values off an image in one request (digital_meter_fields: the
+tonnage and the cycle of a meter) instead of a sweep per value. Its answer is a dict by field, its
+"fields" give each field's cleaner, validator and annotations file, and is_correct/answer_cer
+score it on the fields an image has annotations for; field_scores breaks that down per field.
+
+"frames" loads the dataset metadata ocr/grouping.py groups frames of one entity by, and consensus
+combines the answers of a group's representatives.
+"""
+
+import json
+import os
+import re
+import statistics
+
+from external.output import OutputFormat, parse_json
+from ocr.evaluation.main import calculate_cer
+from ocr.grouping import coil_id_frames, majority, meter_frames, number_plate_frames
+
+OCR_DIR = os.path.dirname(os.path.abspath(__file__))
+TONNAGE_RANGE = (0.0, 200.0)  # plausible readings of the weighbridge meters, in tonnes
+
+def clean_coil_id(coil_id_str):
+    """Clean and normalize a coil ID string"""
+    if not coil_id_str:
+        return ""
+
+    coil_id = coil_id_str.strip()
+
+    # Return empty string if no valid coil ID found
+    if coil_id.lower() in ['none', 'n/a', 'not found', 'no text', 'unclear']:
+        return ""
+
+    return coil_id
+
+def convert_tonnage_to_decimal(tonnage_str):
+    """Convert comma-separated tonnage to decimal format (xx,xxx -> xx.xx)"""
+    if not tonnage_str or tonnage_str.strip().lower() in ['none', 'n/a', 'not found']:
+        return ""
+
+    try:
+        # Remove any 't' suffix if present
+        clean_tonnage = tonnage_str.lower().replace('t', '').strip()
+
+        # Handle comma-separated format (e.g., "15,720" -> "15.72")
+        if ',' in clean_tonnage:
+            parts = clean_tonnage.split(',')
+            if len(parts) == 2:
+                clean_tonnage = f"{parts[0]}.{parts[1][:2]}"
+
+        # Convert to float to remove trailing zeros, then back to string
+        float_val = float(clean_tonnage)
+        if float_val == int(float_val):
+            return str(int(float_val))
+        return str(float_val).rstrip('0').rstrip('.')
+
+    except (ValueError, IndexError):
+        return tonnage_str.strip()  # Return original if conversion fails
+
+def extract_last_4_digits(plate_str):
+    """Validate and extract exactly the last 4 digits of a number plate, XXXX if unreadable"""
+    digits_only = ''.join(filter(str.isdigit, plate_str or ""))
+    if len(digits_only) >= 4:
+        return digits_only[-4:]
+    return "XXXX"
+
+def clean_cycle(cycle_str):
+    """Normalize a cycle count to its digits without leading zeros ("03" -> "3"), empty if there are none"""
+    digits = re.sub(r"\D", "", str(cycle_str or ""))
+    return str(int(digits)) if digits else ""
+
+def numeric_image_id(image_path):
+    """Images are saved as <id>.<ext>: the id as an int, the file name without extension if it isn't one"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return int(stem) if stem.isdigit() else stem
+
+def answer_field(text, name):
+    """A field of a structured (JSON object) reply, or the whole text of a free-text one"""
+    value = parse_json(text)
+    if isinstance(value, dict) and name in value:
+        return "" if value[name] is None else str(value[name])
+    return text or ""
+
+def parse_coil_id(text):
+    return clean_coil_id(answer_field(text, "coil_id"))
+
+def parse_tonnage(text):
+    return convert_tonnage_to_decimal(answer_field(text, "tonnage"))
+
+def parse_last_4_digits(text):
+    return extract_last_4_digits(answer_field(text, "last_4_digits"))
+
+def parse_fields(text, fields):
+    """Dict of cleaned field values from a JSON object reply, empty strings for the fields it lacks"""
+    value = parse_json(text)
+    value = value if isinstance(value, dict) else {}
+    return {name: field["clean"]("" if value.get(name) is None else str(value[name])) for name, field in fields.items()}
+
+def text_answer(name, description, max_output_tokens=32):
+    """OutputFormat for a single string answer: {"<name>": "..."}"""
+    return OutputFormat(
+        schema={
+            "type": "object",
+            "properties": {name: {"type": "string", "description": description}},
+            "required": [name],
+            "additionalProperties": False,
+        },
+        max_output_tokens=max_output_tokens,
+        name=name
+    )
+
+def fields_answer(descriptions, name, max_output_tokens=48):
+    """OutputFormat for several string answers in one object: {"<field>": "...", ...}"""
+    return OutputFormat(
+        schema={
+            "type": "object",
+            "properties": {field: {"type": "string", "description": description} for field, description in descriptions.items()},
+            "required": list(descriptions),
+            "additionalProperties": False,
+        },
+        max_output_tokens=max_output_tokens,
+        name=name
+    )
+
+def is_valid_coil_id(coil_id):
+    """Coil IDs are 10 digits"""
+    return re.fullmatch(r"\d{10}", coil_id or "") is not None
+
+def is_valid_tonnage(tonnage):
+    """A decimal tonnage with at most 2 decimals, inside TONNAGE_RANGE"""
+    if re.fullmatch(r"\d{1,3}(\.\d{1,2})?", tonnage or "") is None:
+        return False
+    return TONNAGE_RANGE[0] <= float(tonnage) <= TONNAGE_RANGE[1]
+
+def is_valid_cycle(cycle):
+    """A cycle count of 1 to 3 digits"""
+    return re.fullmatch(r"\d{1,3}", cycle or "") is not None
+
+def is_valid_last_4_digits(digits):
+    """Exactly 4 digits, XXXX (unreadable) is not valid"""
+    return re.fullmatch(r"\d{4}", digits or "") is not None
+
+METER_FIELDS = {
+    "tonnage": {
+        "clean": convert_tonnage_to_decimal,
+        "validate": is_valid_tonnage,
+        "annotations": os.path.join(OCR_DIR, "evaluation", "digital_meter_reading", "annotated_tonnage.json"),
+    },
+    "cycle": {
+        "clean": clean_cycle,
+        "validate": is_valid_cycle,
+        "annotations": os.path.join(OCR_DIR, "evaluation", "digital_meter_reading", "annotated_cycle.json"),
+    },
+}
+
+TASKS = {
+    "coil_id": {
+        "system_instruction": """You are a coil ID recognition assistant. Your ONLY task is to read and extract the coil ID text that is written on coils in images. You must ONLY return the exact text/numbers written on the coil and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Just the coil ID text as it appears on the coil.""",
+        "prompt": """Look at this image and find the coil ID text written on the coil. Extract ONLY the exact text/numbers that are written on the coil surface. Return ONLY that text with no other explanations, formatting, or additional words. If you cannot find any text written on the coil clearly, return an empty string.""",
+        "output": text_answer("coil_id", "The coil ID exactly as written on the coil, empty string if it can't be read"),
+        "parse": parse_coil_id,
+        "validate": is_valid_coil_id,
+        "folder": "/Users/hanoon/Documents/eval/ocr/data/coil_id/downloads",
+        "image_id": numeric_image_id,
+        "frames": coil_id_frames,
+        "annotations": os.path.join(OCR_DIR, "evaluation", "coil_id", "annotated.json"),
+        "output_suffix": "_coil_id",
+    },
+    "digital_meter_reading": {
+        "system_instruction": """You are a tonnage reading assistant. Your ONLY task is to extract tonnage values from digital meter images. You must ONLY return the tonnage number as a string float/int value without the 't' suffix and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Convert comma-separated values to decimal format (e.g., "15,720" becomes "15.72").""",
+        "prompt": """Look at this image and find the tonnage value. The tonnage is usually present as XXXXXXt (with 't' indicating tonnage) and is typically next to the text "Total". Extract ONLY the tonnage number without the 't' suffix and convert it to decimal format. For example, if you see "15,720t", return only "15.72" as a string. Remove trailing zeros after decimal point. Return only the string float/int value. If you cannot find a tonnage value clearly, return an empty string.""",
+        "output": text_answer("tonnage", "The tonnage in decimal format without the 't' suffix (15,720t -> 15.72), empty string if there is none"),
+        "parse": parse_tonnage,
+        "validate": is_valid_tonnage,
+        "folder": "/Users/hanoon/Documents/eval/ocr/data/digital_meter_readings/birla_copper/downloads",
+        "image_id": numeric_image_id,
+        "frames": meter_frames,
+        "annotations": os.path.join(OCR_DIR, "evaluation", "digital_meter_reading", "annotated_tonnage.json"),
+        "output_suffix": "_tonnage",
+    },
+    "digital_meter_fields": {
+        "system_instruction": """You are a digital meter reading assistant. Your ONLY task is to read the tonnage and the cycle values from digital meter images. You must ONLY return a JSON object with the two values as strings and nothing else - no explanations, no additional words, no styling, no markdown. Convert comma-separated tonnage values to decimal format (e.g., "15,720" becomes "15.72").""",
+        "prompt": """Look at this image and read two values from the meter. The tonnage is usually present as XXXXXXt (with 't' indicating tonnage) and is typically next to the text "Total": return it without the 't' suffix in decimal format, e.g. "15,720t" becomes "15.72", with trailing zeros after the decimal point removed. The cycle is the cycle count shown on the meter, a small whole number. Return ONLY a JSON object like {"tonnage": "15.72", "cycle": "3"}. Use an empty string for a value you cannot read clearly.""",
+        "output": fields_answer({
+            "tonnage": "The tonnage in decimal format without the 't' suffix (15,720t -> 15.72), empty string if there is none",
+            "cycle": "The cycle count shown on the meter, empty string if there is none",
+        }, "meter_fields"),
+        "parse": lambda text: parse_fields(text, METER_FIELDS),
+        "validate": lambda answer: all(field["validate"](answer.get(name)) for name, field in METER_FIELDS.items()),
+        "fields": METER_FIELDS,
+        "folder": "/Users/hanoon/Documents/eval/ocr/data/digital_meter_readings/birla_copper/downloads",
+        "image_id": numeric_image_id,
+        "frames": meter_frames,
+        "annotations": None,  # per field, see METER_FIELDS
+        "output_suffix": "_meter_fields",
+    },
+    "number_plate_recognition": {
+        "system_instruction": """You are a number plate recognition assistant. Your ONLY task is to extract the LAST 4 digits from number plates in images. You must ONLY return those 4 digits and nothing else - no explanations, no formatting, no additional words, no styling, no markdown. Just the last 4 digits of the number plate.""",
+        "prompt": """Look at this image and find the number plate. Extract ONLY the last 4 digits from the number plate. Return ONLY those 4 digits with no other text, explanations, or formatting. If you cannot find a number plate or cannot read the last 4 digits clearly, return "XXXX".""",
+        "output": text_answer("last_4_digits", "The last 4 digits of the number plate, XXXX if they can't be read"),
+        "parse": parse_last_4_digits,
+        "validate": is_valid_last_4_digits,
+        "folder": "/Users/hanoon/Documents/eval/ocr/data/number_plate_recognition/downloads",
+        "image_id": numeric_image_id,
+        "frames": number_plate_frames,
+        "annotations": os.path.join(OCR_DIR, "evaluation", "number_plate_recognition", "annotated.json"),
+        "output_suffix": "",
+    },
+}
+
+def answer_validator(task):
+    """Raw model text -> bool for the task, e.g. to decide whether a hedged or cascaded answer counts"""
+    spec = TASKS[task]
+    return lambda text: spec["validate"](spec["parse"](text))
+
+def consensus(task, answers):
+    """Majority answer of a group's representatives, voted field by field for a multi-field task"""
+    spec = TASKS[task]
+    if "fields" in spec:
+        return {name: majority([answer.get(name) for answer in answers], field["validate"]) for name, field in spec["fields"].items()}
+    return majority(answers, spec["validate"])
+
+def read_annotations(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    return {entry["id"]: entry["ocr_annotated"] for entry in data if entry.get("ocr_annotated")}
+
+def load_annotations(task):
+    """
+    Map image id -> annotated value, skipping images without an annotation. For a multi-field task
+    the value is a dict of the (cleaned) fields the image is annotated with
+    """
+    spec = TASKS[task]
+    if "fields" not in spec:
+        return read_annotations(spec["annotations"])
+
+    annotations = {}
+    for name, field in spec["fields"].items():
+        for image_id, value in read_annotations(field["annotations"]).items():
+            annotations.setdefault(image_id, {})[name] = field["clean"](value)
+    return annotations
+
+def is_correct(predicted, annotated):
+    """Exact match; a multi-field answer is correct when every field it is annotated with is"""
+    if isinstance(annotated, dict):
+        return all((predicted or {}).get(name) == value for name, value in annotated.items())
+    return predicted == annotated
+
+def answer_cer(annotated, predicted):
+    """CER of an answer; for a multi-field answer the mean over its annotated fields"""
+    if isinstance(annotated, dict):
+        return statistics.mean(calculate_cer(value, (predicted or {}).get(name) or "") for name, value in annotated.items())
+    return calculate_cer(annotated, predicted)
+
+def field_scores(task, pairs):
+    """Per-field valid rate, accuracy and CER of a multi-field task from (predicted, annotated or None) pairs"""
+    scores = {}
+    for name, field in TASKS[task]["fields"].items():
+        values = [(predicted.get(name), annotated.get(name) if annotated else None) for predicted, annotated in pairs]
+        evaluated = [(value, annotated) for value, annotated in values if annotated]
+        scores[name] = {
+            "valid_rate": sum(field["validate"](value) for value, _ in values) / len(values) if values else 0.0,
+            "evaluated": len(evaluated),
+            "accuracy": sum(value == annotated for value, annotated in evaluated) / len(evaluated) if evaluated else None,
+            "average_cer": statistics.mean(calculate_cer(annotated, value or "") for value, annotated in evaluated) if evaluated else None,
+        }
+    return scores
@@ -0,0 +1,52 @@
+"""
+Tests for ocr/grouping.py on the real birla_copper meter records: frames either side of a
+reading change must not share a group (and so a majority answer).
+
+    python -m pytest ocr/test_grouping.py
+"""
+
+import os
+import sys
+
+from PIL import Image
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from ocr.grouping import group_frames, meter_frames
+from ocr.tasks import numeric_image_id
+
+# Image ids (clean.json) of the capture events either side of a reading change in raw.json
+CYCLE_CHANGE = {1748500876: [65, 66, 67], 1748500881: [62, 63, 64]}    # cycle 2 -> 3, 5 s apart
+TONNAGE_CHANGE = {1748501111: [54, 55, 56], 1748501116: [51, 52, 53]}  # tonnage 15.44 -> 0.03 in raw.json
+
+def blank_images(folder, image_ids):
+    """Identical images, so only the metadata can keep the frames apart"""
+    paths = []
+    for image_id in image_ids:
+        path = os.path.join(folder, f"{image_id}.png")
+        Image.new("RGB", (64, 48), (40, 40, 40)).save(path)
+        paths.append(path)
+    return paths
+
+def groups_by_id(groups):
+    return [sorted(numeric_image_id(image_path) for image_path in group) for group in groups]
+
+def test_meter_frames_are_keyed_by_capture_event():
+    frames = meter_frames()
+    for events in (CYCLE_CHANGE, TONNAGE_CHANGE):
+        for timestamp, image_ids in events.items():
+            assert {frames[image_id]["entity"] for image_id in image_ids} == {f"loader-5@{timestamp}"}
+
+def test_meter_reading_change_is_not_merged(tmp_path):
+    for events in (CYCLE_CHANGE, TONNAGE_CHANGE):
+        image_files = blank_images(str(tmp_path), [image_id for image_ids in events.values() for image_id in image_ids])
+        groups = group_frames(image_files, numeric_image_id, meter_frames())
+        assert sorted(groups_by_id(groups)) == sorted(sorted(image_ids) for image_ids in events.values())
+
+def test_frames_without_entity_merge_by_time_and_hash(tmp_path):
+    # The same identical frames 5 s apart do merge where nothing forbids it (e.g. number plates)
+    frames = {62: {"entity": None, "source": "cam", "timestamp": 0.0}, 65: {"entity": None, "source": "cam", "timestamp": 5.0}}
+    image_files = blank_images(str(tmp_path), [62, 65])
+    assert groups_by_id(group_frames(image_files, numeric_image_id, frames)) == [[62, 65]]